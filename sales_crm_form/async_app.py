@@ -0,0 +1,492 @@
+"""ASGI entry point with async views for the busiest CRM endpoints.
+
+    uvicorn async_app:application --host 0.0.0.0 --port 5000
+
+GET /get_crm_entries, POST /submit_crm, GET /crm_stats and the
+GET /crm_entries/stream change feed run on the event loop against SQLAlchemy's
+asyncio engine over aiosqlite (asyncpg for PostgreSQL). A request waiting on
+the database (for a pooled connection, or for the write lock under contention) holds
+a coroutine rather than a worker thread, so one process keeps many more
+clients in flight. Every other route, and all CORS preflight requests, go to
+the Flask app on a pool of ASYNC_WSGI_THREADS threads.
+
+The views reuse the listing, insert and stats helpers from app.py, so both
+serving modes answer with the same bodies and share the caches of a process.
+"""
+import asyncio
+import io
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qsl
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+import app as crm_app
+import change_feed
+import compression
+import crm_stats
+import json_encoding
+import metrics
+import migrations
+import storage
+
+flask_app = crm_app.create_app()
+
+# Async DBAPI drivers by database backend
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+def async_database_url(url):
+    """Return the app's database URL with the async driver for its backend."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver configured for {url.get_backend_name()} databases")
+    return url.set(drivername=driver)
+
+def create_engine():
+    engine = create_async_engine(
+        async_database_url(flask_app.config['SQLALCHEMY_DATABASE_URI']),
+        pool_size=flask_app.config['ASYNC_DB_POOL_SIZE'],
+        max_overflow=0,
+        pool_timeout=30  # Waiting for a connection only parks the coroutine
+    )
+    storage.configure_engine(engine.sync_engine, flask_app.config['SQLITE_PRAGMAS'])
+    metrics.instrument_engine(engine.sync_engine)
+    if crm_app.slow_query_log is not None:
+        crm_app.slow_query_log.instrument_engine(engine.sync_engine)
+    return engine
+
+engine = create_engine()
+
+# SQLite has a single writer: queue writes here, where waiting is a parked coroutine, rather than
+# letting every pooled connection retry in SQLite's busy handler with growing sleeps
+write_lock = asyncio.Lock()
+wsgi_executor = ThreadPoolExecutor(max_workers=flask_app.config['ASYNC_WSGI_THREADS'], thread_name_prefix='wsgi')
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+class AsyncRequest:
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self._receive = receive
+
+    async def body(self):
+        return await read_body(self._receive)
+
+def response_headers(request, extra=()):
+    headers = [(b'content-type', b'application/json; charset=utf-8')]
+    origin = request.headers.get('origin')
+    if origin:
+        # Same headers flask-cors sends for the wildcard origin list with credentials
+        headers += [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin'),
+        ]
+    return headers + list(extra)
+
+async def send_response(send, request, status, body=b'', extra_headers=()):
+    if not isinstance(body, bytes):
+        body = json_encoding.dumps(body)
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers(request, extra_headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+# Authentication: the Flask session cookie, or a bearer token when AUTH_STATELESS_TOKENS is on
+
+def session_user_id(request):
+    """Return the Flask-Login user id from a valid session cookie, or None."""
+    try:
+        morsel = SimpleCookie(request.headers.get('cookie', '')).get(flask_app.config['SESSION_COOKIE_NAME'])
+    except CookieError:
+        return None
+    if morsel is None:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        session = serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return session.get('_user_id')
+
+async def load_username(user_id):
+    # The cache load_user fills, so invalidate_user_cache() logs users out of both serving modes
+    cached_user = crm_app.user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user.username
+
+    user = crm_app.User.__table__
+    async with engine.connect() as connection:
+        row = (await connection.execute(select(user).where(user.c.id == user_id))).mappings().first()
+    if row is None:
+        return None
+    # Not attached to any session, like the users load_user caches
+    crm_app.user_cache.set(user_id, crm_app.User(**row))
+    return row['username']
+
+async def authenticate(request):
+    """Return the username of the authenticated user, or None."""
+    user_id = session_user_id(request)
+    if user_id is None and flask_app.config['AUTH_STATELESS_TOKENS']:
+        payload = crm_app.decode_bearer_token(request.headers.get('authorization', ''))
+        if payload is not None:
+            if 'username' in payload:
+                return payload['username']
+            user_id = payload['sub']
+    if user_id is None:
+        return None
+    return await load_username(int(user_id))
+
+# Async views
+
+async def get_crm_entries(request, send, username):
+    try:
+        listing = crm_app.parse_listing_args(request.args)
+        since = crm_app.parse_since(request.args['since']) if 'since' in request.args else None
+    except crm_app.InvalidListingRequest as invalid:
+        return await send_response(send, request, 400, {
+            'error': invalid.error,
+            'details': str(invalid)
+        })
+
+    # Delta mode: only the entries changed after the cursor
+    if 'since' in request.args:
+        try:
+            async with engine.connect() as connection:
+                delta = await connection.run_sync(crm_app.entries_delta, since, listing)
+        except change_feed.CursorExpired as expired:
+            return await send_response(send, request, 410, crm_app.cursor_expired_body(expired))
+        if since is None:
+            # A stream is a coroutine here, so browsers always get the live feed
+            delta['stream'] = True
+        return await send_response(send, request, 200, delta, [(b'cache-control', b'no-store')])
+
+    # Same ETag and cache key as the Flask view
+    if engine.dialect.name in migrations.CHANGE_LOG_DIALECTS:
+        async with engine.connect() as connection:
+            version = await connection.run_sync(change_feed.current_seq)
+    else:
+        version = crm_app.crm_version.value
+    cache_key = ('get_crm_entries',) + tuple(listing) + (version,)
+    etag = crm_app.crm_version.etag(version, cache_key)
+    listing_headers = [(b'etag', f'"{etag}"'.encode('ascii')), (b'cache-control', b'private, no-cache')]
+    client_etag = compression.matching_etag(parse_etags(request.headers.get('if-none-match')), etag)
+    if client_etag:
+        crm_app.response_cache.record_not_modified()
+        return await send_response(send, request, 304, extra_headers=[
+            (b'etag', f'"{client_etag}"'.encode('ascii')), (b'cache-control', b'private, no-cache')])
+
+    body = crm_app.response_cache.get(cache_key)
+    if body is not None:
+        return await send_response(send, request, 200, body, listing_headers)
+
+    statement = crm_app.listing_statement(listing)
+    try:
+        if listing.limit is None:
+            return await stream_crm_entries(send, request, statement, listing.fields, cache_key, listing_headers)
+
+        async with engine.connect() as connection:
+            rows, total = await connection.run_sync(crm_app.read_listing_page, listing)
+    except SQLAlchemyError as e:
+        logging.error(f"Database error retrieving CRM entries: {str(e)}", exc_info=True)
+        return await send_response(send, request, 500, {
+            'error': 'Database error',
+            'details': str(e)
+        })
+
+    with metrics.timed(metrics.SERIALIZATION_DURATION, 'get_crm_entries'):
+        body = crm_app.listing_page_body(rows, listing, total)
+    crm_app.response_cache.set(cache_key, body)
+    await send_response(send, request, 200, body, listing_headers)
+
+async def stream_crm_entries(send, request, statement, fields, cache_key, listing_headers):
+    """Send the full listing as a JSON array, one batch per fetch, caching it if it stays small."""
+    async with engine.connect() as connection:
+        result = await connection.stream(statement)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers(request, listing_headers)})
+
+        parts = [b'[']
+        size = 1
+        first = True
+        serialization_time = 0.0
+        await send({'type': 'http.response.body', 'body': b'[', 'more_body': True})
+        async for rows in result.partitions(flask_app.config['CRM_STREAM_BATCH_SIZE']):
+            started = time.perf_counter()
+            data = (b'' if first else b',') + crm_app.encode_row_batch(rows, fields)
+            serialization_time += time.perf_counter() - started
+            first = False
+            if parts is not None:
+                size += len(data)
+                if size > crm_app.response_cache.max_entry_bytes:
+                    parts = None
+                else:
+                    parts.append(data)
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b']'})
+
+    metrics.SERIALIZATION_DURATION.observe(serialization_time, 'get_crm_entries')
+    if parts is not None:
+        crm_app.response_cache.set(cache_key, b''.join(parts) + b']')
+
+async def submit_crm(request, send, username):
+    raw_body = await request.body()
+    try:
+        data = json.loads(raw_body)
+    except ValueError as json_error:
+        logging.error(f"JSON parsing error: {str(json_error)}")
+        return await send_response(send, request, 400, {
+            'error': 'JSON Parsing Error',
+            'details': str(json_error),
+            'received_data': raw_body.decode('utf-8', 'replace')
+        })
+
+    try:
+        fields = crm_app.extract_crm_fields(data)
+    except ValueError as validation_error:
+        logging.error("Missing required fields")
+        return await send_response(send, request, 400, {
+            'error': 'Missing required fields',
+            'details': str(validation_error),
+            'received_data': data
+        })
+
+    # Insert the entry and its stats in one transaction, with the same helper as the Flask view
+    row = dict(fields, sale_person=username)
+    try:
+        async with write_lock, engine.begin() as connection:
+            entry_id = (await connection.run_sync(crm_app.insert_crm_rows, [row]))[0]
+    except SQLAlchemyError as db_error:
+        logging.error(f"Database error when adding CRM entry: {str(db_error)}")
+        return await send_response(send, request, 500, {
+            'error': 'Database error',
+            'details': str(db_error)
+        })
+    crm_app.crm_entries_changed([row])
+
+    logging.info(f"CRM entry added successfully for {fields['person_name']}")
+    await send_response(send, request, 201, {
+        'message': 'CRM entry added successfully',
+        'entry_id': entry_id
+    })
+
+async def get_crm_stats(request, send, username):
+    try:
+        async with engine.connect() as connection:
+            stats = await connection.run_sync(crm_stats.read)
+    except SQLAlchemyError as e:
+        logging.error(f"Database error reading CRM stats: {str(e)}", exc_info=True)
+        return await send_response(send, request, 500, {
+            'error': 'Database error',
+            'details': str(e)
+        })
+    await send_response(send, request, 200, stats)
+
+async def crm_entries_stream(request, send, username):
+    """Server-sent change events, as in the Flask view, holding a coroutine instead of a thread."""
+    try:
+        listing = crm_app.parse_listing_args(request.args)
+        since = crm_app.parse_since(request.headers.get('last-event-id') or request.args.get('since', 'latest'))
+    except crm_app.InvalidListingRequest as invalid:
+        return await send_response(send, request, 400, {
+            'error': invalid.error,
+            'details': str(invalid)
+        })
+    try:
+        async with engine.connect() as connection:
+            if since is None:
+                since = await connection.run_sync(change_feed.current_seq)
+            else:
+                await connection.run_sync(change_feed.check_cursor, since)
+    except change_feed.CursorExpired as expired:
+        return await send_response(send, request, 410, crm_app.cursor_expired_body(expired))
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    disconnected = asyncio.Event()
+
+    def notify():
+        loop.call_soon_threadsafe(wake.set)
+
+    async def watch_disconnect():
+        while (await request._receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+        wake.set()
+
+    poll = flask_app.config['CRM_CHANGE_STREAM_POLL']
+    heartbeat = flask_app.config['CRM_CHANGE_STREAM_HEARTBEAT']
+    deadline = loop.time() + flask_app.config['CRM_CHANGE_STREAM_MAX_SECONDS']
+    headers = [(b'content-type', b'text/event-stream')] + response_headers(request)[1:] + [
+        (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+
+    crm_app.change_notifier.subscribe(notify)
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        last_sent = loop.time()
+        while loop.time() < deadline and not disconnected.is_set():
+            async with engine.connect() as connection:
+                delta = await connection.run_sync(crm_app.entries_delta, since, listing)
+            since = int(delta['cursor'])
+            if delta['entries'] or delta['deleted']:
+                await send({'type': 'http.response.body', 'body': crm_app.sse_event(delta), 'more_body': True})
+                last_sent = loop.time()
+            if delta['has_more']:
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), poll)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            if loop.time() - last_sent >= heartbeat:
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                last_sent = loop.time()
+    except change_feed.CursorExpired as expired:
+        event = b'event: expired\ndata: ' + json_encoding.dumps(crm_app.cursor_expired_body(expired)) + b'\n\n'
+        await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+    finally:
+        crm_app.change_notifier.unsubscribe(notify)
+        watcher.cancel()
+    await send({'type': 'http.response.body', 'body': b''})
+
+# (method, path) -> (endpoint name, view); anything else is served by Flask
+ASYNC_VIEWS = {
+    ('GET', '/get_crm_entries'): ('get_crm_entries', get_crm_entries),
+    ('POST', '/get_crm_entries'): ('get_crm_entries', get_crm_entries),
+    ('POST', '/submit_crm'): ('submit_crm', submit_crm),
+    ('GET', '/crm_stats'): ('get_crm_stats', get_crm_stats),
+    ('GET', '/crm_entries/stream'): ('crm_entries_stream', crm_entries_stream),
+}
+
+# Flask routes: each request runs on a thread from wsgi_executor
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for an ASGI http scope and its complete request body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+async def call_flask(scope, receive, send):
+    environ = wsgi_environ(scope, await read_body(receive))
+    loop = asyncio.get_running_loop()
+
+    def send_from_thread(message):
+        # Waits until the event loop has sent the message, so streamed bodies get back-pressure
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        result = flask_app(environ, start_response)
+        try:
+            send_from_thread({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            for chunk in result:
+                if chunk:
+                    send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_from_thread({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    await loop.run_in_executor(wsgi_executor, run)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # The async views bypass Flask's before_request, so check the schema here
+            with flask_app.app_context():
+                crm_app.ensure_schema()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    view = ASYNC_VIEWS.get((scope['method'], scope['path'])) if scope['type'] == 'http' else None
+    if view is None:
+        return await call_flask(scope, receive, send)
+
+    endpoint, func = view
+    endpoint_token = metrics.ENDPOINT.set(endpoint)
+    started = time.perf_counter()
+    response = {'status': None}
+
+    async def tracked_send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        await send(message)
+
+    request = AsyncRequest(scope, receive)
+    if flask_app.config['RESPONSE_COMPRESSION']:
+        tracked_send = compression.asgi_send(
+            tracked_send,
+            request.headers.get('accept-encoding'),
+            flask_app.config['RESPONSE_COMPRESSION_LEVEL'],
+            flask_app.config['RESPONSE_COMPRESSION_MIN_BYTES']
+        )
+    try:
+        username = await authenticate(request)
+        if username is None:
+            await send_response(tracked_send, request, 401, {
+                'error': 'Unauthorized',
+                'details': 'Authentication required'
+            })
+        else:
+            await func(request, tracked_send, username)
+    except Exception as e:
+        logging.error(f"Unexpected error in async {endpoint}: {str(e)}", exc_info=True)
+        if response['status'] is None:
+            await send_response(tracked_send, request, 500, {
+                'error': 'Unexpected error',
+                'details': str(e)
+            })
+    finally:
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, endpoint, request.method, str(response['status']))
+        metrics.ENDPOINT.reset(endpoint_token)
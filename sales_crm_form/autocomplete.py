@@ -0,0 +1,417 @@
+"""In-memory typeahead index for company and contact names.
+
+Names are folded to a match key (no accents, case or punctuation, single
+spaces), so "ACME  Ltd." and "Acme Ltd" are one name, suggested in its most
+frequent spelling. Per field, the keys are kept sorted in one bytes buffer
+with an offset array, next to the display names and entry counts: about 45
+bytes per name instead of the ~150 of separate Python objects, and a prefix
+is two binary searches away. Names first seen after the last build go to a
+small sorted overlay.
+
+Suggestions are names starting with the query, most entries first, then
+names one edit away from it (a character replaced, inserted, dropped or
+swapped with its neighbour; the first character must match). Prefixes
+matching many names keep a cached top list, so a one-letter query is as
+cheap as a long one.
+
+The index is built on a background thread from GROUP BY counts on first use
+and updated in place by this process's inserts. It is rebuilt after deletes,
+and every refresh_seconds so that names added by other workers show up;
+counts only order the suggestions and may be a little off in between.
+"""
+import bisect
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from sqlalchemy import func, select
+
+MAX_COUNT = 2 ** 32 - 1
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+def match_key(name, partial=False):
+    """Fold a name to the bytes it is matched by.
+
+    With partial (a query being typed) a trailing separator is kept as one
+    space, so "acme " only matches names with a word after "acme".
+    """
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    folded = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    folded = _SEPARATORS.sub(' ', folded).lstrip()
+    return (folded if partial else folded.rstrip()).encode('utf-8')
+
+class NameTable:
+    """Names sorted by match key, packed into flat buffers; only counts change after building."""
+
+    def __init__(self, names):
+        # names: (key, display, count) tuples sorted by unique key
+        keys = bytearray()
+        displays = bytearray()
+        self.key_offsets = array('I', [0])
+        self.display_offsets = array('I', [0])
+        self.counts = array('I')
+        for key, display, count in names:
+            keys += key
+            self.key_offsets.append(len(keys))
+            displays += display.encode('utf-8')
+            self.display_offsets.append(len(displays))
+            self.counts.append(min(count, MAX_COUNT))
+        self.keys = bytes(keys)
+        self.displays = bytes(displays)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def key(self, position):
+        return self.keys[self.key_offsets[position]:self.key_offsets[position + 1]]
+
+    def display(self, position):
+        return self.displays[self.display_offsets[position]:self.display_offsets[position + 1]].decode('utf-8')
+
+    def find(self, key):
+        """Position of key, or None."""
+        position = self.prefix_range(key)[0]
+        return position if position < len(self) and self.key(position) == key else None
+
+    def prefix_range(self, prefix, low=0, high=None):
+        """(start, end) positions of the keys starting with prefix, searched within [low, high)."""
+        keys, offsets, length = self.keys, self.key_offsets, len(prefix)
+        end = high = len(self.counts) if high is None else high
+        # First key >= prefix
+        while low < high:
+            middle = (low + high) // 2
+            if keys[offsets[middle]:offsets[middle + 1]] < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        start, high = low, end
+        # First key from there on that does not start with prefix
+        while low < high:
+            middle = (low + high) // 2
+            begin = offsets[middle]
+            if keys[begin:min(begin + length, offsets[middle + 1])] == prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return start, low
+
+    def top(self, start, end, limit):
+        """Positions of the limit most frequent names in [start, end), ties in key order."""
+        return heapq.nlargest(limit, range(start, end), key=self.counts.__getitem__)
+
+    def memory_bytes(self):
+        return (len(self.keys) + len(self.displays) + self.counts.itemsize * len(self.counts)
+                + self.key_offsets.itemsize * (len(self.key_offsets) + len(self.display_offsets)))
+
+class NameIndex:
+    """Suggestions for one field: a NameTable, an overlay of new names and cached top lists.
+
+    Not thread-safe; AutocompleteIndex serializes access.
+    """
+
+    def __init__(self, table, max_names, max_pending=10000, max_limit=20, scan_limit=2000, max_cached_prefixes=4096):
+        self.table = table
+        self.max_names = max_names
+        self.max_pending = max_pending
+        self.max_limit = max_limit
+        self.scan_limit = scan_limit
+        self.max_cached_prefixes = max_cached_prefixes
+        self.pending = {}  # key -> [display, count]
+        self.pending_keys = []
+        self.top_cache = {}
+
+    @classmethod
+    def from_counts(cls, name_counts, max_names, **options):
+        """Build from (name, entry count) pairs, keeping the max_names most frequent keys."""
+        folded = {}
+        for name, count in name_counts:
+            key = match_key(name)
+            if not key:
+                continue
+            current = folded.get(key)
+            if current is None:
+                folded[key] = [name.strip(), count, count]
+            else:
+                current[2] += count
+                if count > current[1]:
+                    # The most frequent spelling is the one suggested
+                    current[0], current[1] = name.strip(), count
+        if len(folded) > max_names:
+            kept = heapq.nlargest(max_names, folded.items(), key=lambda item: item[1][2])
+        else:
+            kept = folded.items()
+        table = NameTable((key, display, total) for key, (display, _, total) in sorted(kept))
+        return cls(table, max_names, **options)
+
+    def __len__(self):
+        return len(self.table) + len(self.pending)
+
+    def add(self, name):
+        """Count one more entry with this name; returns False if the overlay is full."""
+        key = match_key(name)
+        if not key:
+            return True
+        position = self.table.find(key)
+        if position is not None:
+            if self.table.counts[position] < MAX_COUNT:
+                self.table.counts[position] += 1
+                self._promote(position, key)
+        elif key in self.pending:
+            self.pending[key][1] += 1
+        elif len(self) < self.max_names:
+            self.pending[key] = [name.strip(), 1]
+            bisect.insort(self.pending_keys, key)
+        return len(self.pending) < self.max_pending
+
+    def _promote(self, position, key):
+        """Keep cached top lists current after the count at position grew."""
+        counts = self.table.counts
+        for length in range(1, len(key) + 1):
+            top = self.top_cache.get(key[:length])
+            if top is None:
+                continue
+            if position not in top:
+                if len(top) >= self.max_limit and counts[position] <= counts[top[-1]]:
+                    continue
+                top.append(position)
+            top.sort(key=lambda other: (-counts[other], other))
+            del top[self.max_limit:]
+
+    def warm_top_cache(self, depth=2):
+        """Compute the top lists of prefixes up to depth bytes, the ones matching most names."""
+        prefixes = [b'']
+        for _ in range(depth):
+            prefixes = [prefix + bytes((byte,)) for prefix in prefixes for byte in self.next_bytes(prefix)]
+            for prefix in prefixes:
+                self._table_top(prefix, self.max_limit)
+
+    def _table_top(self, prefix, limit, low=0, high=None):
+        start, end = self.table.prefix_range(prefix, low, high)
+        if end - start <= self.scan_limit:
+            return self.table.top(start, end, limit)
+        top = self.top_cache.get(prefix)
+        if top is None:
+            if len(self.top_cache) >= self.max_cached_prefixes:
+                self.top_cache.clear()
+            top = self.top_cache[prefix] = self.table.top(start, end, self.max_limit)
+        return top[:limit]
+
+    def prefix_matches(self, prefix, limit, low=0, high=None):
+        """Up to limit (count, key, display) tuples for names starting with prefix, most frequent first.
+
+        low and high narrow the search of the packed table to a known range.
+        """
+        table = self.table
+        matches = [(table.counts[position], table.key(position), position)
+                   for position in self._table_top(prefix, limit, low, high)]
+        start = bisect.bisect_left(self.pending_keys, prefix)
+        for key in self.pending_keys[start:]:
+            if not key.startswith(prefix):
+                break
+            matches.append((self.pending[key][1], key, None))
+        top = heapq.nlargest(limit, matches, key=lambda match: match[0])
+        return [(count, key, table.display(position) if position is not None else self.pending[key][0])
+                for count, key, position in top]
+
+    def next_bytes(self, prefix):
+        """{byte: (start, end)} for the bytes that follow prefix in some name.
+
+        (start, end) is the table range of prefix + byte, empty for a byte
+        only found in the overlay.
+        """
+        table, length = self.table, len(prefix)
+        following = {}
+        start, end = table.prefix_range(prefix)
+        while start < end:
+            key = table.key(start)
+            if len(key) == length:
+                start += 1
+                continue
+            # Skip every key continuing with the same byte
+            next_start = table.prefix_range(key[:length + 1], start, end)[1]
+            following[key[length]] = (start, next_start)
+            start = next_start
+        position = bisect.bisect_left(self.pending_keys, prefix)
+        for key in self.pending_keys[position:]:
+            if not key.startswith(prefix):
+                break
+            if len(key) > length:
+                following.setdefault(key[length], (0, 0))
+        return following
+
+    def fuzzy_prefixes(self, query):
+        """{prefix: (low, high)} for prefixes one edit away from query; the first byte is kept.
+
+        (low, high) bounds where the prefix can be in the table, (0, None) if unknown.
+        """
+        candidates = {}
+        for index in range(1, len(query)):
+            head, rest = query[:index], query[index + 1:]
+            candidates.setdefault(head + rest, (0, None))  # deletion
+            if index + 1 < len(query):
+                candidates.setdefault(head + query[index + 1:index + 2] + query[index:index + 1] + query[index + 2:], (0, None))  # swap
+            for byte, bounds in self.next_bytes(head).items():
+                replacement = bytes((byte,))
+                if bounds[0] == bounds[1]:
+                    bounds = (0, None)  # Only in the overlay
+                candidates.setdefault(head + replacement + rest, bounds)  # substitution
+                candidates.setdefault(head + replacement + query[index:], bounds)  # insertion
+        candidates.pop(query, None)
+        return candidates
+
+    def suggest(self, query, limit, fuzzy_min_length=3):
+        """Ranked [(display, count, match)] for a partial name: prefix matches, then fuzzy ones."""
+        key = match_key(query, partial=True)
+        if not key:
+            return []
+        suggestions = [(display, count, 'prefix') for count, _, display in self.prefix_matches(key, limit)]
+        if len(suggestions) >= limit or len(key) < fuzzy_min_length:
+            return suggestions
+
+        seen = {match_key(display) for display, _, _ in suggestions}
+        fuzzy = {}
+        for candidate, (low, high) in self.fuzzy_prefixes(key).items():
+            for count, match, display in self.prefix_matches(candidate, limit, low, high):
+                if match not in seen:
+                    fuzzy[match] = (count, display)
+        for match, (count, display) in heapq.nlargest(limit - len(suggestions), fuzzy.items(),
+                                                      key=lambda item: item[1][0]):
+            suggestions.append((display, count, 'fuzzy'))
+        return suggestions
+
+    def memory_bytes(self):
+        # The overlay and cached lists hold Python objects; count them at a typical size
+        return (self.table.memory_bytes() + 150 * len(self.pending)
+                + sum(8 * len(top) + 100 for top in self.top_cache.values()))
+
+class AutocompleteIndex:
+    """Thread-safe name suggestions for several crm_entry columns, built in the background."""
+
+    def __init__(self, engine, table, fields=('company_name', 'person_name'), max_names=1000000,
+                 refresh_seconds=300, max_limit=20):
+        self.engine = engine
+        self.table = table
+        self.fields = fields
+        self.max_names = max_names
+        self.refresh_seconds = refresh_seconds
+        self.max_limit = max_limit
+        self.names = None
+        self.built_at = None
+        self.builds = 0
+        self.last_build_seconds = None
+        self._stale = False
+        self._added_during_build = None
+        self._building = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # A build thread does not survive a fork; let the child start its own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._building = False
+        self._added_during_build = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def build(self):
+        """Load the name counts of every field into new NameIndexes and swap them in."""
+        started = time.perf_counter()
+        with self._lock:
+            self._stale = False
+            self._added_during_build = []
+        names = {}
+        with self.engine.connect() as connection:
+            for field in self.fields:
+                column = self.table.c[field]
+                statement = select(column, func.count()).where(column.is_not(None)).group_by(column)
+                result = connection.execution_options(yield_per=10000).execute(statement)
+                names[field] = NameIndex.from_counts(result, self.max_names, max_limit=self.max_limit)
+                # Here rather than on the first one- and two-letter queries
+                names[field].warm_top_cache()
+        with self._lock:
+            # Inserts made while loading may be counted twice; counts only rank suggestions
+            for row in self._added_during_build:
+                self._add_row(names, row)
+            self._added_during_build = None
+            self.names = names
+            self.built_at = time.monotonic()
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - started
+        logging.info(f"Autocomplete index built: {', '.join(f'{field} {len(index)}' for field, index in names.items())} "
+                     f"names, {self.memory_bytes()} bytes in {self.last_build_seconds:.2f}s")
+
+    def _run_build(self):
+        try:
+            self.build()
+        except Exception as e:
+            with self._lock:
+                self._added_during_build = None
+            logging.error(f"Building the autocomplete index failed: {str(e)}", exc_info=True)
+        finally:
+            self._building = False
+
+    def start_build(self):
+        """Rebuild on a background thread unless a build is already running."""
+        with self._build_lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._run_build, name='crm-autocomplete', daemon=True).start()
+
+    def _add_row(self, names, row):
+        full = False
+        for field, index in names.items():
+            if row.get(field):
+                full = not index.add(row[field]) or full
+        return full
+
+    def entries_changed(self, rows=None):
+        """Count the names of inserted rows; rows=None (deletes, updates) schedules a rebuild."""
+        with self._lock:
+            if self._added_during_build is not None and rows is not None:
+                self._added_during_build.extend(rows)
+            if self.names is None:
+                return
+            if rows is None:
+                self._stale = True
+                return
+            for row in rows:
+                if self._add_row(self.names, row):
+                    # The overlay is full; fold it into the packed table
+                    self._stale = True
+
+    def suggest(self, field, query, limit, fuzzy_min_length=3):
+        """[(display, count, match)] for query, or None while the first build runs."""
+        with self._lock:
+            names = self.names
+            if names is not None:
+                suggestions = names[field].suggest(query, min(limit, self.max_limit), fuzzy_min_length)
+            refresh = names is None or self._stale or time.monotonic() - self.built_at > self.refresh_seconds
+        if refresh:
+            # Keep answering from this generation while the next one loads
+            self.start_build()
+        return None if names is None else suggestions
+
+    def memory_bytes(self):
+        names = self.names
+        return sum(index.memory_bytes() for index in names.values()) if names else 0
+
+    def stats(self):
+        with self._lock:
+            names = self.names
+            if names is None:
+                return {'ready': False, 'building': self._building}
+            return {
+                'ready': True,
+                'building': self._building,
+                'names': {field: len(index) for field, index in names.items()},
+                'pending_names': {field: len(index.pending) for field, index in names.items()},
+                'memory_bytes': self.memory_bytes(),
+                'builds': self.builds,
+                'last_build_seconds': round(self.last_build_seconds, 3),
+            }
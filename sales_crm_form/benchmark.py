@@ -0,0 +1,1213 @@
+"""Reproducible load tests for the CRM API.
+
+Generate a synthetic dataset into a scratch SQLite file, drive the endpoints
+concurrently through the Flask test client, a local gunicorn or uvicorn, and report
+throughput and latency percentiles per route as JSON:
+
+    python benchmark.py generate --db /tmp/crm_bench.db --rows 1000000
+    python benchmark.py run --db /tmp/crm_bench.db --mode gunicorn --output results.json
+    python benchmark.py compare results.json baseline.json
+    python benchmark.py read-path --db /tmp/crm_bench.db --rows 100000
+    python benchmark.py startup --db /tmp/crm_bench.db --output startup.json --baseline startup_baseline.json
+    python benchmark.py capacity --db /tmp/crm_bench.db --modes gunicorn,asgi --p99-ms 250
+    python benchmark.py login-overload --db /tmp/crm_bench.db --caps 0,2
+    python benchmark.py user-cache --db /tmp/crm_bench.db
+    python benchmark.py write-path --db /tmp/crm_bench.db --writers 8 --readers 8
+    python benchmark.py compression --db /tmp/crm_bench.db --levels 1,6,9
+    python benchmark.py snapshot-index --db /tmp/crm_bench.db
+    python benchmark.py scaling --db /tmp/crm_bench.db --workers 1,2,4
+    python benchmark.py autocomplete --names 1000000
+    python benchmark.py user-import --users 200 --workers 1,4
+
+Each scenario runs as its own phase (concurrency clients for duration
+seconds), so numbers are not skewed by the other routes.
+"""
+import argparse
+import base64
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = 'benchmark'
+STATUSES = ('open', 'in progress', 'won', 'lost', 'on hold')
+DEPARTMENTS = ('Sales', 'IT', 'Finance', 'Operations', 'Marketing', 'HR')
+WORDS = (
+    'renewal pricing contract demo proposal budget procurement meeting follow call email quote '
+    'discount license upgrade integration pilot rollout training support onboarding migration '
+    'security review legal approval signature invoice payment forecast pipeline champion sponsor '
+    'stakeholder requirement timeline deadline competitor evaluation feedback workshop presentation'
+).split()
+FIRST_NAMES = ('Anna', 'Ben', 'Clara', 'David', 'Eva', 'Felix', 'Greta', 'Hugo', 'Ida', 'Jonas', 'Kira', 'Leon')
+LAST_NAMES = ('Meyer', 'Schmidt', 'Novak', 'Ivanova', 'Rossi', 'Garcia', 'Smith', 'Berg', 'Kowalski', 'Dubois')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Dataset generation
+
+def database_url(path):
+    return 'sqlite:///' + os.path.abspath(path)
+
+def redact_password(url):
+    """The database URL without its password, for the results document."""
+    parts = urllib.parse.urlsplit(url)
+    if not parts.password:
+        return url
+    return parts._replace(netloc=parts.netloc.replace(':' + parts.password + '@', ':***@')).geturl()
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def generate(db_path, rows, users, seed=42, batch_size=50000, bcrypt_rounds=12):
+    """Create a scratch database with users rep0..repN and rows synthetic CRM entries."""
+    import bcrypt
+
+    if os.path.exists(db_path):
+        raise SystemExit(f"{db_path} already exists; remove it or pick another path")
+
+    # Let the app create the schema through its migrations
+    os.environ['DATABASE_URL'] = database_url(db_path)
+    os.environ['LOG_FILE'] = db_path + '.log'
+    os.environ.setdefault('LOG_CONSOLE', '0')
+    sys.path.insert(0, HERE)
+    import app as crm_app
+    import crm_stats
+
+    crm_app.create_app()
+    with crm_app.app.app_context():
+        crm_app.ensure_schema()
+
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds)).decode('utf-8')
+    companies = [f"{rng.choice(WORDS).title()} {rng.choice(('GmbH', 'AG', 'Ltd', 'Inc', 'SA'))} {i}" for i in range(max(rows // 200, 10))]
+
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.executemany(
+        'INSERT INTO "user" (username, email, password) VALUES (?, ?, ?)',
+        [(f"rep{i}", f"rep{i}@example.com", password_hash) for i in range(users)]
+    )
+
+    start = datetime(2020, 1, 1)
+    span_seconds = 5 * 365 * 24 * 3600
+    started = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for _ in range(min(batch_size, rows - offset)):
+            submission_time = start + timedelta(seconds=rng.randrange(span_seconds), microseconds=rng.randrange(10 ** 6))
+            batch.append((
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                rng.choice(companies),
+                rng.choice(DEPARTMENTS),
+                sentence(rng, 2, 5),
+                sentence(rng, 5, 20),
+                rng.choice(STATUSES),
+                sentence(rng, 20, 60),
+                f"rep{rng.randrange(users)}",
+                submission_time.strftime('%Y-%m-%d %H:%M:%S.%f'),
+            ))
+        connection.executemany(
+            'INSERT INTO crm_entry (person_name, company_name, department, "case", next_steps, status, '
+            'description, sale_person, submission_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            batch
+        )
+        connection.commit()
+        print(f"  {offset + len(batch)}/{rows} entries ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+    connection.close()
+
+    with crm_app.app.app_context(), crm_app.db.engine.begin() as engine_connection:
+        crm_stats.recompute(engine_connection)
+    print(f"Generated {rows} entries and {users} users in {db_path}", file=sys.stderr)
+
+# HTTP clients with a common interface: request() -> (status, body)
+
+class TestClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, json_body=None, data=None, headers=None):
+        response = self.client.open(path, method=method, json=json_body, data=data, headers=headers or {})
+        return response.status_code, response.get_data()
+
+class HTTPClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, json_body=None, data=None, headers=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif isinstance(data, str):
+            data = data.encode('utf-8')
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+# Scenarios: each performs one request and returns the status code
+
+SCENARIOS = {}
+DEFAULT_SCENARIOS = ('login', 'submit_crm', 'get_crm_entries', 'get_crm_entries_filtered',
+                     'get_crm_entries_cursor', 'search_crm', 'crm_stats')
+# Listing columns without the large description/next_steps text
+TABLE_VIEW_FIELDS = 'id,person_name,company_name,department,case,status,sale_person,submission_time'
+
+def scenario(name):
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+def random_cursor(rng):
+    moment = datetime(2020, 1, 1) + timedelta(seconds=rng.randrange(5 * 365 * 24 * 3600))
+    raw = json.dumps([moment.isoformat(), 2 ** 62]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+@scenario('login')
+def login_scenario(client, worker):
+    return client.request('POST', '/login', json_body={'username': worker.username, 'password': BENCH_PASSWORD})[0]
+
+@scenario('submit_crm')
+def submit_crm_scenario(client, worker):
+    return client.request('POST', '/submit_crm', json_body={
+        'name': f"{worker.rng.choice(FIRST_NAMES)} {worker.rng.choice(LAST_NAMES)}",
+        'company': f"{worker.rng.choice(WORDS).title()} Ltd",
+        'status': worker.rng.choice(STATUSES),
+        'notes': sentence(worker.rng, 20, 60),
+    })[0]
+
+@scenario('get_crm_entries')
+def get_crm_entries_scenario(client, worker):
+    return client.request('GET', '/get_crm_entries?limit=50')[0]
+
+@scenario('get_crm_entries_filtered')
+def get_crm_entries_filtered_scenario(client, worker):
+    status = urllib.request.quote(worker.rng.choice(STATUSES))
+    return client.request('GET', f"/get_crm_entries?limit=50&sale_person=rep{worker.rng.randrange(worker.users)}&status={status}")[0]
+
+@scenario('get_crm_entries_cursor')
+def get_crm_entries_cursor_scenario(client, worker):
+    # A random cursor defeats the response cache, so every request reaches the database
+    return client.request('GET', f"/get_crm_entries?limit=50&after={random_cursor(worker.rng)}")[0]
+
+@scenario('get_crm_entries_projected')
+def get_crm_entries_projected_scenario(client, worker):
+    return client.request('GET', f"/get_crm_entries?limit=500&fields={TABLE_VIEW_FIELDS}&after={random_cursor(worker.rng)}")[0]
+
+@scenario('search_crm')
+def search_crm_scenario(client, worker):
+    return client.request('GET', f"/search_crm?q={worker.rng.choice(WORDS)}+{worker.rng.choice(WORDS)}&limit=20")[0]
+
+@scenario('crm_stats')
+def crm_stats_scenario(client, worker):
+    return client.request('GET', '/crm_stats')[0]
+
+# Load generation
+
+class Worker:
+    def __init__(self, index, users, seed):
+        self.index = index
+        self.users = users
+        self.username = f"rep{index % users}"
+        self.rng = random.Random(seed * 1000 + index)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies, errors, elapsed, rejected=()):
+    latencies.sort()
+    rejected = sorted(rejected)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        # 503s, counted in errors too: how fast an overloaded server sheds a request
+        'rejected': len(rejected),
+        'rejected_p99_ms': round(percentile(rejected, 0.99) * 1000, 3) if rejected else None,
+    }
+
+def run_mixed(groups, duration, warmup):
+    """Run several scenarios at the same time, each on its own clients, and summarize each.
+
+    groups maps a scenario name to its (clients, workers).
+    """
+    loops = [(name, client, worker) for name, (clients, workers) in groups.items()
+             for client, worker in zip(clients, workers)]
+    latencies = [[] for _ in loops]
+    rejected = [[] for _ in loops]
+    errors = [0] * len(loops)
+    barrier = threading.Barrier(len(loops) + 1)
+    bounds = {}
+
+    def loop(i):
+        name, client, worker = loops[i]
+        func = SCENARIOS[name]
+        barrier.wait()
+        warm_until = bounds['start'] + warmup
+        while True:
+            started = time.perf_counter()
+            if started >= bounds['end']:
+                break
+            status = func(client, worker)
+            finished = time.perf_counter()
+            if started < warm_until:
+                continue
+            if status >= 400:
+                errors[i] += 1
+                if status == 503:
+                    rejected[i].append(finished - started)
+            else:
+                latencies[i].append(finished - started)
+
+    threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(len(loops))]
+    for thread in threads:
+        thread.start()
+    bounds['start'] = time.perf_counter()
+    bounds['end'] = bounds['start'] + warmup + duration
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    return {name: summarize([value for i, values in enumerate(latencies) if loops[i][0] == name for value in values],
+                            sum(count for i, count in enumerate(errors) if loops[i][0] == name),
+                            duration,
+                            [value for i, values in enumerate(rejected) if loops[i][0] == name for value in values])
+            for name in groups}
+
+def run_phase(name, clients, workers, duration, warmup):
+    """Run one scenario on all clients in parallel and summarize it."""
+    return run_mixed({name: (clients, workers)}, duration, warmup)[name]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(mode, env, workers, threads):
+    """Start gunicorn (threaded Flask) or uvicorn (async_app) on a free port."""
+    port = free_port()
+    if mode == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--no-access-log',
+                   '--port', str(port), 'async_app:application']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+                   '-b', f"127.0.0.1:{port}", 'app:create_app()']
+    process = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).read()
+            return process, base_url
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            if process.poll() is not None:
+                raise SystemExit(f"{command[2]} exited during startup")
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{command[2]} did not start within 60 seconds")
+
+def count_rows(db_path, table):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    finally:
+        connection.close()
+
+def login_all(clients, workers):
+    """Give every client its own session before measuring."""
+    for client, worker in zip(clients, workers):
+        status, body = client.request('POST', '/login', json_body={'username': worker.username, 'password': BENCH_PASSWORD})
+        if status != 200:
+            raise SystemExit(f"Login as {worker.username} failed with {status}: {body[:200]!r}")
+
+def run(args):
+    """Run the selected scenarios and return the results document."""
+    # Logs go next to the scratch database, never into the app directory
+    env = dict(os.environ, DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0')
+    users = count_rows(args.db, 'user')
+    workers = [Worker(i, users, args.seed) for i in range(args.concurrency)]
+    process = None
+
+    if args.mode in ('gunicorn', 'asgi'):
+        process, base_url = start_server(args.mode, env, args.workers, args.threads)
+        clients = [HTTPClient(base_url) for _ in workers]
+    else:
+        os.environ.update(env)
+        sys.path.insert(0, HERE)
+        import app as crm_app
+        clients = [TestClient(crm_app.create_app()) for _ in workers]
+
+    try:
+        login_all(clients, workers)
+        routes = {}
+        for name in args.scenarios:
+            print(f"  running {name} ...", file=sys.stderr)
+            routes[name] = run_phase(name, clients, workers, args.duration, args.warmup)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'server_workers': args.workers if args.mode != 'testclient' else None,
+            'gunicorn_threads': args.threads if args.mode == 'gunicorn' else None,
+            'entries': count_rows(args.db, 'crm_entry'),
+            'users': users,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'cpu_count': os.cpu_count(),
+        },
+        'routes': routes,
+    }
+
+# Runs in a fresh interpreter and prints the phase timings of one cold start as JSON
+STARTUP_PROBE = '''
+import json, time
+started = time.perf_counter()
+import app as crm_app
+imported = time.perf_counter()
+flask_app = crm_app.create_app()
+created = time.perf_counter()
+status = flask_app.test_client().get('/login').status_code
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (finished - created) * 1000,
+    'status': status,
+}))
+'''
+
+def timing_summary(values):
+    values = sorted(values)
+    return {
+        'median_ms': round(values[len(values) // 2], 2),
+        'min_ms': round(values[0], 2),
+        'max_ms': round(values[-1], 2),
+    }
+
+def startup(args):
+    """Measure cold starts: module import, create_app(), the first request and a gunicorn boot."""
+    env = dict(os.environ, DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0')
+    samples = {'process_ms': [], 'import_ms': [], 'create_app_ms': [], 'first_request_ms': [], 'gunicorn_ready_ms': []}
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=HERE, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        samples['process_ms'].append((time.perf_counter() - started) * 1000)
+        probe = json.loads(output.strip().splitlines()[-1])
+        if probe['status'] != 200:
+            raise SystemExit(f"First request failed with {probe['status']}")
+        for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+            samples[key].append(probe[key])
+
+        started = time.perf_counter()
+        process, _ = start_server('gunicorn', env, 1, 1)
+        samples['gunicorn_ready_ms'].append((time.perf_counter() - started) * 1000)
+        process.terminate()
+        process.wait()
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'startup': {key: timing_summary(values) for key, values in samples.items()},
+    }
+
+def capacity(args):
+    """Step up the number of concurrent clients per serving mode and report the most held within the p99 budget."""
+    env = dict(os.environ, DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0')
+    users = count_rows(args.db, 'user')
+    levels = sorted(args.levels)
+    workers = [Worker(i, users, args.seed) for i in range(levels[-1])]
+    modes = {}
+
+    for mode in args.modes:
+        process, base_url = start_server(mode, env, args.workers, args.threads)
+        try:
+            clients = [HTTPClient(base_url) for _ in workers]
+            login_all(clients, workers)
+            results = {}
+            for level in levels:
+                print(f"  {mode}: {level} clients ...", file=sys.stderr)
+                results[level] = {name: run_phase(name, clients[:level], workers[:level], args.duration, args.warmup)
+                                  for name in args.scenarios}
+        finally:
+            process.terminate()
+            process.wait()
+
+        held = [level for level, routes in results.items()
+                if all(route['errors'] == 0 and route['p99_ms'] is not None and route['p99_ms'] <= args.p99_ms
+                       for route in routes.values())]
+        modes[mode] = {'max_clients_within_p99': max(held, default=0), 'levels': results}
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'p99_budget_ms': args.p99_ms,
+            'scenarios': args.scenarios,
+            'server_workers': args.workers,
+            'gunicorn_threads': args.threads,
+            'entries': count_rows(args.db, 'crm_entry'),
+            'cpu_count': os.cpu_count(),
+        },
+        'modes': modes,
+    }
+
+def login_overload(args):
+    """Latency of a cheap endpoint while a login burst hits the bcrypt pool, per BCRYPT_MAX_CONCURRENCY.
+
+    A cap of 0 lets every request thread hash at once. With a cap, logins
+    beyond the pool and its queue are rejected with 503, and rejected_p99_ms
+    shows how fast.
+    """
+    users = count_rows(args.db, 'user')
+    login_workers = [Worker(i, users, args.seed) for i in range(args.logins)]
+    poll_workers = [Worker(args.logins + i, users, args.seed) for i in range(args.pollers)]
+    caps = {}
+
+    for cap in args.caps:
+        env = dict(os.environ, DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0',
+                   BCRYPT_QUEUE_TIMEOUT=str(args.queue_timeout))
+        if cap:
+            env.update(BCRYPT_MAX_CONCURRENCY=str(cap), BCRYPT_MAX_QUEUE=str(args.queue))
+        else:
+            # More slots than request threads: nothing is ever queued or rejected
+            slots = str(args.workers * args.threads)
+            env.update(BCRYPT_MAX_CONCURRENCY=slots, BCRYPT_MAX_QUEUE=slots)
+        process, base_url = start_server('gunicorn', env, args.workers, args.threads)
+        try:
+            login_clients = [HTTPClient(base_url) for _ in login_workers]
+            poll_clients = [HTTPClient(base_url) for _ in poll_workers]
+            login_all(poll_clients, poll_workers)
+            print(f"  bcrypt cap {cap or 'none'} ...", file=sys.stderr)
+            caps[cap or 'none'] = run_mixed({'login': (login_clients, login_workers),
+                                             'crm_stats': (poll_clients, poll_workers)}, args.duration, args.warmup)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'login_clients': args.logins,
+            'polling_clients': args.pollers,
+            'bcrypt_queue': args.queue,
+            'bcrypt_queue_timeout_s': args.queue_timeout,
+            'server_workers': args.workers,
+            'gunicorn_threads': args.threads,
+            'duration_s': args.duration,
+            'cpu_count': os.cpu_count(),
+        },
+        'caps': caps,
+    }
+
+# SQLite settings compared by write-path, as environment overrides
+WRITE_PATH_CONFIGS = {
+    'rollback_full_sync': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL',
+                           'SQLITE_CACHE_SIZE': '-2000', 'SQLITE_MMAP_SIZE': '0'},
+    'wal': {},
+    'wal_group_commit': {'CRM_GROUP_COMMIT': '1'},
+}
+
+def write_path(args):
+    """Writes and reads per second with concurrent writers and readers, per SQLite configuration.
+
+    Each configuration runs on its own copy of the dataset, so every run
+    starts from the same rows.
+    """
+    users = count_rows(args.db, 'user')
+    writers = [Worker(i, users, args.seed) for i in range(args.writers)]
+    readers = [Worker(args.writers + i, users, args.seed) for i in range(args.readers)]
+    configs = {}
+
+    with tempfile.TemporaryDirectory(prefix='crm_write_path_') as scratch:
+        for name in args.configs:
+            db_path = os.path.join(scratch, f'{name}.db')
+            source = sqlite3.connect(args.db)
+            target = sqlite3.connect(db_path)
+            source.backup(target)
+            target.close()
+            source.close()
+            env = dict(os.environ, DATABASE_URL=database_url(db_path), LOG_FILE=db_path + '.log', LOG_CONSOLE='0',
+                       **WRITE_PATH_CONFIGS[name])
+            process, base_url = start_server('gunicorn', env, args.workers, args.threads)
+            try:
+                write_clients = [HTTPClient(base_url) for _ in writers]
+                read_clients = [HTTPClient(base_url) for _ in readers]
+                login_all(write_clients + read_clients, writers + readers)
+                print(f"  {name} ...", file=sys.stderr)
+                configs[name] = run_mixed({'submit_crm': (write_clients, writers),
+                                           'get_crm_entries_cursor': (read_clients, readers)},
+                                          args.duration, args.warmup)
+            finally:
+                process.terminate()
+                process.wait()
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'writers': args.writers,
+            'readers': args.readers,
+            'server_workers': args.workers,
+            'gunicorn_threads': args.threads,
+            'duration_s': args.duration,
+            'entries': count_rows(args.db, 'crm_entry'),
+            'sqlite': sqlite3.sqlite_version,
+            'cpu_count': os.cpu_count(),
+        },
+        'configs': configs,
+    }
+
+def user_cache(args):
+    """Per-request authentication cost: a user lookup per request, the cached user, and stateless bearer tokens.
+
+    The listing page requested is served from the response cache after the
+    first request, so the timings are dominated by loading the user.
+    """
+    os.environ.update(DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0')
+    sys.path.insert(0, HERE)
+    import app as crm_app
+
+    flask_app = crm_app.create_app()
+    session_client = flask_app.test_client()
+    response = session_client.post('/login', json={'username': 'rep0', 'password': BENCH_PASSWORD})
+    if response.status_code != 200:
+        raise SystemExit(f"Login as rep0 failed with {response.status_code}")
+    token_client = flask_app.test_client()
+    token_headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+    path = '/get_crm_entries?limit=1&fields=id'
+
+    def session_uncached():
+        crm_app.invalidate_user_cache()
+        return session_client.get(path)
+
+    variants = {
+        'session_uncached': session_uncached,
+        'session_cached': lambda: session_client.get(path),
+        'stateless_token': lambda: token_client.get(path, headers=token_headers),
+    }
+    results = {}
+    for name, request in variants.items():
+        flask_app.config['AUTH_STATELESS_TOKENS'] = name == 'stateless_token'
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise SystemExit(f"{name}: request failed with {response.status_code}")
+        timings.sort()
+        results[name] = {'median_ms': round(timings[len(timings) // 2], 3), 'p99_ms': round(percentile(timings, 0.99), 3)}
+        print(f"  {name}: {results[name]['median_ms']} ms", file=sys.stderr)
+
+    return {
+        'meta': {'repeat': args.repeat, 'python': platform.python_version(), 'cpu_count': os.cpu_count()},
+        'requests': results,
+    }
+
+def read_path(args):
+    """Serialize the newest rows through the ORM path and the Core path and report rows/sec."""
+    os.environ.update(DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0')
+    sys.path.insert(0, HERE)
+    import app as crm_app
+    import json_encoding
+
+    crm_app.create_app()
+    CRMEntry = crm_app.CRMEntry
+    table_view_fields = tuple(TABLE_VIEW_FIELDS.split(','))
+
+    def orm_path():
+        # The listing before the Core read path: ORM objects, to_dict, json.dumps
+        entries = CRMEntry.query.order_by(CRMEntry.submission_time.desc(), CRMEntry.id.desc()).limit(args.rows).all()
+        body = json.dumps([entry.to_dict() for entry in entries]).encode('utf-8')
+        crm_app.db.session.remove()
+        return len(entries), len(body)
+
+    def core_path(fields):
+        statement = crm_app.filtered_crm_query(fields=fields).limit(args.rows)
+        rows = crm_app.db.session.execute(statement).all()
+        body = json_encoding.dumps(crm_app.rows_to_dicts(rows, fields))
+        crm_app.db.session.remove()
+        return len(rows), len(body)
+
+    paths = {
+        'orm': orm_path,
+        'core': lambda: core_path(crm_app.CRM_LISTING_FIELDS),
+        'core_table_view': lambda: core_path(table_view_fields),
+    }
+    results = {}
+    with crm_app.app.app_context():
+        for name, func in paths.items():
+            func()  # Warm the page cache
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows, size = func()
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            results[name] = {'rows': rows, 'bytes': size, 'best_s': round(best, 4), 'rows_per_s': round(rows / best)}
+            print(f"  {name}: {results[name]['rows_per_s']} rows/s", file=sys.stderr)
+    return {'meta': {'encoder': json_encoding.encoder_name(), 'python': platform.python_version()}, 'paths': results}
+
+# Listing responses measured by the compression benchmark
+COMPRESSION_PAYLOADS = {
+    'listing_page': '/get_crm_entries?limit=1000',
+    'listing_page_table_view': f'/get_crm_entries?limit=1000&fields={TABLE_VIEW_FIELDS}',
+    'listing_full': '/get_crm_entries',
+}
+
+def compression(args):
+    """Response bytes saved by gzip against the server time it costs, per level and payload."""
+    os.environ.update(DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0')
+    sys.path.insert(0, HERE)
+    import app as crm_app
+
+    flask_app = crm_app.create_app()
+    client = TestClient(flask_app)
+    login_all([client], [Worker(0, 1, args.seed)])
+    bytes_per_ms = args.bandwidth_mbps * 1000 / 8  # Transfer time estimate for a WAN client
+
+    results = {}
+    for payload in args.payloads:
+        path = COMPRESSION_PAYLOADS[payload]
+        client.request('GET', path)  # Warm the page and response caches
+        results[payload] = {}
+        for level in [0] + args.levels:
+            flask_app.config['RESPONSE_COMPRESSION_LEVEL'] = level or 1
+            headers = {'Accept-Encoding': 'gzip' if level else 'identity'}
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                status, body = client.request('GET', path, headers=headers)
+                timings.append((time.perf_counter() - started) * 1000)
+                if status != 200:
+                    raise SystemExit(f"{path} failed with {status}: {body[:200]!r}")
+            server_ms = timing_summary(timings)['median_ms']
+            results[payload]['identity' if not level else f'gzip_{level}'] = {
+                'bytes': len(body),
+                'server_ms': server_ms,
+                'transfer_ms': round(len(body) / bytes_per_ms, 1),
+                'total_ms': round(server_ms + len(body) / bytes_per_ms, 1),
+            }
+        identity = results[payload]['identity']
+        for name, result in results[payload].items():
+            result['ratio'] = round(result['bytes'] / identity['bytes'], 3)
+            result['added_server_ms'] = round(result['server_ms'] - identity['server_ms'], 2)
+            print(f"  {payload} {name}: {result['bytes']} bytes, +{result['added_server_ms']} ms server", file=sys.stderr)
+    return {
+        'meta': {'bandwidth_mbps': args.bandwidth_mbps, 'entries': count_rows(args.db, 'crm_entry'),
+                 'python': platform.python_version()},
+        'payloads': results,
+    }
+
+def snapshot_index(args):
+    """Memory of the snapshot index and listing page/count latency with and without it."""
+    os.environ.update(DATABASE_URL=database_url(args.db), LOG_FILE=args.db + '.log', LOG_CONSOLE='0',
+                      CRM_SNAPSHOT_INDEX='1')
+    sys.path.insert(0, HERE)
+    import app as crm_app
+
+    crm_app.create_app()
+    index = crm_app.crm_index
+    started = time.perf_counter()
+    index.build()
+    build_seconds = time.perf_counter() - started
+    stats = index.stats()
+    users = count_rows(args.db, 'user')
+
+    rng = random.Random(args.seed)
+    queries = {
+        'sale_person': lambda: {'sale_person': f"rep{rng.randrange(users)}"},
+        'status': lambda: {'status': rng.choice(STATUSES)},
+        'sale_person_status': lambda: {'sale_person': f"rep{rng.randrange(users)}", 'status': rng.choice(STATUSES)},
+        'sale_person_status_cursor': lambda: {'sale_person': f"rep{rng.randrange(users)}", 'status': rng.choice(STATUSES),
+                                              'after': (datetime(2020, 1, 1) + timedelta(seconds=rng.randrange(5 * 365 * 24 * 3600)), 2 ** 62)},
+    }
+
+    table_view_fields = tuple(TABLE_VIEW_FIELDS.split(','))
+    variants = (
+        ('table_view_page', table_view_fields, False),
+        ('table_view_page_and_count', table_view_fields, True),
+        ('indexed_fields_page', crm_app.snapshot_index.INDEXED_FIELDS, False),
+    )
+    results = {}
+    with crm_app.app.app_context():
+        connection = crm_app.db.engine.connect()
+        for name, make_filters in queries.items():
+            results[name] = {}
+            for label, fields, count in variants:
+                timings = {'sqlite': [], 'index': []}
+                for _ in range(args.repeat):
+                    filters = make_filters()
+                    listing = crm_app.ListingRequest(
+                        filters.get('sale_person'), filters.get('status'), fields, args.limit, filters.get('after'), count)
+                    for path in ('sqlite', 'index'):
+                        crm_app.crm_index = index if path == 'index' else None
+                        started = time.perf_counter()
+                        crm_app.read_listing_page(connection, listing)
+                        timings[path].append((time.perf_counter() - started) * 1000)
+                sqlite_ms = timing_summary(timings['sqlite'])['median_ms']
+                index_ms = timing_summary(timings['index'])['median_ms']
+                results[name][label] = {'sqlite_ms': sqlite_ms, 'index_ms': index_ms,
+                                        'speedup': round(sqlite_ms / index_ms, 1) if index_ms else None}
+                print(f"  {name} {label}: {sqlite_ms} ms -> {index_ms} ms", file=sys.stderr)
+        connection.close()
+
+    return {
+        'meta': {'entries': stats['entries'], 'limit': args.limit, 'python': platform.python_version()},
+        'index': {
+            'build_s': round(build_seconds, 2),
+            'memory_bytes': stats['memory_bytes'],
+            'bytes_per_entry': round(stats['memory_bytes'] / max(stats['entries'], 1), 1),
+            'mib_per_million_entries': round(stats['memory_bytes'] / max(stats['entries'], 1) * 10 ** 6 / 2 ** 20, 1),
+        },
+        'queries': results,
+    }
+
+# Syllables and legal forms for synthetic company names; generate() has too few distinct ones
+NAME_SYLLABLES = 'ka lo mar tin ber gen sto vik ra el an dor fel ix hu go nor sen tal mi ko ve lu pa re di sa to ne'.split()
+LEGAL_FORMS = ('GmbH', 'Ltd', 'Inc', 'AG', 'LLC', 'Group', 'Systems', 'Partners')
+
+def synthetic_company(rng):
+    word = lambda count: ''.join(rng.choice(NAME_SYLLABLES) for _ in range(count)).title()
+    if rng.random() < 0.7:
+        return f"{word(rng.randint(2, 4))} {rng.choice(LEGAL_FORMS)}"
+    return f"{word(rng.randint(2, 4))} {word(2)} {rng.choice(LEGAL_FORMS)}"
+
+def autocomplete_names(args):
+    """Build time, memory and suggestion latency of the autocomplete index for N distinct names."""
+    import resource
+    sys.path.insert(0, HERE)
+    import autocomplete
+
+    rng = random.Random(args.seed)
+    names = set()
+    while len(names) < args.names:
+        names.add(synthetic_company(rng))
+    names = sorted(names)
+    # A few names with many entries and a long tail, as in a real CRM
+    name_counts = [(name, max(1, int(rng.paretovariate(1.1)))) for name in names]
+
+    started = time.perf_counter()
+    index = autocomplete.NameIndex.from_counts(name_counts, args.names)
+    index.warm_top_cache()
+    build_seconds = time.perf_counter() - started
+
+    def measure(queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.suggest(query, args.limit)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {'p50_ms': round(percentile(timings, 0.50), 3), 'p99_ms': round(percentile(timings, 0.99), 3),
+                'max_ms': round(timings[-1], 3)}
+
+    def typo(name):
+        position = rng.randrange(1, len(name))
+        return name[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[position + 1:]
+
+    results = {}
+    for length in (1, 2, 3, 5, 8):
+        results[f"prefix_{length}"] = measure([rng.choice(names)[:length] for _ in range(args.repeat)])
+    for length in (4, 6, 10):
+        results[f"typo_{length}"] = measure([typo(rng.choice(names)[:length]) for _ in range(args.repeat)])
+
+    # Names submitted after the build: half known, half new
+    timings = []
+    for number in range(args.repeat):
+        name = rng.choice(names) if number % 2 else f"New Company {number}"
+        started = time.perf_counter()
+        index.add(name)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    results['add'] = {'p50_ms': round(percentile(timings, 0.50), 3), 'p99_ms': round(percentile(timings, 0.99), 3)}
+    for name, result in results.items():
+        print(f"  {name}: {result}", file=sys.stderr)
+
+    memory_bytes = index.memory_bytes()
+    return {
+        'meta': {'names': len(index), 'limit': args.limit, 'python': platform.python_version()},
+        'index': {
+            'build_s': round(build_seconds, 2),
+            'memory_bytes': memory_bytes,
+            'bytes_per_name': round(memory_bytes / len(index), 1),
+            # Includes the synthetic names and the build's temporary lists
+            'process_max_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        'queries': results,
+    }
+
+def user_import(args):
+    """Time a bulk user import into a scratch SQLite file for each number of hashing threads."""
+    scratch = tempfile.mkdtemp(prefix='crm_user_import_')
+    db_path = os.path.join(scratch, 'users.db')
+    os.environ.update(DATABASE_URL=database_url(db_path), LOG_FILE=db_path + '.log', LOG_CONSOLE='0',
+                      BCRYPT_LOG_ROUNDS=str(args.rounds))
+    sys.path.insert(0, HERE)
+    import app as crm_app
+
+    crm_app.create_app()
+    results = {}
+    with crm_app.app.app_context():
+        crm_app.ensure_schema()
+        for workers in args.workers:
+            # New names for every run, so each one creates all of its users
+            rows = [{'username': f"import{workers}_{number}", 'email': f"import{workers}_{number}@example.com",
+                     'password': f"password{number}"} for number in range(args.users)]
+            crm_app.app.config['USER_IMPORT_HASH_WORKERS'] = workers
+            started = time.perf_counter()
+            checked = crm_app.user_import_job(rows, dry_run=True).run()
+            check_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            progress = crm_app.user_import_job(rows).run()
+            seconds = time.perf_counter() - started
+            if progress['created'] != args.users or checked['valid'] != args.users:
+                raise RuntimeError(f"Import created {progress['created']} of {args.users} users: {progress['error']}")
+            results[str(workers)] = {
+                'seconds': round(seconds, 2),
+                'users_per_second': round(args.users / seconds, 1),
+                'check_ms': round(check_seconds * 1000, 1),
+                'speedup': round(results['1']['seconds'] / seconds, 2) if '1' in results else None,
+            }
+            print(f"  {workers} threads: {results[str(workers)]}", file=sys.stderr)
+
+    return {
+        'meta': {'users': args.users, 'bcrypt_rounds': args.rounds, 'cpus': os.cpu_count(),
+                 'python': platform.python_version()},
+        'workers': results,
+    }
+
+def check_shared_state(clients, samples=20):
+    """Write through one client, then read the listing through every client.
+
+    Each request is a new connection that any worker may accept, so this
+    counts sessions rejected by a worker and listings that miss the write.
+    """
+    status, body = clients[0].request('POST', '/submit_crm', json_body={
+        'name': 'Scaling Check', 'company': 'Scaling Ltd', 'status': 'open'})
+    if status != 201:
+        raise SystemExit(f"Write for the consistency check failed with {status}: {body[:200]!r}")
+    entry_id = json.loads(body)['entry_id']
+    rejected = stale = 0
+    for i in range(samples):
+        status, body = clients[i % len(clients)].request('GET', '/get_crm_entries?limit=1&fields=id')
+        if status != 200:
+            rejected += 1
+        elif [entry['id'] for entry in json.loads(body)['entries']] != [entry_id]:
+            stale += 1
+    return {'reads': samples, 'rejected_sessions': rejected, 'stale_listings': stale}
+
+def scaling(args):
+    """Throughput of N gunicorn workers behind one port sharing a database, for each N in --workers.
+
+    The workers share SECRET_KEY and run with SHARED_DEPLOYMENT=1, so each
+    client logs in once and its session is accepted by whichever worker takes
+    the next connection.
+    """
+    url = args.database_url or database_url(args.db)
+    env = dict(os.environ, DATABASE_URL=url, LOG_FILE=args.db + '.log', LOG_CONSOLE='0',
+               SECRET_KEY=os.urandom(32).hex(), SHARED_DEPLOYMENT='1')
+    users = args.users or count_rows(args.db, 'user')
+    workers = [Worker(i, users, args.seed) for i in range(args.concurrency)]
+    levels = {}
+
+    for worker_count in sorted(args.workers):
+        process, base_url = start_server('gunicorn', env, worker_count, args.threads)
+        try:
+            clients = [HTTPClient(base_url) for _ in workers]
+            login_all(clients, workers)
+            shared_state = check_shared_state(clients)
+            routes = {}
+            for name in args.scenarios:
+                print(f"  {worker_count} workers: {name} ...", file=sys.stderr)
+                routes[name] = run_phase(name, clients, workers, args.duration, args.warmup)
+        finally:
+            process.terminate()
+            process.wait()
+        levels[worker_count] = {'shared_state': shared_state, 'routes': routes}
+
+    # Efficiency 1.0 is linear scaling: N workers serve N times the single worker's throughput
+    base = levels[min(levels)]
+    for worker_count, level in levels.items():
+        for name, route in level['routes'].items():
+            single = base['routes'][name]['throughput_rps'] / min(levels)
+            route['efficiency'] = round(route['throughput_rps'] / (worker_count * single), 2) if single else None
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'database': redact_password(url),
+            'concurrency': args.concurrency,
+            'gunicorn_threads': args.threads,
+            'duration_s': args.duration,
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'workers': levels,
+    }
+
+def compare(results, baseline, threshold):
+    """Return regression messages for routes slower than the baseline by more than threshold."""
+    regressions = []
+    for name, current in results.get('routes', {}).items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous:
+            continue
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {current['throughput_rps']} rps vs baseline {previous['throughput_rps']} rps")
+        for key in ('p95_ms', 'p99_ms'):
+            if previous.get(key) and current.get(key) and current[key] > previous[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {current[key]} vs baseline {previous[key]}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {previous['errors']}")
+    for name, current in results.get('startup', {}).items():
+        previous = baseline.get('startup', {}).get(name)
+        if previous and current['median_ms'] > previous['median_ms'] * (1 + threshold):
+            regressions.append(f"startup {name}: {current['median_ms']} ms vs baseline {previous['median_ms']} ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help='create a synthetic dataset')
+    generate_parser.add_argument('--db', required=True, help='scratch SQLite file to create')
+    generate_parser.add_argument('--rows', type=int, default=10000, help='CRM entries, e.g. 10000, 1000000, 10000000')
+    generate_parser.add_argument('--users', type=int, default=100)
+    generate_parser.add_argument('--seed', type=int, default=42)
+    generate_parser.add_argument('--bcrypt-rounds', type=int, default=int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)))
+
+    run_parser = commands.add_parser('run', help='drive the endpoints and report latency per route')
+    run_parser.add_argument('--db', required=True)
+    run_parser.add_argument('--mode', choices=('testclient', 'gunicorn', 'asgi'), default='testclient',
+                            help='asgi serves async_app with uvicorn')
+    run_parser.add_argument('--scenarios', type=lambda value: value.split(','), default=list(DEFAULT_SCENARIOS),
+                            help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=10.0, help='measured seconds per scenario')
+    run_parser.add_argument('--warmup', type=float, default=1.0, help='unmeasured seconds per scenario')
+    run_parser.add_argument('--workers', type=int, default=1, help='gunicorn/uvicorn worker processes')
+    run_parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    run_parser.add_argument('--baseline', help='compare against this results file and exit 1 on regression')
+    run_parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown')
+
+    compare_parser = commands.add_parser('compare', help='compare a results file with a baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+
+    startup_parser = commands.add_parser('startup', help='measure cold start time (import, create_app, first request)')
+    startup_parser.add_argument('--db', required=True)
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    startup_parser.add_argument('--baseline', help='compare against this results file and exit 1 on regression')
+    startup_parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown')
+
+    capacity_parser = commands.add_parser('capacity', help='concurrent clients held within a p99 budget, threaded vs async')
+    capacity_parser.add_argument('--db', required=True)
+    capacity_parser.add_argument('--modes', type=lambda value: value.split(','), default=['gunicorn', 'asgi'])
+    capacity_parser.add_argument('--levels', type=lambda value: [int(level) for level in value.split(',')],
+                                 default=[8, 16, 32, 64, 128], help='comma-separated client counts')
+    capacity_parser.add_argument('--p99-ms', type=float, default=250.0)
+    capacity_parser.add_argument('--scenarios', type=lambda value: value.split(','),
+                                 default=['get_crm_entries_cursor', 'submit_crm'])
+    capacity_parser.add_argument('--duration', type=float, default=5.0)
+    capacity_parser.add_argument('--warmup', type=float, default=1.0)
+    capacity_parser.add_argument('--workers', type=int, default=1)
+    capacity_parser.add_argument('--threads', type=int, default=8)
+    capacity_parser.add_argument('--seed', type=int, default=42)
+
+    login_parser = commands.add_parser('login-overload', help='cheap-endpoint latency during a login burst, per bcrypt cap')
+    login_parser.add_argument('--db', required=True)
+    login_parser.add_argument('--caps', type=lambda value: [int(cap) for cap in value.split(',')], default=[0, 2],
+                              help='comma-separated BCRYPT_MAX_CONCURRENCY values, 0 for uncapped')
+    login_parser.add_argument('--logins', type=int, default=16, help='clients in a login loop')
+    login_parser.add_argument('--pollers', type=int, default=4, help='clients polling /crm_stats')
+    login_parser.add_argument('--queue', type=int, default=4, help='BCRYPT_MAX_QUEUE with a cap')
+    login_parser.add_argument('--queue-timeout', type=float, default=0.5, help='BCRYPT_QUEUE_TIMEOUT seconds')
+    login_parser.add_argument('--duration', type=float, default=10.0)
+    login_parser.add_argument('--warmup', type=float, default=1.0)
+    login_parser.add_argument('--workers', type=int, default=1)
+    login_parser.add_argument('--threads', type=int, default=32)
+    login_parser.add_argument('--seed', type=int, default=42)
+
+    write_path_parser = commands.add_parser('write-path', help='writes and reads per second per journal mode and with group commit')
+    write_path_parser.add_argument('--db', required=True)
+    write_path_parser.add_argument('--configs', type=lambda value: value.split(','), default=list(WRITE_PATH_CONFIGS),
+                                   help=f"comma-separated, from: {', '.join(WRITE_PATH_CONFIGS)}")
+    write_path_parser.add_argument('--writers', type=int, default=8)
+    write_path_parser.add_argument('--readers', type=int, default=8)
+    write_path_parser.add_argument('--duration', type=float, default=10.0)
+    write_path_parser.add_argument('--warmup', type=float, default=1.0)
+    write_path_parser.add_argument('--workers', type=int, default=1)
+    write_path_parser.add_argument('--threads', type=int, default=16)
+    write_path_parser.add_argument('--seed', type=int, default=42)
+
+    user_cache_parser = commands.add_parser('user-cache', help='per-request authentication cost with and without the user cache')
+    user_cache_parser.add_argument('--db', required=True)
+    user_cache_parser.add_argument('--repeat', type=int, default=2000, help='requests per variant')
+
+    read_path_parser = commands.add_parser('read-path', help='compare the ORM and Core listing serialization in-process')
+    read_path_parser.add_argument('--db', required=True)
+    read_path_parser.add_argument('--rows', type=int, default=100000, help='newest rows read per repetition')
+    read_path_parser.add_argument('--repeat', type=int, default=5)
+
+    compression_parser = commands.add_parser('compression', help='bytes saved by response gzip vs server time, per level')
+    compression_parser.add_argument('--db', required=True)
+    compression_parser.add_argument('--levels', type=lambda value: [int(level) for level in value.split(',')],
+                                    default=[1, 6, 9])
+    compression_parser.add_argument('--payloads', type=lambda value: value.split(','), default=list(COMPRESSION_PAYLOADS),
+                                    help=f"comma-separated, from: {', '.join(COMPRESSION_PAYLOADS)}")
+    compression_parser.add_argument('--bandwidth-mbps', type=float, default=20.0, help='client link for the transfer estimate')
+    compression_parser.add_argument('--repeat', type=int, default=5)
+    compression_parser.add_argument('--seed', type=int, default=42)
+
+    snapshot_parser = commands.add_parser('snapshot-index', help='memory and listing latency of the in-memory snapshot index')
+    snapshot_parser.add_argument('--db', required=True)
+    snapshot_parser.add_argument('--limit', type=int, default=50, help='entries per listing page')
+    snapshot_parser.add_argument('--repeat', type=int, default=50)
+    snapshot_parser.add_argument('--seed', type=int, default=42)
+
+    autocomplete_parser = commands.add_parser('autocomplete', help='build time, memory and latency of the name suggestion index')
+    autocomplete_parser.add_argument('--names', type=int, default=1000000, help='distinct company names')
+    autocomplete_parser.add_argument('--limit', type=int, default=10, help='suggestions per query')
+    autocomplete_parser.add_argument('--repeat', type=int, default=1000, help='queries per prefix length')
+    autocomplete_parser.add_argument('--seed', type=int, default=42)
+
+    user_import_parser = commands.add_parser('user-import', help='bulk user import time per number of hashing threads')
+    user_import_parser.add_argument('--users', type=int, default=200)
+    user_import_parser.add_argument('--rounds', type=int, default=10, help='bcrypt work factor')
+    user_import_parser.add_argument('--workers', type=lambda value: [int(count) for count in value.split(',')],
+                                    default=[1, os.cpu_count() or 1], help='comma-separated thread counts, 1 first')
+
+    scaling_parser = commands.add_parser('scaling', help='throughput of 1..N gunicorn workers behind one port')
+    scaling_parser.add_argument('--db', required=True, help='dataset from generate (log file location with --database-url)')
+    scaling_parser.add_argument('--database-url', help='serve this database instead, e.g. PostgreSQL loaded with the same users')
+    scaling_parser.add_argument('--users', type=int, help='rep<N> users in the database (default: counted in --db)')
+    scaling_parser.add_argument('--workers', type=lambda value: [int(count) for count in value.split(',')],
+                                default=[1, 2, 4], help='comma-separated worker counts')
+    scaling_parser.add_argument('--scenarios', type=lambda value: value.split(','),
+                                default=['get_crm_entries_cursor', 'get_crm_entries_filtered'])
+    scaling_parser.add_argument('--concurrency', type=int, default=32)
+    scaling_parser.add_argument('--duration', type=float, default=5.0)
+    scaling_parser.add_argument('--warmup', type=float, default=1.0)
+    scaling_parser.add_argument('--threads', type=int, default=8)
+    scaling_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        generate(args.db, args.rows, args.users, args.seed, bcrypt_rounds=args.bcrypt_rounds)
+        return 0
+
+    if args.command == 'capacity':
+        print(json.dumps(capacity(args), indent=2))
+        return 0
+
+    if args.command == 'login-overload':
+        print(json.dumps(login_overload(args), indent=2))
+        return 0
+
+    if args.command == 'write-path':
+        unknown = [name for name in args.configs if name not in WRITE_PATH_CONFIGS]
+        if unknown:
+            parser.error(f"unknown configs: {', '.join(unknown)}")
+        print(json.dumps(write_path(args), indent=2))
+        return 0
+
+    if args.command == 'user-cache':
+        print(json.dumps(user_cache(args), indent=2))
+        return 0
+
+    if args.command == 'read-path':
+        print(json.dumps(read_path(args), indent=2))
+        return 0
+
+    if args.command == 'compression':
+        print(json.dumps(compression(args), indent=2))
+        return 0
+
+    if args.command == 'snapshot-index':
+        print(json.dumps(snapshot_index(args), indent=2))
+        return 0
+
+    if args.command == 'scaling':
+        print(json.dumps(scaling(args), indent=2))
+        return 0
+
+    if args.command == 'autocomplete':
+        print(json.dumps(autocomplete_names(args), indent=2))
+        return 0
+
+    if args.command == 'user-import':
+        print(json.dumps(user_import(args), indent=2))
+        return 0
+
+    if args.command in ('run', 'startup'):
+        if args.command == 'run':
+            unknown = [name for name in args.scenarios if name not in SCENARIOS]
+            if unknown:
+                parser.error(f"unknown scenarios: {', '.join(unknown)}")
+            results = run(args)
+        else:
+            results = startup(args)
+        document = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, 'w') as output:
+                output.write(document + '\n')
+        else:
+            print(document)
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    else:
+        with open(args.results) as results_file:
+            results = json.load(results_file)
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = compare(results, baseline, args.threshold)
+    for message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    if not regressions:
+        print('No regressions against baseline', file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""In-process caches shared by the CRM app."""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after they are set.
+
+    Holds at most maxsize entries; the least recently used entry is evicted first.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._entries.pop(key, None)
+            return item[0] if item is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+class VersionCounter:
+    """Thread-safe counter bumped on every write to a table.
+
+    boot_id distinguishes processes, so a version number seen before a restart
+    is never mistaken for the same data. It is drawn again in a forked child,
+    so workers forked from one preloaded app never share ETags, unless a
+    shared id was set because every worker reads the same versions.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._boot_id = None
+        self._boot_pid = None
+        self._shared_id = None
+        self._lock = threading.Lock()
+
+    def share_boot_id(self, shared_id):
+        """Use shared_id instead of a per-process id, for versions every process agrees on."""
+        self._shared_id = shared_id
+
+    @property
+    def boot_id(self):
+        if self._shared_id is not None:
+            return self._shared_id
+        if self._boot_pid != os.getpid():
+            self._boot_id = os.urandom(4).hex()
+            self._boot_pid = os.getpid()
+        return self._boot_id
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            return self.value
+
+    def etag(self, version, key):
+        """Strong ETag for the representation of key at version."""
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest()
+        return f"{self.boot_id}-{version}-{digest}"
+
+class ResponseCache:
+    """LRU cache of response bodies bounded by their total size in bytes.
+
+    Bodies larger than max_entry_bytes are never stored.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def record_not_modified(self):
+        """Count a conditional request answered with 304 without consulting the cache."""
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'not_modified': self.not_modified,
+            }
@@ -0,0 +1,109 @@
+"""Change sequence for incremental sync of CRM entries.
+
+Triggers on crm_entry append a (seq, entry_id, op) row to crm_change for every
+insert, update and delete, whichever process or code path wrote the entry. A
+client keeps a cursor, the last seq it has seen, and asks only for later
+changes. The newest row is never pruned, so seq numbers are never reused.
+On SQLite seq is a plain INTEGER PRIMARY KEY without gaps; on PostgreSQL it
+comes from a sequence and rolled back writes leave gaps, which readers skip.
+
+Writers in this process call ChangeNotifier.notify() after committing, which
+wakes the change streams at once; changes committed by other processes are
+picked up when a stream polls.
+"""
+import threading
+from sqlalchemy import text
+
+OP_INSERT = 'insert'
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+
+class CursorExpired(Exception):
+    """The changes after this cursor are no longer (or not yet) in the log."""
+
+def parse_cursor(value):
+    """Return the seq for a since= value; raises ValueError."""
+    seq = int(value)
+    if seq < 0:
+        raise ValueError('Cursor must be a non-negative integer')
+    return seq
+
+def current_seq(connection):
+    return connection.execute(text('SELECT COALESCE(MAX(seq), 0) FROM crm_change')).scalar()
+
+def check_cursor(connection, since):
+    """Raise CursorExpired unless every change after since is still in the log."""
+    first_seq, last_seq = connection.execute(text('SELECT MIN(seq), MAX(seq) FROM crm_change')).one()
+    if last_seq is None:
+        if since:
+            raise CursorExpired(f'No changes are recorded, cursor {since} is unknown')
+    elif since < first_seq - 1 or since > last_seq:
+        raise CursorExpired(f'Changes after {since} are not available (log holds {first_seq}-{last_seq})')
+
+def read_changes(connection, since, limit):
+    """Return (changed_ids, deleted_ids, cursor, has_more) for up to limit changes after since.
+
+    Several changes to one entry collapse to its last one; changed_ids are
+    entries inserted or updated whose current row should be fetched.
+    """
+    check_cursor(connection, since)
+    rows = connection.execute(
+        text('SELECT seq, entry_id, op FROM crm_change WHERE seq > :since ORDER BY seq LIMIT :limit'),
+        {'since': since, 'limit': limit + 1}
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    last_op = {}
+    for _, entry_id, op in rows:
+        last_op[entry_id] = op
+    changed_ids = [entry_id for entry_id, op in last_op.items() if op != OP_DELETE]
+    deleted_ids = [entry_id for entry_id, op in last_op.items() if op == OP_DELETE]
+    return changed_ids, deleted_ids, rows[-1][0] if rows else since, has_more
+
+def prune(engine, max_age_days, batch_size=1000):
+    """Drop changes older than max_age_days in short transactions; returns the number removed.
+
+    The newest change is always kept so seq keeps counting up from it.
+    """
+    if engine.dialect.name == 'postgresql':
+        cutoff = "(CURRENT_TIMESTAMP AT TIME ZONE 'UTC') + CAST(:age AS INTERVAL)"
+    else:
+        cutoff = "datetime('now', :age)"
+    removed = 0
+    while True:
+        with engine.begin() as connection:
+            deleted = connection.execute(text(
+                'DELETE FROM crm_change WHERE seq IN ('
+                'SELECT seq FROM crm_change '
+                f'WHERE changed_at < {cutoff} AND seq < (SELECT MAX(seq) FROM crm_change) '
+                'ORDER BY seq LIMIT :limit)'
+            ), {'age': f'-{float(max_age_days)} days', 'limit': batch_size}).rowcount
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+class ChangeNotifier:
+    """Calls the subscribed callbacks whenever entries were committed in this process."""
+
+    def __init__(self):
+        self._callbacks = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._callbacks.add(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._callbacks.discard(callback)
+
+    def notify(self):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    @property
+    def subscribers(self):
+        return len(self._callbacks)
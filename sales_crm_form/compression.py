@@ -0,0 +1,160 @@
+"""Negotiated gzip compression of API responses.
+
+JSON, NDJSON and CSV responses are gzip-encoded when the client sends
+Accept-Encoding: gzip and the body is at least min_size bytes. Streamed bodies
+are always compressed, chunk by chunk, with a sync flush after every chunk so
+the client keeps receiving rows as they are produced.
+
+A compressed response is a different representation, so its strong ETag gets
+a -gzip suffix; matching_etag() finds either form in If-None-Match, so a
+304 can repeat the one the client holds.
+"""
+import time
+import zlib
+from flask import request
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+import metrics
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+GZIP_WBITS = 31  # zlib writes a gzip container
+
+def encoded_etag(etag):
+    return f"{etag}-gzip"
+
+def matching_etag(if_none_match, etag):
+    """The form of etag, plain or compressed, that If-None-Match names; None if neither."""
+    if if_none_match.contains(etag):
+        return etag
+    if if_none_match.contains(encoded_etag(etag)):
+        return encoded_etag(etag)
+    return None
+
+def accepts_gzip(accept_encoding):
+    return parse_accept_header(accept_encoding)['gzip'] > 0
+
+def is_compressible(content_type):
+    return (content_type or '').split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+def compress(data, level):
+    with metrics.timed(metrics.COMPRESSION_DURATION, metrics.current_endpoint()):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+        body = compressor.compress(data) + compressor.flush()
+    metrics.COMPRESSION_BYTES.inc(metrics.current_endpoint(), 'in', amount=len(data))
+    metrics.COMPRESSION_BYTES.inc(metrics.current_endpoint(), 'out', amount=len(body))
+    return body
+
+class StreamCompressor:
+    """gzip encoder for a body sent in chunks; each chunk is flushed to the client."""
+
+    def __init__(self, level, endpoint):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+        self.endpoint = endpoint
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def compress(self, chunk, final=False):
+        started = time.perf_counter()
+        data = self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        self.seconds += time.perf_counter() - started
+        self.bytes_in += len(chunk)
+        self.bytes_out += len(data)
+        if final:
+            metrics.COMPRESSION_DURATION.observe(self.seconds, self.endpoint)
+            metrics.COMPRESSION_BYTES.inc(self.endpoint, 'in', amount=self.bytes_in)
+            metrics.COMPRESSION_BYTES.inc(self.endpoint, 'out', amount=self.bytes_out)
+        return data
+
+def compress_chunks(chunks, compressor, source):
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.compress(b'', final=True)
+    finally:
+        # Closing the source runs stream_with_context teardown right away
+        if hasattr(source, 'close'):
+            source.close()
+
+def init_app(app):
+    """Compress eligible Flask responses after the view has built them."""
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config['RESPONSE_COMPRESSION'] or not is_compressible(response.content_type):
+            return response
+        if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+        if not response.is_streamed and len(response.get_data()) < app.config['RESPONSE_COMPRESSION_MIN_BYTES']:
+            return response
+
+        # Compressible whatever this client sent, so caches must key on Accept-Encoding
+        response.vary.add('Accept-Encoding')
+        if not accepts_gzip(request.headers.get('Accept-Encoding')):
+            return response
+
+        level = app.config['RESPONSE_COMPRESSION_LEVEL']
+        if response.is_streamed:
+            source = response.response
+            response.response = compress_chunks(
+                response.iter_encoded(), StreamCompressor(level, metrics.current_endpoint()), source)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(response.get_data(), level))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag), weak)
+        return response
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+def asgi_send(send, accept_encoding, level, min_size):
+    """Wrap an ASGI send callable so eligible responses go out gzip-encoded.
+
+    A body sent in one message is compressed if it has at least min_size
+    bytes; a body sent in several messages is compressed chunk by chunk.
+    """
+    client_accepts = accepts_gzip(accept_encoding)
+    pending = None  # Start message and headers, held until the first body message shows the size
+    compressor = None
+
+    async def send_compressed(message):
+        nonlocal pending, compressor
+        if message['type'] == 'http.response.start':
+            headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in message['headers']])
+            if (message['status'] < 200 or message['status'] in (204, 304)
+                    or not is_compressible(headers.get('Content-Type')) or 'Content-Encoding' in headers):
+                return await send(message)
+            pending = (message, headers)
+            return
+        if message['type'] != 'http.response.body':
+            return await send(message)
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if pending is not None:
+            start_message, headers = pending
+            pending = None
+            if more_body or len(body) >= min_size:
+                headers.add('Vary', 'Accept-Encoding')
+                if client_accepts:
+                    headers.pop('Content-Length', None)
+                    headers['Content-Encoding'] = 'gzip'
+                    etag = headers.get('ETag')
+                    if etag and etag.endswith('"'):
+                        headers['ETag'] = etag[:-1] + '-gzip"'
+                    compressor = StreamCompressor(level, metrics.current_endpoint())
+            await send({**start_message, 'headers': encode_headers(headers)})
+
+        if compressor is None:
+            return await send(message)
+        await send({'type': 'http.response.body', 'body': compressor.compress(body, final=not more_body),
+                    'more_body': more_body})
+
+    return send_compressed
@@ -0,0 +1,92 @@
+"""Incrementally maintained pipeline counts for /crm_stats.
+
+The crm_stat table holds one row per (dimension, stat_key) with the number of
+CRM entries in that bucket. Writers call record_entries() in the same
+transaction as their insert, so reading the stats never touches crm_entry.
+All functions take a Connection or a Session and leave the transaction to the
+caller.
+"""
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import text
+
+DIMENSIONS = ('total', 'status', 'sale_person', 'day', 'week')
+
+def stat_keys(status, sale_person, submission_time):
+    """Return the (dimension, stat_key) buckets an entry is counted in."""
+    keys = [('total', ''), ('status', status or ''), ('sale_person', sale_person or '')]
+    if submission_time is not None:
+        if isinstance(submission_time, str):
+            submission_time = datetime.fromisoformat(submission_time)
+        iso_year, iso_week, _ = submission_time.isocalendar()
+        keys.append(('day', submission_time.date().isoformat()))
+        keys.append(('week', f"{iso_year}-W{iso_week:02d}"))
+    return keys
+
+def count_rows(rows):
+    """Aggregate entry rows (mappings with status, sale_person, submission_time) into bucket counts."""
+    counts = Counter()
+    for row in rows:
+        counts.update(stat_keys(row.get('status'), row.get('sale_person'), row.get('submission_time')))
+    return counts
+
+def apply_counts(connection, counts, sign=1):
+    """Add (or with sign=-1 subtract) bucket counts in one upsert statement."""
+    if not counts:
+        return
+    connection.execute(
+        text(
+            'INSERT INTO crm_stat (dimension, stat_key, count) VALUES (:dimension, :stat_key, :count) '
+            'ON CONFLICT (dimension, stat_key) DO UPDATE SET count = crm_stat.count + excluded.count'
+        ),
+        [{'dimension': dimension, 'stat_key': stat_key, 'count': sign * count}
+         for (dimension, stat_key), count in counts.items()]
+    )
+    if sign < 0:
+        connection.execute(text('DELETE FROM crm_stat WHERE count <= 0'))
+
+def record_entries(connection, rows, sign=1):
+    """Count newly inserted (or, with sign=-1, deleted) entry rows."""
+    apply_counts(connection, count_rows(rows), sign)
+
+def reset(connection):
+    """Forget all counts, e.g. after every entry was deleted."""
+    connection.execute(text('DELETE FROM crm_stat'))
+
+def compute_from_entries(connection):
+    """Count every bucket directly from crm_entry (full scan)."""
+    result = connection.execute(text('SELECT status, sale_person, submission_time FROM crm_entry'))
+    return count_rows(row._mapping for row in result)
+
+def stored_counts(connection):
+    result = connection.execute(text('SELECT dimension, stat_key, count FROM crm_stat'))
+    return Counter({(row.dimension, row.stat_key): row.count for row in result if row.count})
+
+def recompute(connection):
+    """Rebuild crm_stat from crm_entry; the fallback when the counts are missing or drifted."""
+    reset(connection)
+    apply_counts(connection, compute_from_entries(connection))
+
+def check(connection):
+    """Compare stored counts with a full recount.
+
+    Returns a list of (dimension, stat_key, stored, actual) for every bucket that differs.
+    """
+    stored = stored_counts(connection)
+    actual = compute_from_entries(connection)
+    return [(dimension, stat_key, stored.get((dimension, stat_key), 0), actual.get((dimension, stat_key), 0))
+            for dimension, stat_key in sorted(set(stored) | set(actual))
+            if stored.get((dimension, stat_key), 0) != actual.get((dimension, stat_key), 0)]
+
+def read(connection):
+    """Return the counts grouped by dimension."""
+    stats = {dimension: {} for dimension in DIMENSIONS}
+    for (dimension, stat_key), count in stored_counts(connection).items():
+        stats.setdefault(dimension, {})[stat_key] = count
+    return {
+        'total': stats['total'].get('', 0),
+        'by_status': stats['status'],
+        'by_sale_person': stats['sale_person'],
+        'by_day': stats['day'],
+        'by_week': stats['week'],
+    }
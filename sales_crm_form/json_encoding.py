@@ -0,0 +1,27 @@
+"""JSON encoding for large API responses.
+
+orjson is used when it is installed; it encodes lists of row dicts several
+times faster than the standard library and handles datetimes natively. Without
+it the standard library encoder is used with the same output shape.
+"""
+import json
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # Optional dependency
+    orjson = None
+
+def default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """Serialize obj to compact JSON bytes; datetimes become ISO 8601 strings."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), default=default).encode('utf-8')
+
+def encoder_name():
+    return 'orjson' if orjson is not None else 'json'
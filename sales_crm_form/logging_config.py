@@ -0,0 +1,211 @@
+"""Logging pipeline for the CRM app.
+
+Request threads only put records on a queue; a background QueueListener
+formats them as JSON lines into a size-rotated file (and plain text on the
+console). The listener thread is started by the first record of each process,
+so configuring logging before a fork (gunicorn --preload) is safe.
+
+Levels, per-route levels and per-route sampling come from the environment:
+
+    LOG_LEVEL=INFO                                  default level
+    LOG_ROUTE_LEVELS=submit_crm=DEBUG,login=WARNING  per-endpoint levels
+    LOG_SAMPLE_RATES=get_crm_entries=0.1             fraction of requests logged below WARNING
+    LOG_FILE=app_debug.log, LOG_MAX_BYTES=10485760, LOG_BACKUP_COUNT=5, LOG_CONSOLE=1
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request
+
+# Keys whose values never reach the log
+SENSITIVE_KEYS = ('password', 'token', 'authtoken', 'secret', 'authorization', 'cookie', 'session')
+
+REDACTED = '***'
+
+# Patterns for credentials embedded in already formatted messages
+_SENSITIVE_KEY_PATTERN = '|'.join(SENSITIVE_KEYS)
+_QUOTED_VALUE_RE = re.compile(
+    r"""(['"][\w-]*(?:%s)[\w-]*['"]\s*[:=]\s*)(['"])(.*?)\2""" % _SENSITIVE_KEY_PATTERN, re.IGNORECASE)
+_BARE_VALUE_RE = re.compile(
+    r"""(\b[\w-]*(?:%s)[\w-]*=)([^\s&,;'"]+)""" % _SENSITIVE_KEY_PATTERN, re.IGNORECASE)
+_BEARER_RE = re.compile(r'(Bearer\s+)[\w.~+/=-]+', re.IGNORECASE)
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+def is_sensitive_key(key):
+    return any(sensitive in str(key).lower() for sensitive in SENSITIVE_KEYS)
+
+def redact_credentials(data):
+    """Return a copy of a mapping (e.g. request data or headers) with credential values masked."""
+    if not hasattr(data, 'items'):
+        return data
+    return {key: REDACTED if is_sensitive_key(key) else value for key, value in data.items()}
+
+def redact_message(message):
+    """Mask credentials that appear inside a formatted log message."""
+    message = _QUOTED_VALUE_RE.sub(lambda m: f"{m.group(1)}{m.group(2)}{REDACTED}{m.group(2)}", message)
+    message = _BARE_VALUE_RE.sub(lambda m: m.group(1) + REDACTED, message)
+    return _BEARER_RE.sub(lambda m: m.group(1) + REDACTED, message)
+
+def parse_mapping(value, convert):
+    """Parse 'key=value,key=value' environment settings."""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        key, raw = item.split('=', 1)
+        mapping[key.strip()] = convert(raw.strip())
+    return mapping
+
+def parse_level(value):
+    level = logging.getLevelName(str(value).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {value}")
+    return level
+
+class RequestFilter(logging.Filter):
+    """Apply per-route levels and sampling, tag records with request details and redact them.
+
+    Runs on the request thread, before the record is queued.
+    """
+
+    def __init__(self, default_level, route_levels=None, sample_rates=None):
+        super().__init__()
+        self.default_level = default_level
+        self.route_levels = route_levels or {}
+        self.sample_rates = sample_rates or {}
+
+    def filter(self, record):
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            record.endpoint = endpoint
+            record.method = request.method
+            record.path = request.path
+
+        if record.levelno < self.route_levels.get(endpoint, self.default_level):
+            return False
+
+        # Warnings and errors are always kept; the rest is sampled per request
+        if record.levelno < logging.WARNING and endpoint in self.sample_rates:
+            if not self.is_sampled(endpoint):
+                return False
+
+        record.msg = redact_message(record.getMessage())
+        record.args = None
+        return True
+
+    def is_sampled(self, endpoint):
+        # Decide once per request so a sampled request keeps all of its records
+        sampled = g.get('_log_sampled')
+        if sampled is None:
+            sampled = random.random() < self.sample_rates[endpoint]
+            g._log_sampled = sampled
+        return sampled
+
+class RequestQueueHandler(QueueHandler):
+    """QueueHandler that keeps the traceback separate from the message for JSON output."""
+
+    def enqueue(self, record):
+        ensure_listener()
+        super().enqueue(record)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in ('endpoint', 'method', 'path', 'duration_ms', 'query_plan'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def configure_logging(log_file='app_debug.log'):
+    """Install the queue-backed logging pipeline on the root logger.
+
+    Safe to call more than once; only the first call creates a listener. The
+    log file is opened and the listener started when the first record arrives.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    default_level = parse_level(os.environ.get('LOG_LEVEL', 'INFO'))
+    route_levels = parse_mapping(os.environ.get('LOG_ROUTE_LEVELS'), parse_level)
+    sample_rates = parse_mapping(os.environ.get('LOG_SAMPLE_RATES'), float)
+
+    file_handler = RotatingFileHandler(
+        os.environ.get('LOG_FILE', log_file),
+        maxBytes=int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        backupCount=int(os.environ.get('LOG_BACKUP_COUNT', 5)),
+        delay=True
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+
+    if os.environ.get('LOG_CONSOLE', '1') != '0':
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RequestQueueHandler(log_queue)
+    queue_handler.addFilter(RequestFilter(default_level, route_levels, sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    # The root level is the most verbose level any route asks for; the filter narrows it per route
+    root.setLevel(min([default_level, *route_levels.values()]))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    atexit.register(stop_logging)
+    return _listener
+
+def ensure_listener():
+    """Start the listener thread in this process if it is not running (e.g. after a fork)."""
+    global _listener_pid
+    if _listener_pid == os.getpid() or _listener is None:
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid() and _listener is not None:
+            _listener.start()
+            _listener_pid = os.getpid()
+
+def stop_logging():
+    """Flush queued records and stop the background listener."""
+    global _listener, _listener_pid
+    if _listener is not None:
+        if _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
+        _listener_pid = None
@@ -0,0 +1,183 @@
+"""Request, SQL, serialization and bcrypt metrics in Prometheus text format.
+
+Recording is a lock-protected counter update; the text exposition is only
+built when /metrics is scraped. Requests are labelled by Flask endpoint (not
+path) to keep label cardinality bounded.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from flask import has_request_context, request
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (made cumulative on render), sum, count
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    bucket_labels = format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = format_labels(self.labelnames, labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {repr(total)}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class CallbackGauge:
+    """Gauge whose values are read from a callback at scrape time."""
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.callback = callback
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'crm_http_request_duration_seconds', 'Time to serve a request, including streamed bodies.',
+    ('endpoint', 'method', 'status')))
+SQL_STATEMENTS = REGISTRY.register(Counter(
+    'crm_sql_statements_total', 'SQL statements executed, by originating endpoint.', ('endpoint',)))
+SQL_DURATION = REGISTRY.register(Histogram(
+    'crm_sql_statement_duration_seconds', 'SQL statement execution time, by originating endpoint.',
+    ('endpoint',), SQL_BUCKETS))
+SERIALIZATION_DURATION = REGISTRY.register(Histogram(
+    'crm_serialization_duration_seconds', 'Time spent converting rows to response bodies.',
+    ('endpoint',), SQL_BUCKETS))
+COMPRESSION_DURATION = REGISTRY.register(Histogram(
+    'crm_compression_duration_seconds', 'Time spent gzip-encoding response bodies.', ('endpoint',), SQL_BUCKETS))
+COMPRESSION_BYTES = REGISTRY.register(Counter(
+    'crm_compression_bytes_total', 'Response body bytes before (in) and after (out) gzip.', ('endpoint', 'direction')))
+BCRYPT_DURATION = REGISTRY.register(Histogram(
+    'crm_bcrypt_duration_seconds', 'bcrypt work per operation.', ('operation',)))
+BCRYPT_QUEUE_WAIT = REGISTRY.register(Histogram(
+    'crm_bcrypt_queue_wait_seconds', 'Time bcrypt jobs waited for a pool thread.', ('operation',)))
+
+# Endpoint label for work outside a Flask request context, set by the async views
+ENDPOINT = contextvars.ContextVar('crm_metrics_endpoint', default='background')
+
+def current_endpoint():
+    """Label for work done on behalf of the current request, or 'background'."""
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return ENDPOINT.get()
+
+@contextmanager
+def timed(histogram, *labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, *labels)
+
+def instrument_engine(engine):
+    """Count and time every SQL statement, attributed to the current endpoint."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_statement(connection, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None:
+            return
+        endpoint = current_endpoint()
+        SQL_STATEMENTS.inc(endpoint)
+        SQL_DURATION.observe(time.perf_counter() - started, endpoint)
+
+def instrument_app(app):
+    """Time every request from before_request until its body has been sent."""
+
+    @app.before_request
+    def start_request_timer():
+        request.environ['crm.metrics_started'] = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = request.environ.get('crm.metrics_started')
+        if started is not None:
+            labels = (request.endpoint or 'unmatched', request.method, str(response.status_code))
+            # Observed on close so streamed bodies are included
+            response.call_on_close(lambda: REQUEST_DURATION.observe(time.perf_counter() - started, *labels))
+        return response
@@ -0,0 +1,279 @@
+"""Versioned schema migrations for the CRM database.
+
+Migrations are registered in order with the @migration decorator and applied
+once each; the applied version is recorded in the schema_version table.
+SQLite and PostgreSQL are supported; the DDL differs only in the column
+types from SQL_TYPES, and the full-text index exists on SQLite only.
+"""
+import hashlib
+import logging
+from sqlalchemy import text
+import crm_stats
+
+# Dialects whose crm_entry writes are recorded in crm_change by triggers (migration 6)
+CHANGE_LOG_DIALECTS = ('sqlite', 'postgresql')
+
+# Column types spelled differently per dialect; pk is an auto-numbered primary key
+SQL_TYPES = {
+    'sqlite': {
+        'pk': 'INTEGER NOT NULL PRIMARY KEY',
+        'big_pk': 'INTEGER NOT NULL PRIMARY KEY',
+        'datetime': 'DATETIME',
+        'blob': 'BLOB',
+        'now': 'CURRENT_TIMESTAMP',
+    },
+    'postgresql': {
+        'pk': 'SERIAL PRIMARY KEY',
+        'big_pk': 'BIGSERIAL PRIMARY KEY',
+        'datetime': 'TIMESTAMP',
+        'blob': 'BYTEA',
+        # CURRENT_TIMESTAMP is in the session time zone; the app stores naive UTC
+        'now': "(CURRENT_TIMESTAMP AT TIME ZONE 'UTC')",
+    },
+}
+
+def sql_types(connection):
+    """Column type names for the connection's dialect (SQLite's for unknown dialects)."""
+    return SQL_TYPES.get(connection.dialect.name, SQL_TYPES['sqlite'])
+
+# Registered migrations as (version, description, function) tuples
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a migration function that receives an open connection."""
+    def decorator(func):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def current_version(connection):
+    """Return the schema version recorded in the database (0 for a fresh database)."""
+    types = sql_types(connection)
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER NOT NULL, "
+        "description VARCHAR(200), "
+        f"applied_at {types['datetime']} DEFAULT {types['now']})"
+    ))
+    version = connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+def lock_schema(connection):
+    """Block other processes from migrating until this transaction ends.
+
+    Workers started together all run upgrade(); the lock makes the second one
+    wait and then see the version the first one recorded.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_version'))"))
+    else:
+        # Any write takes SQLite's database lock, this one without changing anything
+        connection.execute(text("DELETE FROM schema_version WHERE 0 = 1"))
+
+def database_id(connection):
+    """A short id of this database, the same for every process using it.
+
+    Taken from when the first migration was applied, so a recreated database
+    gets a new one.
+    """
+    created = connection.execute(text("SELECT MIN(applied_at) FROM schema_version")).scalar()
+    return hashlib.blake2b(str(created).encode(), digest_size=4).hexdigest()
+
+def upgrade(engine):
+    """Apply all pending migrations, each in its own transaction.
+
+    Returns the list of versions that were applied.
+    """
+    with engine.begin() as connection:
+        version = current_version(connection)
+
+    applied = []
+    for migration_version, description, func in MIGRATIONS:
+        if migration_version <= version:
+            continue
+
+        with engine.begin() as connection:
+            lock_schema(connection)
+            if current_version(connection) >= migration_version:
+                # Another process applied it while this one waited for the lock
+                continue
+            func(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version, description) VALUES (:version, :description)"),
+                {'version': migration_version, 'description': description}
+            )
+
+        logging.info(f"Applied migration {migration_version}: {description}")
+        applied.append(migration_version)
+
+    return applied
+
+@migration(1, 'Create user and crm_entry tables')
+def create_base_tables(connection):
+    # IF NOT EXISTS keeps this safe for databases created by the old db.create_all()
+    types = sql_types(connection)
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS "user" ('
+        f'id {types["pk"]}, '
+        'username VARCHAR(80) NOT NULL UNIQUE, '
+        'password VARCHAR(120) NOT NULL, '
+        'email VARCHAR(120) NOT NULL UNIQUE)'
+    ))
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS crm_entry ('
+        f'id {types["pk"]}, '
+        'person_name VARCHAR(100) NOT NULL, '
+        'company_name VARCHAR(100) NOT NULL, '
+        'department VARCHAR(100), '
+        '"case" VARCHAR(200), '
+        'next_steps TEXT, '
+        'status VARCHAR(50), '
+        'description TEXT, '
+        'sale_person VARCHAR(100) NOT NULL, '
+        f'submission_time {types["datetime"]})'
+    ))
+
+@migration(2, 'Add listing indexes to crm_entry')
+def add_crm_entry_listing_indexes(connection):
+    # One index per filter combination accepted by /get_crm_entries, each ending in
+    # submission_time so the newest-first ORDER BY is read straight from the index
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_crm_entry_submission_time '
+        'ON crm_entry (submission_time)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_crm_entry_sale_person_submission_time '
+        'ON crm_entry (sale_person, submission_time)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_crm_entry_status_submission_time '
+        'ON crm_entry (status, submission_time)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_crm_entry_sale_person_status_submission_time '
+        'ON crm_entry (sale_person, status, submission_time)'
+    ))
+
+@migration(3, 'Add crm_entry_fts full-text index')
+def add_crm_entry_fts(connection):
+    # FTS5 is SQLite specific; other backends keep using the plain tables
+    if connection.dialect.name != 'sqlite':
+        return
+
+    # External-content table: the text lives in crm_entry, FTS5 only stores the index
+    connection.execute(text(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS crm_entry_fts USING fts5('
+        'description, next_steps, "case", '
+        "content='crm_entry', content_rowid='id', tokenize='porter unicode61')"
+    ))
+
+    # Keep the index current on every write to crm_entry
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS crm_entry_fts_ai AFTER INSERT ON crm_entry BEGIN '
+        'INSERT INTO crm_entry_fts (rowid, description, next_steps, "case") '
+        'VALUES (new.id, new.description, new.next_steps, new."case"); '
+        'END'
+    ))
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS crm_entry_fts_ad AFTER DELETE ON crm_entry BEGIN '
+        'INSERT INTO crm_entry_fts (crm_entry_fts, rowid, description, next_steps, "case") '
+        "VALUES ('delete', old.id, old.description, old.next_steps, old.\"case\"); "
+        'END'
+    ))
+    connection.execute(text(
+        'CREATE TRIGGER IF NOT EXISTS crm_entry_fts_au AFTER UPDATE ON crm_entry BEGIN '
+        'INSERT INTO crm_entry_fts (crm_entry_fts, rowid, description, next_steps, "case") '
+        "VALUES ('delete', old.id, old.description, old.next_steps, old.\"case\"); "
+        'INSERT INTO crm_entry_fts (rowid, description, next_steps, "case") '
+        'VALUES (new.id, new.description, new.next_steps, new."case"); '
+        'END'
+    ))
+
+    # Index the rows that existed before this migration
+    rebuild_crm_entry_fts(connection)
+
+def rebuild_crm_entry_fts(connection):
+    """Rebuild the full-text index from the current contents of crm_entry."""
+    connection.execute(text("INSERT INTO crm_entry_fts (crm_entry_fts) VALUES ('rebuild')"))
+
+@migration(4, 'Add crm_stat summary table')
+def add_crm_stat(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS crm_stat ('
+        'dimension VARCHAR(20) NOT NULL, '
+        'stat_key VARCHAR(120) NOT NULL, '
+        'count INTEGER NOT NULL DEFAULT 0, '
+        'PRIMARY KEY (dimension, stat_key))'
+    ))
+
+    # Count the entries that existed before this migration
+    crm_stats.recompute(connection)
+
+@migration(5, 'Add crm_entry_archive table')
+def add_crm_entry_archive(connection):
+    # Rows moved out of crm_entry by retention jobs, see retention.py
+    types = sql_types(connection)
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS crm_entry_archive ('
+        'id INTEGER NOT NULL PRIMARY KEY, '
+        f'submission_time {types["datetime"]}, '
+        f'archived_at {types["datetime"]} NOT NULL, '
+        f'data {types["blob"]} NOT NULL)'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_crm_entry_archive_submission_time '
+        'ON crm_entry_archive (submission_time)'
+    ))
+
+@migration(6, 'Add crm_change log for incremental sync')
+def add_crm_change(connection):
+    types = sql_types(connection)
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS crm_change ('
+        f'seq {types["big_pk"]}, '
+        'entry_id INTEGER NOT NULL, '
+        'op VARCHAR(10) NOT NULL, '
+        f'changed_at {types["datetime"]} NOT NULL DEFAULT {types["now"]})'
+    ))
+    connection.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_crm_change_changed_at ON crm_change (changed_at)'
+    ))
+
+    if connection.dialect.name == 'postgresql':
+        add_crm_change_postgresql_trigger(connection)
+        return
+    if connection.dialect.name != 'sqlite':
+        return
+
+    # Record every write to crm_entry, whichever code path made it (see change_feed.py)
+    for op, event, row in (('insert', 'INSERT', 'new'), ('update', 'UPDATE', 'new'), ('delete', 'DELETE', 'old')):
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS crm_entry_change_{op} AFTER {event} ON crm_entry BEGIN '
+            f"INSERT INTO crm_change (entry_id, op) VALUES ({row}.id, '{op}'); "
+            'END'
+        ))
+
+def add_crm_change_postgresql_trigger(connection):
+    # A sequence hands out seq when the row is inserted, not when it commits, so
+    # a reader could see seq 11 before seq 10 commits and move its cursor past
+    # 10. The lock, held until commit, keeps seq order and commit order the same;
+    # group commit already funnels entry writes through one thread per process.
+    connection.execute(text(
+        'CREATE OR REPLACE FUNCTION crm_entry_change() RETURNS trigger AS $$ '
+        'BEGIN '
+        "PERFORM pg_advisory_xact_lock(hashtext('crm_change')); "
+        "IF TG_OP = 'DELETE' THEN "
+        "INSERT INTO crm_change (entry_id, op) VALUES (OLD.id, 'delete'); "
+        'ELSE '
+        'INSERT INTO crm_change (entry_id, op) VALUES (NEW.id, lower(TG_OP)); '
+        'END IF; '
+        'RETURN NULL; '
+        'END; $$ LANGUAGE plpgsql'
+    ))
+    connection.execute(text('DROP TRIGGER IF EXISTS crm_entry_change ON crm_entry'))
+    connection.execute(text(
+        'CREATE TRIGGER crm_entry_change AFTER INSERT OR UPDATE OR DELETE ON crm_entry '
+        'FOR EACH ROW EXECUTE FUNCTION crm_entry_change()'
+    ))
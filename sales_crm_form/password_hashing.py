@@ -0,0 +1,99 @@
+"""Bounded executor for bcrypt password hashing and verification.
+
+bcrypt releases the GIL, so running it on a small dedicated pool caps how many
+cores a login burst can take while request threads for other endpoints keep
+running. Admission is bounded: when the pool and its queue are full, or a task
+waited longer than the queue timeout, PasswordHashingOverloaded is raised so
+the endpoint can answer 503 immediately instead of stalling.
+
+Bulk imports hash through hash_many() instead, on threads of their own
+started for the call, so an import neither waits behind logins nor fills
+their queue.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# bcrypt's limit; longer passwords are rejected unless BCRYPT_HANDLE_LONG_PASSWORDS pre-hashes them
+MAX_PASSWORD_BYTES = 72
+
+class PasswordHashingOverloaded(Exception):
+    """Raised when the hashing pool cannot take more work in time."""
+
+class PasswordHasher:
+    def __init__(self, bcrypt, max_concurrency=2, max_queue=32, queue_timeout=2.0):
+        self.bcrypt = bcrypt
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        # Running plus waiting tasks; acquiring never blocks so overload fails fast
+        self._slots = threading.BoundedSemaphore(max_concurrency + max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='bcrypt')
+
+    @property
+    def log_rounds(self):
+        return self.bcrypt._log_rounds
+
+    def _run(self, operation, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingOverloaded('Password hashing queue is full')
+
+        submitted = time.monotonic()
+        started = threading.Event()
+
+        def task():
+            started.set()
+            waited = time.monotonic() - submitted
+            metrics.BCRYPT_QUEUE_WAIT.observe(waited, operation)
+            # Skip work whose caller has given up waiting in the queue
+            if waited > self.queue_timeout:
+                raise PasswordHashingOverloaded('Timed out waiting for password hashing')
+            with metrics.timed(metrics.BCRYPT_DURATION, operation):
+                return func(*args)
+
+        try:
+            future = self._executor.submit(task)
+            # Only the wait in the queue is bounded; a started hash runs to completion
+            if not started.wait(self.queue_timeout) and future.cancel():
+                raise PasswordHashingOverloaded('Timed out waiting for password hashing')
+            return future.result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Return a bcrypt hash of password using the configured work factor."""
+        return self._run('hash', self.bcrypt.generate_password_hash, password).decode('utf-8')
+
+    def hash_many(self, passwords, workers=None):
+        """Return bcrypt hashes of passwords, in order, computed on up to workers threads.
+
+        As bcrypt releases the GIL, workers (default: one per core) hashes run
+        in parallel; a process pool would only add start-up and pickling.
+        """
+        passwords = list(passwords)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(passwords)))
+        generate = self.bcrypt.generate_password_hash
+        if workers == 1:
+            return [generate(password).decode('utf-8') for password in passwords]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt-bulk') as executor:
+            return [pw_hash.decode('utf-8') for pw_hash in executor.map(generate, passwords)]
+
+    def password_error(self, password):
+        """Why password cannot be hashed, or None."""
+        if not isinstance(password, str) or not password:
+            return 'Password must be a non-empty string'
+        if not self.bcrypt._handle_long_passwords and len(password.encode('utf-8')) > MAX_PASSWORD_BYTES:
+            return f'Password must be at most {MAX_PASSWORD_BYTES} bytes'
+        return None
+
+    def verify(self, pw_hash, password):
+        """Check password against a stored bcrypt hash."""
+        return self._run('verify', self.bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """True if pw_hash was created with a different work factor than the configured one."""
+        try:
+            return int(pw_hash.split('$')[2]) != self.log_rounds
+        except (IndexError, ValueError):
+            return False
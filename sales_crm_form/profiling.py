@@ -0,0 +1,259 @@
+"""Opt-in request profiler and slow-query log.
+
+Both are off by default and install no hooks at all unless configured:
+
+    PROFILE_ENDPOINTS=get_crm_entries,submit_crm   profile these endpoints (* for all)
+    PROFILE_SAMPLE_RATE=0.1                        fraction of those requests profiled
+    PROFILE_TOKEN=...                              profile any request sent with X-Profile-Token: <token>
+    PROFILE_MODE=cprofile|sample                   deterministic cProfile, or a stack sampler
+    PROFILE_DIR=profiles                           where the profiles are written
+    SLOW_QUERY_MS=100                              log SQL statements slower than this
+
+cProfile profiles are written as .prof files (python -m pstats, snakeviz). The
+sampler writes collapsed stacks as .folded files (flamegraph.pl, speedscope);
+it only looks at the request thread every PROFILE_SAMPLE_INTERVAL seconds, so
+it barely slows the request down, at the price of missing short calls. A
+request is profiled until its body has been sent, so streamed listings and
+exports are included.
+
+Slow statements are logged with their duration, originating endpoint and
+query plan (EXPLAIN QUERY PLAN on SQLite, EXPLAIN elsewhere). Parameters are
+never logged, since they hold customer data and password hashes.
+"""
+import cProfile
+import hmac
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import request
+from sqlalchemy import event
+import metrics
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# Statements worth explaining; EXPLAIN does not run them
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+slow_query_logger = logging.getLogger('slow_query')
+
+SLOW_QUERIES = metrics.REGISTRY.register(metrics.Counter(
+    'crm_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS, by originating endpoint.', ('endpoint',)))
+
+def parse_endpoints(value):
+    """Parse PROFILE_ENDPOINTS into a set of endpoint names; '*' matches every endpoint."""
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+class StackSampler:
+    """Records the stacks of registered threads every interval seconds.
+
+    One background thread serves every profiled request; it sleeps while no
+    thread is registered and is started lazily (again after a fork).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._targets = {}
+        self._condition = threading.Condition()
+        self._pid = None
+
+    def start(self, thread_id):
+        """Begin sampling a thread; returns the Counter of its collapsed stacks."""
+        stacks = Counter()
+        with self._condition:
+            if self._pid != os.getpid():
+                # A thread started in the parent does not exist after a fork
+                self._targets = {}
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='profile-sampler', daemon=True).start()
+            self._targets[thread_id] = stacks
+            self._condition.notify()
+        return stacks
+
+    def stop(self, thread_id):
+        with self._condition:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._targets:
+                    self._condition.wait()
+                targets = dict(self._targets)
+            frames = sys._current_frames()
+            for thread_id, stacks in targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[collapse_stack(frame)] += 1
+            time.sleep(self.interval)
+
+def collapse_stack(frame):
+    """Format a stack as 'outer;...;inner', the collapsed format of flame graph tools."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class RequestProfiler:
+    """Profiles selected Flask requests and writes one file per request."""
+
+    def __init__(self, directory, endpoints=(), sample_rate=1.0, token=None, mode='cprofile', interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"PROFILE_MODE must be one of {', '.join(PROFILE_MODES)}")
+        self.directory = directory
+        self.endpoints = set(endpoints)
+        self.sample_rate = sample_rate
+        self.token = token
+        self.mode = mode
+        self.sampler = StackSampler(interval) if mode == 'sample' else None
+        self._sequence = itertools.count(1)
+
+    @property
+    def enabled(self):
+        return bool(self.endpoints or self.token)
+
+    def wants(self, endpoint, header_token):
+        """Whether to profile a request to endpoint that carried header_token (or None)."""
+        if header_token and self.token and hmac.compare_digest(header_token, self.token):
+            return True
+        if endpoint in self.endpoints or '*' in self.endpoints:
+            return self.sample_rate >= 1 or random.random() < self.sample_rate
+        return False
+
+    def file_path(self, endpoint):
+        extension = 'prof' if self.mode == 'cprofile' else 'folded'
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint or 'unmatched'}-{os.getpid()}-{next(self._sequence)}.{extension}"
+        return os.path.join(self.directory, name)
+
+    def start(self):
+        """Start profiling the current thread; returns a stop(path) function, or None if busy."""
+        if self.mode == 'sample':
+            thread_id = threading.get_ident()
+            self.sampler.start(thread_id)
+            return lambda path: self.write_stacks(path, self.sampler.stop(thread_id))
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; this request goes unprofiled
+            return None
+
+        def stop(path):
+            profile.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(path)
+        return stop
+
+    def write_stacks(self, path, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, 'w') as output:
+            for stack, count in stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+    def init_app(self, app):
+        """Register the request hooks; does nothing when profiling is not configured."""
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_profile():
+            if not self.wants(request.endpoint, request.headers.get('X-Profile-Token')):
+                return
+            stop = self.start()
+            if stop is not None:
+                request.environ['crm.profile'] = (stop, self.file_path(request.endpoint))
+
+        @app.after_request
+        def finish_profile(response):
+            profile = request.environ.pop('crm.profile', None)
+            if profile is None:
+                return response
+            stop, path = profile
+            if request.headers.get('X-Profile-Token'):
+                response.headers['X-Profile-File'] = os.path.basename(path)
+
+            def write_profile():
+                try:
+                    stop(path)
+                except OSError as e:
+                    logging.error(f"Could not write profile {path}: {str(e)}")
+            # Stopped on close so streamed bodies are included
+            response.call_on_close(write_profile)
+            return response
+
+class SlowQueryLog:
+    """Logs SQL statements slower than threshold seconds, with their query plan."""
+
+    def __init__(self, threshold, max_plans=256):
+        self.threshold = threshold
+        self.max_plans = max_plans
+        # Plans by statement text, so a statement that is slow in a loop is explained once
+        self._plans = {}
+
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def start_slow_query_timer(connection, cursor, statement, parameters, context, executemany):
+            context._slow_query_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def check_slow_query(connection, cursor, statement, parameters, context, executemany):
+            started = getattr(context, '_slow_query_started', None)
+            if started is None:
+                return
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self.record(connection, statement, parameters, executemany, duration)
+
+    def record(self, connection, statement, parameters, executemany, duration):
+        endpoint = metrics.current_endpoint()
+        SLOW_QUERIES.inc(endpoint)
+        plan = None if executemany else self.query_plan(connection, statement, parameters)
+        slow_query_logger.warning(
+            f"Slow query ({duration * 1000:.1f} ms) in {endpoint}: {' '.join(statement.split())}"
+            + (f" | plan: {' / '.join(plan)}" if plan else ''),
+            extra={'endpoint': endpoint, 'duration_ms': round(duration * 1000, 3), 'query_plan': plan}
+        )
+
+    def query_plan(self, connection, statement, parameters):
+        """The plan lines for statement, or None for statements that cannot be explained."""
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+        plan = self._plans.get(statement)
+        if plan is not None:
+            return plan
+
+        sqlite = connection.dialect.name == 'sqlite'
+        explain_cursor = None
+        try:
+            # A second cursor on the same connection, so the statement's own results stay unread
+            explain_cursor = connection.connection.cursor()
+            if not sqlite:
+                # An error would otherwise abort the request's transaction on PostgreSQL
+                explain_cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                explain_cursor.execute(('EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN ') + statement, parameters)
+                # SQLite rows are (id, parent, notused, detail); PostgreSQL returns one text column
+                plan = [row[-1] if sqlite else row[0] for row in explain_cursor.fetchall()]
+            except Exception:
+                if not sqlite:
+                    explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                raise
+            if not sqlite:
+                explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        except Exception as e:
+            return [f"EXPLAIN failed: {str(e)}"]
+        finally:
+            if explain_cursor is not None:
+                explain_cursor.close()
+
+        if len(self._plans) >= self.max_plans:
+            self._plans.clear()
+        self._plans[statement] = plan
+        return plan
@@ -0,0 +1,198 @@
+"""Chunked retention and archival of CRM entries.
+
+Entries matching a RetentionPolicy (submitted before a cutoff, optionally
+only with some statuses) are deleted, or moved into the crm_entry_archive
+table as zlib-compressed JSON, batch_size rows per transaction. Each
+transaction holds the SQLite write lock for one batch only, and the job
+pauses between batches so /submit_crm writers waiting on the busy timeout get
+their turn. Afterwards the freed pages are returned to the filesystem with
+PRAGMA incremental_vacuum in small steps.
+"""
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, Table, func, insert, select
+import crm_stats
+import json_encoding
+
+metadata = MetaData()
+
+# Archived entries: the full row as zlib-compressed JSON, with its id and submission time kept for lookups
+crm_entry_archive = Table(
+    'crm_entry_archive', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('submission_time', DateTime),
+    Column('archived_at', DateTime, nullable=False),
+    Column('data', LargeBinary, nullable=False),
+)
+
+# older_than: datetime cutoff or None for any age; statuses: tuple or None for any status
+RetentionPolicy = namedtuple('RetentionPolicy', 'older_than statuses archive')
+
+def encode_archived_row(row):
+    return zlib.compress(json_encoding.dumps(row))
+
+def decode_archived_row(data):
+    return json.loads(zlib.decompress(data))
+
+class RetentionJob:
+    """Apply a policy to crm_entry in short transactions and report progress.
+
+    Only rows that exist when the job starts are considered, so a job never
+    chases rows inserted while it runs. on_batch is called after every
+    committed batch, e.g. to invalidate listing caches; before_vacuum runs once
+    the rows are processed, e.g. to prune other tables first.
+    """
+
+    def __init__(self, engine, table, policy, batch_size=1000, pause=0.05, vacuum_pages=1000, on_batch=None,
+                 before_vacuum=None):
+        self.engine = engine
+        self.table = table
+        self.policy = policy
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.on_batch = on_batch
+        self.before_vacuum = before_vacuum
+        self.progress = {
+            'state': 'pending',
+            'policy': {
+                'older_than': policy.older_than.isoformat() if policy.older_than else None,
+                'statuses': list(policy.statuses) if policy.statuses else None,
+                'archive': policy.archive,
+            },
+            'matched': None,
+            'processed': 0,
+            'batches': 0,
+            'vacuumed_pages': 0,
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+        }
+
+    def conditions(self, max_id):
+        table = self.table
+        conditions = [table.c.id <= max_id]
+        if self.policy.older_than is not None:
+            conditions.append(table.c.submission_time < self.policy.older_than)
+        if self.policy.statuses:
+            conditions.append(table.c.status.in_(self.policy.statuses))
+        return conditions
+
+    def count(self):
+        """Rows the policy matches right now, e.g. for a dry run."""
+        with self.engine.connect() as connection:
+            max_id = connection.execute(select(func.max(self.table.c.id))).scalar()
+            if max_id is None:
+                return 0
+            return connection.execute(
+                select(func.count()).select_from(self.table).where(*self.conditions(max_id))).scalar()
+
+    def run(self):
+        """Process every matching row, then vacuum; returns the progress dict."""
+        self.progress.update(state='running', started_at=datetime.utcnow().isoformat())
+        try:
+            with self.engine.connect() as connection:
+                max_id = connection.execute(select(func.max(self.table.c.id))).scalar()
+                if max_id is not None:
+                    conditions = self.conditions(max_id)
+                    self.progress['matched'] = connection.execute(
+                        select(func.count()).select_from(self.table).where(*conditions)).scalar()
+            if max_id is not None:
+                self.process(conditions)
+            if self.before_vacuum is not None:
+                self.before_vacuum()
+            self.progress['state'] = 'vacuuming'
+            self.progress['vacuumed_pages'] = incremental_vacuum(self.engine, self.vacuum_pages, self.pause)
+            self.progress['state'] = 'done'
+        except Exception as e:
+            logging.error(f"Retention job failed: {str(e)}", exc_info=True)
+            self.progress.update(state='failed', error=str(e))
+        self.progress['finished_at'] = datetime.utcnow().isoformat()
+        return self.progress
+
+    def process(self, conditions):
+        table = self.table
+        last_id = 0
+        while True:
+            # Keyset on id: each batch starts where the previous one ended instead of rescanning
+            batch = (select(table.c.id).where(table.c.id > last_id, *conditions)
+                     .order_by(table.c.id).limit(self.batch_size))
+            with self.engine.begin() as connection:
+                # The DELETE comes first so the transaction takes the write lock through the busy
+                # timeout; a read-then-write transaction could fail on a concurrent commit instead
+                rows = connection.execute(
+                    table.delete().where(table.c.id.in_(batch)).returning(*table.c)
+                ).mappings().all()
+                if not rows:
+                    return
+                if self.policy.archive:
+                    archived_at = datetime.utcnow()
+                    connection.execute(insert(crm_entry_archive), [
+                        {'id': row['id'], 'submission_time': row['submission_time'],
+                         'archived_at': archived_at, 'data': encode_archived_row(dict(row))}
+                        for row in rows
+                    ])
+                crm_stats.record_entries(connection, rows, sign=-1)
+
+            last_id = max(row['id'] for row in rows)
+            self.progress['processed'] += len(rows)
+            self.progress['batches'] += 1
+            if self.on_batch is not None:
+                self.on_batch()
+            logging.info(f"Retention batch {self.progress['batches']}: "
+                         f"{self.progress['processed']}/{self.progress['matched']} entries")
+            if len(rows) < self.batch_size:
+                return
+            # Give queued writers the lock before the next batch
+            time.sleep(self.pause)
+
+def incremental_vacuum(engine, step_pages=1000, pause=0.05):
+    """Release free pages to the filesystem, step_pages per write transaction.
+
+    Needs PRAGMA auto_vacuum=INCREMENTAL, which a database only gets when it
+    is created with it or after a full VACUUM; returns 0 otherwise.
+    """
+    if engine.dialect.name != 'sqlite':
+        return 0
+    released = 0
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        while True:
+            free_pages = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free_pages:
+                break
+            # executescript steps the pragma to completion; execute() frees a single page
+            connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({int(step_pages)});')
+            released += min(free_pages, step_pages)
+            time.sleep(pause)
+        cursor.close()
+    finally:
+        connection.close()
+    return released
+
+class RetentionRunner:
+    """Runs one retention job at a time on a background thread."""
+
+    def __init__(self):
+        self.job = None
+        self._lock = threading.Lock()
+
+    def start(self, job):
+        """Start job unless another one is running; returns False if busy."""
+        with self._lock:
+            if self.job is not None and self.job.progress['state'] in ('pending', 'running', 'vacuuming'):
+                return False
+            self.job = job
+        threading.Thread(target=job.run, name='crm-retention', daemon=True).start()
+        return True
+
+    def status(self):
+        return self.job.progress if self.job is not None else None
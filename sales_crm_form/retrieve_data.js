@@ -98,6 +98,17 @@ document.addEventListener('DOMContentLoaded', function() {
         return null;
     }
 
+    // Listing URL and change cursor of the last successful fetch, for live updates
+    let lastListingUrl = null;
+    let lastChangeCursor = null;
+    let lastStreamAvailable = false;
+    let liveFeed = null;
+    let pollTimer = null;
+    let liveGeneration = 0;  // Bumped by stopLiveUpdates, so a poll in flight does not reschedule itself
+
+    // Without the server-sent stream, fetch since= deltas this often
+    const CHANGE_POLL_INTERVAL_MS = 30000;
+
     // Function to fetch CRM entries with enhanced authentication handling
     async function fetchCRMEntries(salePerson = '', status = '') {
         // Determine possible endpoints
@@ -139,6 +150,27 @@ document.addEventListener('DOMContentLoaded', function() {
                     headers['Authorization'] = `Bearer ${authToken}`;
                 }
 
+                // Take a change cursor before the listing, so no change in between is missed
+                let changeCursor = null;
+                let streamAvailable = false;
+                try {
+                    const cursorUrl = new URL(url);
+                    cursorUrl.searchParams.set('since', 'latest');
+                    const cursorResponse = await fetch(cursorUrl, {
+                        method: 'GET',
+                        credentials: 'include',
+                        headers: headers
+                    });
+                    if (cursorResponse.ok) {
+                        const cursorData = await cursorResponse.json();
+                        changeCursor = cursorData.cursor;
+                        // Only servers that can hold many open streams offer one; the others are polled
+                        streamAvailable = cursorData.stream === true;
+                    }
+                } catch (cursorError) {
+                    debugLog('Change cursor unavailable:', cursorError);
+                }
+
                 const response = await fetch(url, {
                     method: 'GET',
                     credentials: 'include', // Important for maintaining session
@@ -201,6 +233,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
 
                 debugLog('Retrieved CRM Entries:', data);
+                lastListingUrl = url;
+                lastChangeCursor = changeCursor;
+                lastStreamAvailable = streamAvailable;
                 return data;
             } catch (error) {
                 // Check for specific authentication errors
@@ -220,6 +255,138 @@ document.addEventListener('DOMContentLoaded', function() {
         return [];
     }
 
+    // Fill a table row with an entry's cells
+    function fillRow(row, entry) {
+        row.dataset.entryId = entry.id;
+        row.insertCell(0).textContent = entry.id;
+        row.insertCell(1).textContent = entry.person_name;
+        row.insertCell(2).textContent = entry.company_name;
+        row.insertCell(3).textContent = entry.department || '';
+        row.insertCell(4).textContent = entry.case || '';
+        row.insertCell(5).textContent = entry.next_steps || '';
+        row.insertCell(6).textContent = entry.status;
+        row.insertCell(7).textContent = entry.description || '';
+        row.insertCell(8).textContent = entry.sale_person;
+        row.insertCell(9).textContent = new Date(entry.submission_time).toLocaleString();
+    }
+
+    // Apply a change event to the table: drop deleted rows, update or prepend changed ones
+    function applyChanges(delta) {
+        if (!crmDataBody) {
+            return;
+        }
+        debugLog('Applying changes:', delta);
+
+        delta.deleted.forEach(id => {
+            const row = crmDataBody.querySelector(`tr[data-entry-id="${id}"]`);
+            if (row) {
+                row.remove();
+            }
+        });
+
+        // Entries arrive newest first; insert oldest first so the newest ends up on top
+        delta.entries.slice().reverse().forEach(entry => {
+            let row = crmDataBody.querySelector(`tr[data-entry-id="${entry.id}"]`);
+            if (row) {
+                row.innerHTML = '';
+            } else {
+                const placeholder = crmDataBody.querySelector('tr[data-placeholder]');
+                if (placeholder) {
+                    placeholder.remove();
+                }
+                row = crmDataBody.insertRow(0);
+            }
+            fillRow(row, entry);
+        });
+    }
+
+    function stopLiveUpdates() {
+        liveGeneration++;
+        if (liveFeed) {
+            liveFeed.close();
+            liveFeed = null;
+        }
+        if (pollTimer !== null) {
+            clearTimeout(pollTimer);
+            pollTimer = null;
+        }
+    }
+
+    // Fetch the changes after the cursor and schedule the next poll
+    async function pollChanges() {
+        pollTimer = null;
+        const generation = liveGeneration;
+        const deltaUrl = new URL(lastListingUrl);
+        deltaUrl.searchParams.set('since', lastChangeCursor);
+        const headers = { 'Accept': 'application/json' };
+        const authToken = getAuthToken();
+        if (authToken) {
+            headers['Authorization'] = `Bearer ${authToken}`;
+        }
+        let delay = CHANGE_POLL_INTERVAL_MS;
+        try {
+            const response = await fetch(deltaUrl, {
+                method: 'GET',
+                credentials: 'include',
+                headers: headers
+            });
+            if (response.status === 410) {
+                debugLog('Change cursor expired, live updates stopped');
+                return;
+            }
+            if (response.ok) {
+                const delta = await response.json();
+                if (generation !== liveGeneration) {
+                    return;
+                }
+                applyChanges(delta);
+                lastChangeCursor = delta.cursor;
+                if (delta.has_more) {
+                    delay = 0;
+                }
+            } else {
+                debugLog('Polling for changes failed:', response.status);
+            }
+        } catch (error) {
+            debugLog('Polling for changes failed:', error);
+        }
+        if (generation === liveGeneration) {
+            pollTimer = setTimeout(pollChanges, delay);
+        }
+    }
+
+    // Keep the table current from the change feed instead of re-downloading it
+    function startLiveUpdates() {
+        stopLiveUpdates();
+        if (!lastListingUrl || lastChangeCursor === null) {
+            return;
+        }
+        if (!lastStreamAvailable || !window.EventSource) {
+            debugLog('Polling for changes every', CHANGE_POLL_INTERVAL_MS, 'ms');
+            pollTimer = setTimeout(pollChanges, CHANGE_POLL_INTERVAL_MS);
+            return;
+        }
+
+        const streamUrl = new URL(lastListingUrl);
+        streamUrl.pathname = streamUrl.pathname.replace(/get_crm_entries$/, 'crm_entries/stream');
+        streamUrl.searchParams.set('since', lastChangeCursor);
+        debugLog('Subscribing to changes:', streamUrl.toString());
+
+        liveFeed = new EventSource(streamUrl, { withCredentials: true });
+        liveFeed.addEventListener('changes', event => applyChanges(JSON.parse(event.data)));
+        liveFeed.addEventListener('expired', () => {
+            debugLog('Change cursor expired, live updates stopped');
+            stopLiveUpdates();
+        });
+        liveFeed.onerror = () => {
+            // EventSource reconnects by itself unless the server refused the stream
+            if (liveFeed && liveFeed.readyState === EventSource.CLOSED) {
+                debugLog('Live updates unavailable');
+                stopLiveUpdates();
+            }
+        };
+    }
+
     // Function to populate table
     function populateTable(entries) {
         debugLog('Populating table with entries:', entries);
@@ -236,6 +403,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Populate table with fetched entries
         if (!entries || entries.length === 0) {
             const row = crmDataBody.insertRow();
+            row.dataset.placeholder = 'true';
             const cell = row.insertCell(0);
             cell.colSpan = 10;
             cell.textContent = 'No entries found.';
@@ -244,17 +412,7 @@ document.addEventListener('DOMContentLoaded', function() {
             debugLog('No entries to display');
         } else {
             entries.forEach(entry => {
-                const row = crmDataBody.insertRow();
-                row.insertCell(0).textContent = entry.id;
-                row.insertCell(1).textContent = entry.person_name;
-                row.insertCell(2).textContent = entry.company_name;
-                row.insertCell(3).textContent = entry.department || '';
-                row.insertCell(4).textContent = entry.case || '';
-                row.insertCell(5).textContent = entry.next_steps || '';
-                row.insertCell(6).textContent = entry.status;
-                row.insertCell(7).textContent = entry.description || '';
-                row.insertCell(8).textContent = entry.sale_person;
-                row.insertCell(9).textContent = new Date(entry.submission_time).toLocaleString();
+                fillRow(crmDataBody.insertRow(), entry);
             });
             debugLog(`Displayed ${entries.length} entries`);
         }
@@ -265,6 +423,7 @@ document.addEventListener('DOMContentLoaded', function() {
         debugLog('Retrieve All Data button clicked');
         const entries = await fetchCRMEntries();
         populateTable(entries);
+        startLiveUpdates();
     });
 
     // Retrieve Filtered Data
@@ -284,11 +443,13 @@ document.addEventListener('DOMContentLoaded', function() {
         // Fetch and populate entries
         const entries = await fetchCRMEntries(salePerson);
         populateTable(entries);
+        startLiveUpdates();
     });
 
     // Clear All Data
     clearDataBtn.addEventListener('click', () => {
         debugLog('Clear Data button clicked');
+        stopLiveUpdates();
         if (crmDataBody) {
             crmDataBody.innerHTML = '';
         }
@@ -88,6 +88,55 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Suggest names already in the CRM while typing (see /autocomplete)
+    function attachAutocomplete(input, field) {
+        const datalist = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+        let latestQuery = '';
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (!query) {
+                datalist.innerHTML = '';
+                return;
+            }
+
+            // Wait for a pause in typing instead of sending every keystroke
+            timer = setTimeout(async function() {
+                latestQuery = query;
+                try {
+                    const params = new URLSearchParams({ field: field, q: query, limit: 8 });
+                    const response = await fetch(`/autocomplete?${params}`, {
+                        credentials: 'same-origin',
+                        headers: { 'Accept': 'application/json' }
+                    });
+                    if (!response.ok) {
+                        return;
+                    }
+                    const result = await response.json();
+
+                    // Drop answers that arrive after a newer query was sent
+                    if (query !== latestQuery) {
+                        return;
+                    }
+                    datalist.innerHTML = '';
+                    result.suggestions.forEach(function(suggestion) {
+                        const option = document.createElement('option');
+                        option.value = suggestion.value;
+                        datalist.appendChild(option);
+                    });
+                } catch (error) {
+                    // Suggestions are optional; the form works without them
+                    console.error('Autocomplete error:', error);
+                }
+            }, 150);
+        });
+    }
+
+    attachAutocomplete(document.getElementById('personName'), 'person_name');
+    attachAutocomplete(document.getElementById('companyName'), 'company_name');
+
     // Comprehensive login function with multiple fallback strategies
     const performLogin = async (loginData, fallbackNextPage = '/retrieve_data.html') => {
         // Logging utility
@@ -0,0 +1,64 @@
+"""Signing keys shared by every worker, with rotation.
+
+Session cookies and the bearer tokens from /login are signed with
+SECRET_KEY. For several workers or nodes to accept each other's sessions,
+the key has to come from the environment (SECRET_KEY, or SECRET_KEY_FILE for
+a mounted secret) instead of being drawn per process.
+
+To rotate, make the new key SECRET_KEY and move the old one to
+SECRET_KEY_FALLBACKS (comma-separated, or SECRET_KEY_FALLBACKS_FILE with one
+key per line). New sessions and tokens are signed with SECRET_KEY only, while
+ones signed with a fallback key stay valid; drop the fallback once they have
+expired.
+"""
+import os
+import jwt
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import URLSafeTimedSerializer
+
+def read_secret(environ, name):
+    """Return environ[name], or the stripped contents of the file named by name_FILE, or None."""
+    value = environ.get(name)
+    if value:
+        return value
+    path = environ.get(name + '_FILE')
+    if path:
+        with open(path) as secret_file:
+            return secret_file.read().strip() or None
+    return None
+
+def load_keys(environ=os.environ):
+    """Return (secret_key, fallbacks, generated); the key is random for this process if none is configured."""
+    secret_key = read_secret(environ, 'SECRET_KEY')
+    fallbacks = read_secret(environ, 'SECRET_KEY_FALLBACKS') or ''
+    fallbacks = [key.strip() for key in fallbacks.replace('\n', ',').split(',') if key.strip()]
+    if secret_key is None:
+        return os.urandom(32), fallbacks, True
+    return secret_key, fallbacks, False
+
+def verification_keys(app):
+    """Every key a signature may have been made with, the current one first."""
+    return [app.secret_key] + list(app.config.get('SECRET_KEY_FALLBACKS') or ())
+
+class RotatingSessionInterface(SecureCookieSessionInterface):
+    """Session cookies signed with SECRET_KEY and still accepted if signed with a fallback key."""
+
+    def get_signing_serializer(self, app):
+        if not app.secret_key:
+            return None
+        # itsdangerous signs with the last key of a list and verifies against all of them
+        return URLSafeTimedSerializer(
+            list(reversed(verification_keys(app))),
+            salt=self.salt,
+            serializer=self.serializer,
+            signer_kwargs={'key_derivation': self.key_derivation, 'digest_method': self.digest_method}
+        )
+
+def decode_token(token, keys, algorithms=('HS256',)):
+    """Verify a JWT against each key in turn; raises jwt.InvalidTokenError if none matches."""
+    for key in keys[:-1]:
+        try:
+            return jwt.decode(token, key, algorithms=list(algorithms))
+        except jwt.InvalidSignatureError:
+            continue
+    return jwt.decode(token, keys[-1], algorithms=list(algorithms))
@@ -0,0 +1,392 @@
+"""In-memory columnar index of CRM entry metadata for filtered listings.
+
+SnapshotIndex keeps the id, submission_time and the interned sale_person,
+status and company_name codes of every entry in parallel arrays ordered by
+(submission_time, id), with a posting list of row positions per sale person
+and per status. A filtered, newest-first page of ids, or a count, is then
+answered from memory; SQLite only reads the requested columns of the rows on
+the page.
+
+The index is built on a background thread on first use and follows the
+crm_change log (see change_feed.py) before every read, so writes made by
+other processes or code paths are applied too. An entry that does not sort
+after the newest row is kept in a small sorted overlay, and a deleted row is
+only flagged dead, until the index is rebuilt. While the index is missing or
+too far behind, page() and count() return None and the caller reads SQLite.
+"""
+import bisect
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from itertools import islice
+from sqlalchemy import select
+import change_feed
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+MISSING_TIME = -2 ** 63  # NULL submission_time sorts first, as in SQLite
+
+CHANGE_BATCH_SIZE = 1000  # Change log rows applied per read
+
+# Columns kept in memory; a listing of only these needs no database read
+INDEXED_FIELDS = ('id', 'submission_time', 'sale_person', 'status', 'company_name')
+IndexedEntry = namedtuple('IndexedEntry', INDEXED_FIELDS)
+
+def time_key(value):
+    """submission_time as integer microseconds since the epoch."""
+    if value is None:
+        return MISSING_TIME
+    return (value - EPOCH) // ONE_MICROSECOND
+
+def time_value(key):
+    return None if key == MISSING_TIME else EPOCH + timedelta(microseconds=key)
+
+class KeyView:
+    """Read-only view of key(item) for each item of items, to bisect on before Python 3.10 added key=."""
+
+    def __init__(self, items, key):
+        self.items = items
+        self.key = key
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.key(self.items[index])
+
+class Interner:
+    """Maps strings to small integer codes; code 0 is None."""
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        """The code of value, or None if no entry has it."""
+        return self.codes.get(value)
+
+class Columns:
+    """One generation of the index: the arrays, posting lists, overlay and live counts."""
+
+    def __init__(self):
+        self.sale_person_codes = Interner()
+        self.status_codes = Interner()
+        self.company_codes = Interner()
+        self.times = array('q')
+        self.ids = array('q')
+        self.sale_persons = array('I')
+        self.statuses = array('I')
+        self.companies = array('I')
+        self.alive = bytearray()
+        self.by_sale_person = {}
+        self.by_status = {}
+        self.by_id = array('I')  # Positions in id order, to find a row to delete
+        self.pending = []  # Sorted (time, id, sale_person, status, company) rows that arrived out of order
+        self.pending_by_id = {}
+        self.live = 0
+        self.live_by_sale_person = Counter()
+        self.live_by_status = Counter()
+        self.live_by_pair = Counter()  # (sale_person, status) codes, so two-filter counts need no scan
+
+    def key(self, position):
+        return (self.times[position], self.ids[position])
+
+    def encode(self, entry_id, submission_time, sale_person, status, company_name):
+        return (time_key(submission_time), entry_id, self.sale_person_codes.code(sale_person),
+                self.status_codes.code(status), self.company_codes.code(company_name))
+
+    def append(self, row):
+        """Add a row that sorts after every row in the arrays."""
+        time_value, entry_id, sale_person, status, company = row
+        position = len(self.ids)
+        self.times.append(time_value)
+        self.ids.append(entry_id)
+        self.sale_persons.append(sale_person)
+        self.statuses.append(status)
+        self.companies.append(company)
+        self.alive.append(1)
+        self.by_sale_person.setdefault(sale_person, array('I')).append(position)
+        self.by_status.setdefault(status, array('I')).append(position)
+        self.live += 1
+        self.live_by_sale_person[sale_person] += 1
+        self.live_by_status[status] += 1
+        self.live_by_pair[sale_person, status] += 1
+        return position
+
+    def add(self, row):
+        if self.ids and row[:2] <= self.key(len(self.ids) - 1):
+            bisect.insort(self.pending, row)
+            self.pending_by_id[row[1]] = row
+            return
+        position = self.append(row)
+        # ids mostly grow with time, so this is nearly always an append
+        if self.by_id and row[1] < self.ids[self.by_id[-1]]:
+            self.by_id.insert(bisect.bisect_right(KeyView(self.by_id, self.ids.__getitem__), row[1]), position)
+        else:
+            self.by_id.append(position)
+
+    def finish_load(self):
+        """Build the id lookup after rows were loaded with append()."""
+        self.by_id = array('I', sorted(range(len(self.ids)), key=self.ids.__getitem__))
+
+    def remove(self, entry_id):
+        row = self.pending_by_id.pop(entry_id, None)
+        if row is not None:
+            del self.pending[bisect.bisect_left(self.pending, row)]
+            return
+        # ids restart after every entry was deleted, so dead rows may share an id with a live one
+        index = bisect.bisect_left(KeyView(self.by_id, self.ids.__getitem__), entry_id)
+        while index < len(self.by_id) and self.ids[self.by_id[index]] == entry_id:
+            position = self.by_id[index]
+            if self.alive[position]:
+                self.alive[position] = 0
+                self.live -= 1
+                self.live_by_sale_person[self.sale_persons[position]] -= 1
+                self.live_by_status[self.statuses[position]] -= 1
+                self.live_by_pair[self.sale_persons[position], self.statuses[position]] -= 1
+                return
+            index += 1
+
+    def filter_codes(self, sale_person, status):
+        """Codes for the filters (None for no filter); False if a filter matches nothing."""
+        sale_person_code = status_code = None
+        if sale_person:
+            sale_person_code = self.sale_person_codes.lookup(sale_person)
+            if sale_person_code is None:
+                return False
+        if status:
+            status_code = self.status_codes.lookup(status)
+            if status_code is None:
+                return False
+        return sale_person_code, status_code
+
+    def candidates(self, sale_person_code, status_code):
+        """Ascending positions to scan, plus the column and code each must still match."""
+        empty = array('I')
+        if sale_person_code is not None and status_code is not None:
+            by_sale_person = self.by_sale_person.get(sale_person_code, empty)
+            by_status = self.by_status.get(status_code, empty)
+            # Walk the shorter posting list and check the other filter on its column
+            if len(by_sale_person) <= len(by_status):
+                return by_sale_person, self.statuses, status_code
+            return by_status, self.sale_persons, sale_person_code
+        if sale_person_code is not None:
+            return self.by_sale_person.get(sale_person_code, empty), None, None
+        if status_code is not None:
+            return self.by_status.get(status_code, empty), None, None
+        return range(len(self.ids)), None, None
+
+    def iter_rows(self, sale_person_code, status_code, after):
+        """(time, id, sale_person, status, company) of matching live rows strictly before after, newest first."""
+        positions, column, code = self.candidates(sale_person_code, status_code)
+        end = len(positions) if after is None else bisect.bisect_left(KeyView(positions, self.key), after)
+        alive, times, ids = self.alive, self.times, self.ids
+        for index in range(end - 1, -1, -1):
+            position = positions[index]
+            if alive[position] and (column is None or column[position] == code):
+                yield (times[position], ids[position], self.sale_persons[position], self.statuses[position],
+                       self.companies[position])
+
+    def iter_pending(self, sale_person_code, status_code, after):
+        end = len(self.pending) if after is None else bisect.bisect_left(self.pending, after)
+        for index in range(end - 1, -1, -1):
+            row = self.pending[index]
+            if (sale_person_code is None or row[2] == sale_person_code) and (status_code is None or row[3] == status_code):
+                yield row
+
+    def page(self, sale_person, status, after, limit):
+        codes = self.filter_codes(sale_person, status)
+        if codes is False:
+            return []
+        after = None if after is None else (time_key(after[0]), after[1])
+        rows = self.iter_rows(*codes, after)
+        if self.pending:
+            rows = heapq.merge(rows, self.iter_pending(*codes, after), reverse=True)
+        return [IndexedEntry(entry_id, time_value(micros), self.sale_person_codes.values[sale_person],
+                             self.status_codes.values[status], self.company_codes.values[company])
+                for micros, entry_id, sale_person, status, company in islice(rows, limit)]
+
+    def count(self, sale_person, status):
+        codes = self.filter_codes(sale_person, status)
+        if codes is False:
+            return 0
+        sale_person_code, status_code = codes
+        pending = sum(1 for _ in self.iter_pending(sale_person_code, status_code, None))
+        if sale_person_code is not None and status_code is not None:
+            return self.live_by_pair[sale_person_code, status_code] + pending
+        if sale_person_code is not None:
+            return self.live_by_sale_person[sale_person_code] + pending
+        if status_code is not None:
+            return self.live_by_status[status_code] + pending
+        return self.live + pending
+
+    def memory_bytes(self):
+        """Bytes held by the arrays, posting lists and interned strings (the overlay excluded)."""
+        arrays = [self.times, self.ids, self.sale_persons, self.statuses, self.companies, self.alive, self.by_id]
+        arrays += list(self.by_sale_person.values()) + list(self.by_status.values())
+        size = sum(sys.getsizeof(column) for column in arrays)
+        for interner in (self.sale_person_codes, self.status_codes, self.company_codes):
+            size += sys.getsizeof(interner.codes) + sys.getsizeof(interner.values)
+            size += sum(sys.getsizeof(value) for value in interner.values if value is not None)
+        return size
+
+class SnapshotIndex:
+    """Thread-safe read model of crm_entry, built and rebuilt in the background.
+
+    max_lag is the number of logged changes still replayed on a read; further
+    behind (e.g. after every entry was cleared) the index is rebuilt instead.
+    max_pending and the share of dead rows bound the overlay and the flagged
+    rows before a rebuild.
+    """
+
+    def __init__(self, engine, table, max_lag=10000, max_pending=1024, max_dead_fraction=0.25):
+        self.engine = engine
+        self.table = table
+        self.max_lag = max_lag
+        self.max_pending = max_pending
+        self.max_dead_fraction = max_dead_fraction
+        self.columns = None
+        self.cursor = None
+        self.builds = 0
+        self.last_build_seconds = None
+        self._building = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        # A build thread does not survive a fork; let the child start its own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._building = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def metadata_select(self):
+        table = self.table
+        return select(table.c.id, table.c.submission_time, table.c.sale_person, table.c.status, table.c.company_name)
+
+    def build(self):
+        """Load every entry into a new Columns generation and swap it in."""
+        started = time.perf_counter()
+        columns = Columns()
+        with self.engine.connect() as connection:
+            # Take the cursor first: changes committed during the load are replayed, which is idempotent
+            cursor = change_feed.current_seq(connection)
+            statement = self.metadata_select().order_by(self.table.c.submission_time, self.table.c.id)
+            result = connection.execution_options(yield_per=10000).execute(statement)
+            for entry_id, submission_time, sale_person, status, company_name in result:
+                columns.append(columns.encode(entry_id, submission_time, sale_person, status, company_name))
+        columns.finish_load()
+        with self._lock:
+            self.columns = columns
+            self.cursor = cursor
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - started
+        logging.info(f"Snapshot index built: {columns.live} entries, {columns.memory_bytes()} bytes "
+                     f"in {self.last_build_seconds:.2f}s")
+
+    def _run_build(self):
+        try:
+            self.build()
+        except Exception as e:
+            logging.error(f"Building the snapshot index failed: {str(e)}", exc_info=True)
+        finally:
+            self._building = False
+
+    def start_build(self):
+        """Rebuild on a background thread unless a build is already running."""
+        with self._build_lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._run_build, name='crm-snapshot-index', daemon=True).start()
+
+    def _catch_up(self, connection):
+        """Apply logged changes since the snapshot; False if the index cannot answer now.
+
+        The database is read without holding the lock, since async views share
+        one thread, and a batch is applied only if no other reader moved the
+        cursor in the meantime.
+        """
+        while True:
+            with self._lock:
+                columns, cursor = self.columns, self.cursor
+            if columns is None:
+                self.start_build()
+                return False
+            last_seq = change_feed.current_seq(connection)
+            if last_seq <= cursor:
+                return True
+            if last_seq - cursor > self.max_lag:
+                # Too much to replay on a request thread, e.g. after every entry was cleared
+                self.start_build()
+                return False
+
+            try:
+                changed_ids, deleted_ids, next_cursor, has_more = change_feed.read_changes(
+                    connection, cursor, CHANGE_BATCH_SIZE)
+            except change_feed.CursorExpired:
+                self.start_build()
+                return False
+            rows = connection.execute(
+                self.metadata_select().where(self.table.c.id.in_(changed_ids))).all() if changed_ids else []
+
+            with self._lock:
+                if self.columns is columns and self.cursor == cursor:
+                    # An update is a removal and a new row, so a changed submission_time moves the entry
+                    for entry_id in changed_ids + deleted_ids:
+                        columns.remove(entry_id)
+                    for row in rows:
+                        columns.add(columns.encode(*row))
+                    self.cursor = next_cursor
+                    dead = len(columns.ids) - columns.live
+                    rebuild = (len(columns.pending) > self.max_pending
+                               or dead > self.max_dead_fraction * max(len(columns.ids), 1))
+                else:
+                    rebuild = False
+            if rebuild:
+                # Keep answering from this generation while the next one loads
+                self.start_build()
+            if not has_more:
+                return True
+
+    def page(self, connection, sale_person, status, after, limit, count=False):
+        """Up to limit IndexedEntry rows, newest first, strictly after the (submission_time, id) cursor.
+
+        Returns (entries, total), total being the number of matching entries if
+        count is set, or None when the index is not ready; read SQLite then.
+        """
+        if not self._catch_up(connection):
+            return None
+        with self._lock:
+            total = self.columns.count(sale_person, status) if count else None
+            return self.columns.page(sale_person, status, after, limit), total
+
+    def stats(self):
+        with self._lock:
+            columns = self.columns
+            if columns is None:
+                return {'ready': False, 'building': self._building}
+            return {
+                'ready': True,
+                'building': self._building,
+                'entries': columns.live + len(columns.pending),
+                'dead_rows': len(columns.ids) - columns.live,
+                'pending_rows': len(columns.pending),
+                'memory_bytes': columns.memory_bytes(),
+                'cursor': self.cursor,
+                'builds': self.builds,
+                'last_build_seconds': round(self.last_build_seconds, 3),
+            }
@@ -0,0 +1,142 @@
+"""In-memory, precompressed serving of the static frontend.
+
+The frontend files are read once per process, content-hashed and compressed
+with gzip (and brotli when the brotli package is installed). Every asset is
+served under its plain name with a revalidating Cache-Control, and under a
+content-hashed /assets/ URL with an immutable one. HTML pages served by the
+app have their asset references rewritten to the hashed URLs, so a repeat
+page load only revalidates the page itself.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Preferred first
+ENCODINGS = ('br', 'gzip')
+
+class Asset:
+    """One file with its content hash and encoded variants."""
+
+    def __init__(self, name, body, content_type):
+        self.name = name
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        stem, extension = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{self.digest}{extension}"
+        self.variants = {'identity': body}
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            self.add_variant('gzip', gzip.compress(body, 9, mtime=0))
+            if brotli is not None:
+                self.add_variant('br', brotli.compress(body, quality=11))
+
+    def add_variant(self, encoding, data):
+        # Keep an encoding only if it saves bytes
+        if len(data) < len(self.variants['identity']):
+            self.variants[encoding] = data
+
+    def etag(self, encoding):
+        """Strong ETag; each encoding is a different representation."""
+        return self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+
+def content_type_for(name):
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type == 'application/javascript':
+        content_type += '; charset=utf-8'
+    return content_type
+
+class AssetStore:
+    """Frontend files in directory, built on first use.
+
+    pages are HTML files whose references to the other assets are rewritten
+    to hashed URLs before hashing and compressing them. The store is rebuilt
+    when a file changes while the app runs in debug mode.
+    """
+
+    def __init__(self, directory, names, pages=(), url_prefix='/assets/'):
+        self.directory = directory
+        self.names = tuple(names)
+        self.pages = tuple(pages)
+        self.url_prefix = url_prefix
+        # (assets by name, assets by hashed name, file mtimes), replaced as a whole on every build
+        self._store = None
+        self._lock = threading.Lock()
+        # href="styles.css", src="/logo.png", ... for every non-page asset
+        self._reference_re = re.compile(
+            r'''(\b(?:href|src)=["'])/?(%s)(["'])''' % '|'.join(re.escape(name) for name in self.names))
+
+    def _file_mtimes(self):
+        return [os.stat(os.path.join(self.directory, name)).st_mtime_ns for name in self.names + self.pages]
+
+    def _is_current(self, store):
+        return store is not None and not (current_app.debug and self._file_mtimes() != store[2])
+
+    def _load(self):
+        """Return the current store, building it if it is missing or, in debug mode, outdated."""
+        store = self._store
+        if self._is_current(store):
+            return store
+        with self._lock:
+            store = self._store
+            if self._is_current(store):
+                return store
+            mtimes = self._file_mtimes()
+            assets = {}
+            for name in self.names:
+                with open(os.path.join(self.directory, name), 'rb') as asset_file:
+                    assets[name] = Asset(name, asset_file.read(), content_type_for(name))
+            for name in self.pages:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as page_file:
+                    body = self._rewrite(page_file.read(), assets).encode('utf-8')
+                assets[name] = Asset(name, body, content_type_for(name))
+            # Readers see the previous store or this complete one, never a partial build
+            store = self._store = (assets, {asset.hashed_name: asset for asset in assets.values()}, mtimes)
+            return store
+
+    def get(self, name):
+        return self._load()[0].get(name)
+
+    def get_hashed(self, hashed_name):
+        return self._load()[1].get(hashed_name)
+
+    def url(self, name):
+        """Immutable URL of an asset."""
+        return self.url_prefix + self.get(name).hashed_name
+
+    def _rewrite(self, html, assets):
+        return self._reference_re.sub(
+            lambda m: m.group(1) + self.url_prefix + assets[m.group(2)].hashed_name + m.group(3), html)
+
+    def rewrite_html(self, html):
+        """Point asset references in an HTML document at their hashed URLs."""
+        return self._rewrite(html, self._load()[0])
+
+    def response(self, asset, cache_control):
+        """Serve the best encoding the client accepts, or 304 if its copy is current."""
+        encoding = next((encoding for encoding in ENCODINGS
+                         if encoding in asset.variants and request.accept_encodings[encoding] > 0), 'identity')
+        etag = asset.etag(encoding)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], content_type=asset.content_type)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,129 @@
+"""Database engine configuration and the group-commit write path.
+
+Every new SQLite connection gets the pragmas from SQLITE_PRAGMAS (WAL so
+readers never wait for the writer, NORMAL sync, a busy timeout instead of
+immediate "database is locked" errors, larger page cache and mmap). Each
+pragma can be overridden with an SQLITE_<NAME> environment variable.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy import event
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',  # Only takes effect on new databases; must precede journal_mode
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # milliseconds
+    'cache_size': -65536,  # negative means KiB, i.e. 64 MiB per connection
+    'mmap_size': 268435456,  # 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+def sqlite_pragmas_from_env(defaults=DEFAULT_SQLITE_PRAGMAS):
+    """Return the pragma settings with SQLITE_<NAME> environment overrides applied."""
+    return {name: os.environ.get('SQLITE_' + name.upper(), value) for name, value in defaults.items()}
+
+def engine_options(url, pool_size=8, max_overflow=4, pool_timeout=10):
+    """SQLAlchemy engine options for a multi-threaded worker using the database at url.
+
+    pool_size should match the number of request threads per process
+    (gunicorn --threads) so a thread never waits for a connection. With a
+    database server, pool_size * max workers must stay below its connection limit.
+    """
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+    }
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+def configure_engine(engine, pragmas):
+    """Apply pragmas to every new connection of a SQLite engine.
+
+    Pooled connections are dropped (not closed) in a forked child, so workers
+    forked from a preloaded app open their own.
+    """
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+class GroupCommitWriter:
+    """Batch concurrent single-row writes into one transaction.
+
+    Callers block in submit() until the transaction holding their row commits.
+    A background thread collects rows for up to max_delay seconds (or max_batch
+    rows) and hands them to write_batch(connection, rows), which must return
+    one result per row in order. The thread is started lazily and restarted
+    after a fork, so the writer is safe to create before gunicorn forks.
+    """
+
+    def __init__(self, engine, write_batch, max_delay=0.005, max_batch=500):
+        self.engine = engine
+        self.write_batch = write_batch
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, row, timeout=None):
+        """Queue one row and wait for its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((row, future))
+        return future.result(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # Work queued in the parent process does not exist after a fork
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                with self.engine.begin() as connection:
+                    results = self.write_batch(connection, [row for row, _ in batch])
+            except Exception as e:
+                logging.error(f"Group commit of {len(batch)} rows failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,94 @@
+"""Shared fixtures: one app per test session on a scratch SQLite file, emptied before every test."""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pytest
+
+# The app reads its settings from the environment when it is imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix='crm_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(SCRATCH_DIR, 'crm.db')
+os.environ['LOG_FILE'] = os.path.join(SCRATCH_DIR, 'app.log')
+os.environ['LOG_CONSOLE'] = '0'
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['ADMIN_USERS'] = 'admin'
+os.environ['CRM_RETENTION_PAUSE'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as crm_app
+from sqlalchemy import text
+
+PASSWORD = 'secret'
+
+@pytest.fixture(scope='session')
+def app():
+    crm_app.create_app()
+    with crm_app.app.app_context():
+        crm_app.ensure_schema()
+    return crm_app.app
+
+@pytest.fixture(autouse=True)
+def empty_database(app):
+    with app.app_context():
+        with crm_app.db.engine.begin() as connection:
+            for table in ('crm_entry', 'crm_stat', 'crm_entry_archive', 'user'):
+                connection.execute(text(f'DELETE FROM "{table}"'))
+        crm_app.crm_entries_changed()
+        crm_app.invalidate_user_cache()
+    yield
+
+def create_user(app, username, password=PASSWORD):
+    with app.app_context():
+        user = crm_app.User(username=username, email=f'{username}@example.com',
+                            password=crm_app.bcrypt.generate_password_hash(password).decode('utf-8'))
+        crm_app.db.session.add(user)
+        crm_app.db.session.commit()
+        return user.id
+
+def login_client(app, username):
+    create_user(app, username)
+    client = app.test_client()
+    response = client.post('/login', json={'username': username, 'password': PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as the sales rep 'rep'."""
+    return login_client(app, 'rep')
+
+@pytest.fixture
+def admin_client(app):
+    """A test client logged in as 'admin', listed in ADMIN_USERS."""
+    return login_client(app, 'admin')
+
+@pytest.fixture
+def add_entries(app):
+    """Insert entries directly; each row gets defaults for the required fields."""
+    def add(rows):
+        start = datetime(2024, 1, 1)
+        rows = [dict({
+            'person_name': f'Person {number}',
+            'company_name': f'Company {number}',
+            'sale_person': 'rep',
+            'status': 'open',
+            'submission_time': start + timedelta(minutes=number),
+        }, **row) for number, row in enumerate(rows)]
+        with app.app_context():
+            entry_ids = crm_app.insert_crm_rows(crm_app.db.session, rows)
+            crm_app.db.session.commit()
+            crm_app.crm_entries_changed()
+        return entry_ids
+    return add
+
+@pytest.fixture
+def wait_for_retention():
+    """Wait for the background retention job to finish and return its progress."""
+    def wait(timeout=10):
+        deadline = time.monotonic() + timeout
+        while crm_app.retention_runner.status()['state'] not in ('done', 'failed'):
+            assert time.monotonic() < deadline, crm_app.retention_runner.status()
+            time.sleep(0.01)
+        return crm_app.retention_runner.status()
+    return wait
@@ -0,0 +1,50 @@
+"""Module-level app initialization and the once-per-process schema check."""
+import os
+import subprocess
+import sys
+import app as crm_app
+import migrations
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_python(code, tmp_path):
+    """Run code in a fresh interpreter on its own database; returns its stdout lines."""
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'crm.db'}", LOG_FILE=str(tmp_path / 'app.log'))
+    env.pop('SECRET_KEY', None)
+    result = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.split()
+
+def test_module_level_app_initializes_itself(tmp_path):
+    # What flask run and gunicorn app:app serve: the app as imported, create_app() never called
+    output = run_python(
+        "import app\n"
+        "client = app.app.test_client()\n"
+        "client.post('/register', data={'username': 'a', 'email': 'a@example.com', 'password': 'secret'})\n"
+        "print(client.post('/login', json={'username': 'a', 'password': 'secret'}).status_code)\n"
+        "print(client.get('/get_crm_entries').status_code)\n",
+        tmp_path)
+
+    assert output == ['200', '200']
+
+def test_create_app_starts_no_thread(tmp_path):
+    # Without SECRET_KEY, whose warning would start the log writer
+    output = run_python("import threading, app\napp.create_app()\nprint(threading.active_count())\n", tmp_path)
+
+    assert output == ['1']
+
+def test_failed_schema_check_is_retried(app, monkeypatch):
+    def fail(engine):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(crm_app, '_schema_checked', False)
+    monkeypatch.setattr(migrations, 'upgrade', fail)
+
+    with app.app_context():
+        crm_app.ensure_schema()
+        assert crm_app._schema_checked is False
+
+        monkeypatch.undo()
+        monkeypatch.setattr(crm_app, '_schema_checked', False)
+        crm_app.ensure_schema()
+        assert crm_app._schema_checked is True
@@ -0,0 +1,28 @@
+"""The ASGI views share load_user's cache, so invalidating it logs users out of both serving modes."""
+import asyncio
+import app as crm_app
+import async_app
+from conftest import create_user
+
+def load_username(user_id):
+    async def load():
+        try:
+            return await async_app.load_username(user_id)
+        finally:
+            # Pooled connections belong to this event loop
+            await async_app.engine.dispose()
+    return asyncio.run(load())
+
+def test_username_is_cached_until_invalidated(app):
+    user_id = create_user(app, 'ann')
+
+    assert load_username(user_id) == 'ann'
+    assert crm_app.user_cache.get(user_id).username == 'ann'
+
+    with app.app_context():
+        crm_app.User.query.filter_by(id=user_id).delete()
+        crm_app.db.session.commit()
+    # Still cached until the writer invalidates it, as /reset_users does
+    assert load_username(user_id) == 'ann'
+    crm_app.invalidate_user_cache()
+    assert load_username(user_id) is None
@@ -0,0 +1,102 @@
+"""Name folding, ranking and fuzzy matching of the typeahead index, and /autocomplete."""
+import time
+import pytest
+import app as crm_app
+from autocomplete import NameIndex, match_key
+
+def suggest(index, query, limit=10):
+    return [(display, count, match) for display, count, match in index.suggest(query, limit)]
+
+def test_match_key_folds_case_accents_and_punctuation():
+    assert match_key('  Société  Générale, S.A. ') == b'societe generale s a'
+    assert match_key('acme ', partial=True) == b'acme '
+    assert match_key('acme ') == b'acme'
+
+def test_spellings_of_a_name_are_merged():
+    index = NameIndex.from_counts([('ACME  Ltd.', 2), ('Acme Ltd', 5), ('Initech', 1)], max_names=100)
+
+    assert len(index) == 2
+    # Suggested in the most frequent spelling, with the counts of every spelling
+    assert suggest(index, 'acme') == [('Acme Ltd', 7, 'prefix')]
+
+def test_prefix_matches_are_ranked_by_count():
+    index = NameIndex.from_counts([('Acme', 1), ('Acorn', 9), ('Actel', 4), ('Bolt', 20)], max_names=100)
+
+    assert [display for display, _, _ in suggest(index, 'ac')] == ['Acorn', 'Actel', 'Acme']
+    assert [display for display, _, _ in suggest(index, 'ac', limit=2)] == ['Acorn', 'Actel']
+    assert suggest(index, 'bo') == [('Bolt', 20, 'prefix')]
+
+def test_fuzzy_matches_follow_prefix_matches():
+    index = NameIndex.from_counts([('Globex', 3), ('Globe Media', 1), ('Glovex', 8), ('Gbolex', 2)], max_names=100)
+
+    suggestions = suggest(index, 'globe')
+
+    assert suggestions[:2] == [('Globex', 3, 'prefix'), ('Globe Media', 1, 'prefix')]
+    assert suggestions[2:] == [('Glovex', 8, 'fuzzy')]
+    # One edit away from 'globex', but the first character must match
+    assert suggest(index, 'lgobex') == []
+
+def test_short_queries_get_prefix_matches_only():
+    index = NameIndex.from_counts([('Ibm', 1), ('Ibex', 1)], max_names=100)
+
+    assert suggest(index, 'ib') == [('Ibex', 1, 'prefix'), ('Ibm', 1, 'prefix')]
+    assert suggest(index, 'ix') == []
+
+def test_added_names_are_counted_and_ranked():
+    # scan_limit=0 serves every prefix from a cached top list, which add() must keep current
+    index = NameIndex.from_counts([('Acme', 3), ('Acorn', 2)], max_names=100, scan_limit=0)
+    assert suggest(index, 'ac')[0][0] == 'Acme'
+
+    for _ in range(2):
+        index.add('acorn')
+    index.add('Actel')
+
+    assert suggest(index, 'ac') == [('Acorn', 4, 'prefix'), ('Acme', 3, 'prefix'), ('Actel', 1, 'prefix')]
+    assert len(index.pending) == 1
+
+def test_only_the_most_frequent_names_are_kept():
+    index = NameIndex.from_counts([('Acme', 3), ('Acorn', 1), ('Actel', 2)], max_names=2)
+    index.add('Acrobat')
+
+    assert [display for display, _, _ in suggest(index, 'ac')] == ['Acme', 'Actel']
+
+@pytest.fixture
+def names(app):
+    """Rebuild the app's autocomplete index from the current entries."""
+    def build():
+        while crm_app.crm_names.stats()['building']:
+            time.sleep(0.01)
+        crm_app.crm_names.build()
+    return build
+
+def test_endpoint_suggests_submitted_names(client, add_entries, names):
+    add_entries([{'company_name': 'Umbrella'}, {'company_name': 'Umbrella'}, {'company_name': 'Umbra Labs'}])
+    names()
+
+    response = client.get('/autocomplete?q=umb')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['ready'] is True
+    assert body['suggestions'] == [{'value': 'Umbrella', 'count': 2, 'match': 'prefix'},
+                                   {'value': 'Umbra Labs', 'count': 1, 'match': 'prefix'}]
+
+    # A new entry is counted at once, without a rebuild
+    for _ in range(2):
+        client.post('/submit_crm', json={'name': 'Ada', 'company': 'Umbra Labs'})
+    suggestions = client.get('/autocomplete?q=umb&limit=1').get_json()['suggestions']
+    assert suggestions == [{'value': 'Umbra Labs', 'count': 3, 'match': 'prefix'}]
+
+    person = client.get('/autocomplete?field=person_name&q=ad').get_json()['suggestions']
+    assert person == [{'value': 'Ada', 'count': 2, 'match': 'prefix'}]
+
+@pytest.mark.parametrize('query, error', [
+    ('field=description&q=a', 'Invalid field'),
+    ('q=a&limit=0', 'Invalid limit'),
+    ('q=a&limit=21', 'Invalid limit'),
+])
+def test_endpoint_rejects_invalid_parameters(client, query, error):
+    response = client.get(f'/autocomplete?{query}')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
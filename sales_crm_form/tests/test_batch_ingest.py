@@ -0,0 +1,61 @@
+"""POST /submit_crm/batch: one result per input row, 201 when all were added, 207 otherwise."""
+import json
+import pytest
+
+ENTRY = {'name': 'Ada', 'company': 'Engines'}
+
+def list_entries(client):
+    return client.get('/get_crm_entries').get_json()
+
+def test_json_array_all_added(client):
+    response = client.post('/submit_crm/batch', json=[dict(ENTRY, status='won') for _ in range(3)])
+
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (3, 0)
+    assert [result['index'] for result in body['results']] == [0, 1, 2]
+    entries = list_entries(client)
+    assert sorted(entry['id'] for entry in entries) == [result['entry_id'] for result in body['results']]
+    assert all(entry['sale_person'] == 'rep' for entry in entries)
+
+def test_invalid_rows_get_errors_and_207(client):
+    response = client.post('/submit_crm/batch', json=[ENTRY, {'name': 'No company'}, 'not an object', ENTRY])
+
+    assert response.status_code == 207
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (2, 2)
+    results = body['results']
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert 'entry_id' in results[0] and 'entry_id' in results[3]
+    assert results[1]['error'] == results[2]['error'] == 'Invalid entry'
+    assert len(list_entries(client)) == 2
+
+def test_rows_are_inserted_in_chunks(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'CRM_BATCH_CHUNK_SIZE', 2)
+
+    response = client.post('/submit_crm/batch', json=[ENTRY] * 5)
+
+    assert response.status_code == 201
+    entry_ids = [result['entry_id'] for result in response.get_json()['results']]
+    assert entry_ids == sorted(entry_ids) and len(set(entry_ids)) == 5
+
+def test_ndjson_results_are_numbered_by_line(client):
+    lines = [json.dumps(ENTRY), '', '', '{not json', json.dumps({'name': 'No company'}), json.dumps(ENTRY)]
+
+    response = client.post('/submit_crm/batch', data='\n'.join(lines) + '\n',
+                           content_type='application/x-ndjson')
+
+    assert response.status_code == 207
+    results = response.get_json()['results']
+    # Blank lines use up a line number but get no result
+    assert [result['index'] for result in results] == [0, 3, 4, 5]
+    assert results[1]['error'] == 'JSON Parsing Error'
+    assert results[2]['error'] == 'Invalid entry'
+    assert 'entry_id' in results[0] and 'entry_id' in results[3]
+
+@pytest.mark.parametrize('body', ['{"name": "Ada"}', 'not json'])
+def test_body_that_is_not_an_array_is_rejected(client, body):
+    response = client.post('/submit_crm/batch', data=body, content_type='application/json')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid batch payload'
@@ -0,0 +1,112 @@
+"""since= deltas of /get_crm_entries and the /crm_entries/stream change feed."""
+import json
+from sqlalchemy import text
+import app as crm_app
+import change_feed
+
+def latest_cursor(client):
+    return client.get('/get_crm_entries?since=latest').get_json()['cursor']
+
+def execute(app, sql, **params):
+    with app.app_context():
+        with crm_app.db.engine.begin() as connection:
+            connection.execute(text(sql), params)
+
+def test_delta_lists_inserted_updated_and_deleted_entries(client, app, add_entries):
+    kept, updated, deleted = add_entries([{}, {}, {}])
+    cursor = latest_cursor(client)
+
+    new_id = client.post('/submit_crm', json={'name': 'Ada', 'company': 'Engines'}).get_json()['entry_id']
+    execute(app, "UPDATE crm_entry SET status = 'won' WHERE id = :id", id=updated)
+    execute(app, 'DELETE FROM crm_entry WHERE id = :id', id=deleted)
+    response = client.get(f'/get_crm_entries?since={cursor}')
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-store'
+    delta = response.get_json()
+    assert sorted(entry['id'] for entry in delta['entries']) == [updated, new_id]
+    assert delta['deleted'] == [deleted]
+    assert delta['has_more'] is False
+    assert kept not in [entry['id'] for entry in delta['entries']]
+
+    # Nothing changed after the returned cursor
+    again = client.get(f"/get_crm_entries?since={delta['cursor']}").get_json()
+    assert (again['entries'], again['deleted'], again['cursor']) == ([], [], delta['cursor'])
+
+def test_entries_leaving_the_filter_are_reported_deleted(client, app, add_entries):
+    leaving, staying = add_entries([{'status': 'won'}, {'status': 'won'}])
+    cursor = latest_cursor(client)
+
+    execute(app, "UPDATE crm_entry SET status = 'lost' WHERE id = :id", id=leaving)
+    execute(app, "UPDATE crm_entry SET description = 'call back' WHERE id = :id", id=staying)
+    delta = client.get(f'/get_crm_entries?since={cursor}&status=won').get_json()
+
+    assert [(entry['id'], entry['description']) for entry in delta['entries']] == [(staying, 'call back')]
+    assert delta['deleted'] == [leaving]
+
+def test_delta_is_paged_by_limit(client, add_entries):
+    cursor = latest_cursor(client)
+    entry_ids = add_entries([{} for _ in range(5)])
+
+    seen, pages = [], 0
+    while True:
+        delta = client.get(f'/get_crm_entries?since={cursor}&limit=2').get_json()
+        seen += [entry['id'] for entry in delta['entries']]
+        cursor, pages = delta['cursor'], pages + 1
+        if not delta['has_more']:
+            break
+
+    assert sorted(seen) == entry_ids
+    assert pages == 3
+
+def test_cursor_ahead_of_the_log_is_gone(client):
+    response = client.get(f'/get_crm_entries?since={int(latest_cursor(client)) + 1}')
+
+    assert response.status_code == 410
+    assert response.get_json()['error'] == 'Cursor expired'
+
+def test_pruned_cursor_is_gone(client, app, add_entries):
+    cursor = latest_cursor(client)
+    add_entries([{}, {}])
+    execute(app, "UPDATE crm_change SET changed_at = '2000-01-01 00:00:00'")
+
+    with app.app_context():
+        assert change_feed.prune(crm_app.db.engine, max_age_days=1) > 0
+
+    assert client.get(f'/get_crm_entries?since={cursor}').status_code == 410
+    assert client.get(f'/get_crm_entries?since={latest_cursor(client)}').status_code == 200
+
+def test_stream_is_offered_to_browsers_only_when_enabled(client, app, monkeypatch):
+    assert client.get('/get_crm_entries?since=latest').get_json()['stream'] is False
+
+    monkeypatch.setitem(app.config, 'CRM_CHANGE_STREAM_CLIENTS', True)
+    assert client.get('/get_crm_entries?since=latest').get_json()['stream'] is True
+    # Only the cursor request carries the flag
+    assert 'stream' not in client.get(f'/get_crm_entries?since={latest_cursor(client)}').get_json()
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/get_crm_entries?since=yesterday')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+def test_stream_sends_changes_after_the_last_event_id(client, app, add_entries, monkeypatch):
+    monkeypatch.setitem(app.config, 'CRM_CHANGE_STREAM_MAX_SECONDS', 0.2)
+    monkeypatch.setitem(app.config, 'CRM_CHANGE_STREAM_POLL', 0.05)
+    cursor = latest_cursor(client)
+    entry_ids = add_entries([{}, {}])
+
+    response = client.get('/crm_entries/stream', headers={'Last-Event-ID': cursor})
+
+    assert response.content_type == 'text/event-stream'
+    events = [event for event in response.get_data(as_text=True).split('\n\n') if 'event: changes' in event]
+    assert len(events) == 1
+    fields = dict(line.split(': ', 1) for line in events[0].splitlines())
+    delta = json.loads(fields['data'])
+    assert sorted(entry['id'] for entry in delta['entries']) == entry_ids
+    assert fields['id'] == delta['cursor']
+
+def test_stream_refuses_an_expired_cursor(client):
+    response = client.get(f'/crm_entries/stream?since={int(latest_cursor(client)) + 1}')
+
+    assert response.status_code == 410
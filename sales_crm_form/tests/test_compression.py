@@ -0,0 +1,149 @@
+"""Negotiated gzip compression of responses and the -gzip ETag variant."""
+import asyncio
+import gzip
+import json
+import zlib
+import pytest
+from werkzeug.http import parse_etags
+import compression
+
+GZIP = {'Accept-Encoding': 'gzip'}
+PAGE_URL = '/get_crm_entries?limit=100'  # A buffered body
+STREAM_URL = '/get_crm_entries'  # Streamed, without limit
+
+@pytest.fixture
+def entries(add_entries):
+    # Enough JSON to pass the default RESPONSE_COMPRESSION_MIN_BYTES
+    return add_entries([{'description': f'Entry {number} ' + 'x' * 100} for number in range(40)])
+
+def test_gzip_is_sent_to_clients_that_accept_it(client, entries):
+    plain = client.get(PAGE_URL)
+    compressed = client.get(PAGE_URL, headers=GZIP)
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in plain.headers['Vary'] and 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data)
+    assert gzip.decompress(compressed.data) == plain.data
+
+@pytest.mark.parametrize('accept_encoding', ['gzip;q=0', 'br', 'identity'])
+def test_gzip_is_not_sent_to_clients_that_refuse_it(client, entries, accept_encoding):
+    response = client.get(PAGE_URL, headers={'Accept-Encoding': accept_encoding})
+
+    assert 'Content-Encoding' not in response.headers
+    json.loads(response.data)
+
+def test_bodies_under_the_threshold_are_sent_as_is(client, app, entries, monkeypatch):
+    size = len(client.get(PAGE_URL).data)
+
+    monkeypatch.setitem(app.config, 'RESPONSE_COMPRESSION_MIN_BYTES', size + 1)
+    small = client.get(PAGE_URL, headers=GZIP)
+    monkeypatch.setitem(app.config, 'RESPONSE_COMPRESSION_MIN_BYTES', size)
+    large = client.get(PAGE_URL, headers=GZIP)
+
+    assert 'Content-Encoding' not in small.headers
+    assert 'Accept-Encoding' not in small.headers.get('Vary', '')
+    assert large.headers['Content-Encoding'] == 'gzip'
+
+def test_compression_can_be_disabled(client, app, entries, monkeypatch):
+    monkeypatch.setitem(app.config, 'RESPONSE_COMPRESSION', False)
+
+    assert 'Content-Encoding' not in client.get(PAGE_URL, headers=GZIP).headers
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk(client, app, add_entries, monkeypatch):
+    # Small streams are compressed too, one flushed gzip block per fetched batch
+    monkeypatch.setitem(app.config, 'CRM_STREAM_BATCH_SIZE', 2)
+    add_entries([{}, {}, {}, {}, {}])
+
+    response = client.get(STREAM_URL, headers=GZIP, buffered=False)
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+
+    decompressor = zlib.decompressobj(compression.GZIP_WBITS)
+    received = []
+    for chunk in response.response:
+        # Every chunk decompresses on its own arrival, without waiting for the end of the body
+        received.append(decompressor.decompress(chunk))
+    response.close()
+
+    assert len([data for data in received if data]) >= 3
+    assert decompressor.eof
+    assert len(json.loads(b''.join(received))) == 5
+
+def test_stream_compressor_flushes_every_chunk():
+    compressor = compression.StreamCompressor(1, 'test')
+    decompressor = zlib.decompressobj(compression.GZIP_WBITS)
+
+    assert decompressor.decompress(compressor.compress(b'first ')) == b'first '
+    assert decompressor.decompress(compressor.compress(b'second')) == b'second'
+    decompressor.decompress(compressor.compress(b'', final=True))
+    assert decompressor.eof
+    assert compressor.bytes_in == 12
+
+def test_compressed_responses_get_the_gzip_etag(client, entries):
+    plain = client.get(PAGE_URL).headers['ETag']
+    compressed = client.get(PAGE_URL, headers=GZIP).headers['ETag']
+
+    assert compressed == plain[:-1] + '-gzip"'
+
+@pytest.mark.parametrize('headers', [{}, GZIP])
+def test_not_modified_repeats_the_etag_the_client_has(client, entries, headers):
+    etag = client.get(PAGE_URL, headers=headers).headers['ETag']
+
+    response = client.get(PAGE_URL, headers=dict(headers, **{'If-None-Match': etag}))
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert 'Content-Encoding' not in response.headers
+
+def test_not_modified_for_either_variant_whatever_the_client_accepts_now(client, entries):
+    compressed_etag = client.get(PAGE_URL, headers=GZIP).headers['ETag']
+
+    response = client.get(PAGE_URL, headers={'If-None-Match': compressed_etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == compressed_etag
+
+def test_matching_etag_finds_either_form():
+    assert compression.matching_etag(parse_etags('"v1"'), 'v1') == 'v1'
+    assert compression.matching_etag(parse_etags('"v1-gzip"'), 'v1') == 'v1-gzip'
+    assert compression.matching_etag(parse_etags('"v0", "v1-gzip"'), 'v1') == 'v1-gzip'
+    assert compression.matching_etag(parse_etags('"v0-gzip"'), 'v1') is None
+
+def asgi_messages(accept_encoding, status, bodies, min_size=10):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def respond():
+        send_compressed = compression.asgi_send(send, accept_encoding, 1, min_size)
+        await send_compressed({'type': 'http.response.start', 'status': status,
+                               'headers': [(b'content-type', b'application/json'), (b'etag', b'"v1"')]})
+        for number, body in enumerate(bodies, 1):
+            await send_compressed({'type': 'http.response.body', 'body': body, 'more_body': number < len(bodies)})
+
+    asyncio.run(respond())
+    return dict(sent[0]['headers']), [message['body'] for message in sent[1:]]
+
+def test_asgi_bodies_are_compressed_chunk_by_chunk_with_the_gzip_etag():
+    headers, bodies = asgi_messages('gzip', 200, [b'[1,', b'2]'])
+
+    assert headers[b'content-encoding'] == b'gzip'
+    assert headers[b'etag'] == b'"v1-gzip"'
+    decompressor = zlib.decompressobj(compression.GZIP_WBITS)
+    assert [decompressor.decompress(body) for body in bodies] == [b'[1,', b'2]']
+    assert decompressor.eof
+
+@pytest.mark.parametrize('accept_encoding, status, bodies', [
+    ('', 200, [b'[1, 2, 3, 4, 5]']),  # Not accepted
+    ('gzip', 200, [b'[]']),  # Under min_size
+    ('gzip', 304, [b'']),
+])
+def test_asgi_bodies_sent_as_is(accept_encoding, status, bodies):
+    headers, sent = asgi_messages(accept_encoding, status, bodies)
+
+    assert b'content-encoding' not in headers
+    assert headers[b'etag'] == b'"v1"'
+    assert sent == bodies
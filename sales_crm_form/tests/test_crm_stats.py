@@ -0,0 +1,62 @@
+"""The crm_stat summary table must always agree with a full recount of crm_entry."""
+from datetime import datetime
+import app as crm_app
+import crm_stats
+
+def stat_mismatches(app):
+    with app.app_context():
+        with crm_app.db.engine.connect() as connection:
+            return crm_stats.check(connection)
+
+def test_submit_counts_the_entry(client, app):
+    for status in ('won', 'won', 'lost'):
+        response = client.post('/submit_crm', json={'name': 'Ada', 'company': 'Engines', 'status': status})
+        assert response.status_code == 201
+
+    stats = client.get('/crm_stats').get_json()
+
+    assert stats['total'] == 3
+    assert stats['by_status'] == {'won': 2, 'lost': 1}
+    assert stats['by_sale_person'] == {'rep': 3}
+    assert sum(stats['by_day'].values()) == sum(stats['by_week'].values()) == 3
+    assert stat_mismatches(app) == []
+
+def test_batch_counts_only_the_added_rows(client, app):
+    response = client.post('/submit_crm/batch', json=[{'name': 'Ada', 'company': 'Engines', 'status': 'open'},
+                                                      {'name': 'No company'}])
+    assert response.status_code == 207
+
+    assert client.get('/crm_stats').get_json()['by_status'] == {'open': 1}
+    assert stat_mismatches(app) == []
+
+def test_day_and_week_buckets(client, app, add_entries):
+    add_entries([{'submission_time': datetime(2024, 1, 1, 9)},
+                 {'submission_time': datetime(2024, 1, 7, 23)},
+                 {'submission_time': datetime(2024, 1, 8, 0)}])
+
+    stats = client.get('/crm_stats').get_json()
+
+    assert stats['by_day'] == {'2024-01-01': 1, '2024-01-07': 1, '2024-01-08': 1}
+    assert stats['by_week'] == {'2024-W01': 2, '2024-W02': 1}
+    assert stat_mismatches(app) == []
+
+def test_clear_empties_the_stats(client, app, add_entries, wait_for_retention):
+    add_entries([{'status': 'won'}, {'status': 'open'}, {'status': 'open'}])
+
+    assert client.delete('/clear_crm_entries').status_code == 202
+    assert wait_for_retention()['state'] == 'done'
+
+    stats = client.get('/crm_stats').get_json()
+    assert stats['total'] == 0
+    assert stats['by_status'] == stats['by_sale_person'] == stats['by_day'] == {}
+    assert stat_mismatches(app) == []
+
+def test_partial_retention_subtracts_the_removed_rows(client, app, add_entries, wait_for_retention):
+    add_entries([{'status': 'lost'}, {'status': 'lost'}, {'status': 'won'}])
+
+    response = client.post('/crm_retention', json={'statuses': ['lost']})
+    assert response.status_code == 202
+    wait_for_retention()
+
+    assert client.get('/crm_stats').get_json()['by_status'] == {'won': 1}
+    assert stat_mismatches(app) == []
@@ -0,0 +1,50 @@
+"""Keyset pagination and the streamed listing of /get_crm_entries."""
+from datetime import datetime
+
+def fetch_all_pages(client, query, limit):
+    entries, after, pages = [], None, 0
+    while True:
+        url = f'/get_crm_entries?limit={limit}{query}' + (f'&after={after}' if after else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        entries += body['entries']
+        pages += 1
+        after = body['next_cursor']
+        if after is None:
+            return entries, pages
+
+def test_cursor_round_trip_returns_every_entry_once_newest_first(client, add_entries):
+    # Entries sharing a submission time are ordered by id, so none is skipped at a page boundary
+    same_time = datetime(2024, 6, 1, 12, 0)
+    entry_ids = add_entries([{} for _ in range(7)] + [{'submission_time': same_time} for _ in range(6)])
+
+    entries, pages = fetch_all_pages(client, '', limit=4)
+
+    assert pages == 4
+    assert sorted(entry['id'] for entry in entries) == sorted(entry_ids)
+    positions = [(entry['submission_time'], entry['id']) for entry in entries]
+    assert positions == sorted(positions, reverse=True)
+
+def test_cursor_round_trip_with_filters(client, add_entries):
+    add_entries([{'status': 'won' if number % 3 == 0 else 'open',
+                  'sale_person': 'rep' if number % 2 else 'other'} for number in range(30)])
+
+    entries, _ = fetch_all_pages(client, '&status=won&sale_person=rep', limit=2)
+
+    assert len(entries) == 5
+    assert all(entry['status'] == 'won' and entry['sale_person'] == 'rep' for entry in entries)
+
+def test_unpaginated_listing_streams_the_full_array(client, add_entries):
+    entry_ids = add_entries([{} for _ in range(1200)])
+
+    response = client.get('/get_crm_entries')
+
+    assert response.status_code == 200
+    assert [entry['id'] for entry in response.get_json()] == sorted(entry_ids, reverse=True)
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/get_crm_entries?limit=10&after=not-a-cursor')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
@@ -0,0 +1,65 @@
+"""ETags, 304 responses and the server-side response cache of /get_crm_entries."""
+import sqlite3
+import pytest
+import app as crm_app
+
+URL = '/get_crm_entries?limit=10'
+
+def test_unchanged_listing_is_not_modified(client, add_entries):
+    add_entries([{}, {}])
+    first = client.get(URL)
+    etag = first.headers['ETag']
+
+    response = client.get(URL, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+@pytest.mark.parametrize('url', [URL, '/get_crm_entries'])
+def test_a_new_entry_changes_the_etag(client, add_entries, url):
+    add_entries([{}])
+    etag = client.get(url).headers['ETag']
+
+    client.post('/submit_crm', json={'name': 'Ada', 'company': 'Engines'})
+    response = client.get(url, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    entries = response.get_json()
+    assert len(entries['entries'] if isinstance(entries, dict) else entries) == 2
+
+def test_parameters_are_part_of_the_etag(client, add_entries):
+    add_entries([{'status': 'won'}, {'status': 'open'}])
+
+    etags = {client.get(url).headers['ETag'] for url in (URL, URL + '&status=won', URL + '&fields=id')}
+
+    assert len(etags) == 3
+
+def test_repeated_listing_is_served_from_the_response_cache(client, add_entries):
+    add_entries([{}, {}, {}])
+    first = client.get(URL)
+    hits = crm_app.response_cache.stats()['hits']
+
+    second = client.get(URL)
+
+    assert second.data == first.data
+    assert crm_app.response_cache.stats()['hits'] == hits + 1
+
+def test_a_write_by_another_process_changes_the_etag(client, app, add_entries):
+    add_entries([{}])
+    etag = client.get(URL).headers['ETag']
+
+    # Plain SQL on a separate connection: no crm_entries_changed() in this process
+    with app.app_context():
+        database = crm_app.db.engine.url.database
+    connection = sqlite3.connect(database)
+    with connection:
+        connection.execute("INSERT INTO crm_entry (person_name, company_name, sale_person, status, submission_time) "
+                           "VALUES ('Ada', 'Engines', 'rep', 'open', '2024-02-01 00:00:00')")
+    connection.close()
+    response = client.get(URL, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()['entries']) == 2
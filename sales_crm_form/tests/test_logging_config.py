@@ -0,0 +1,107 @@
+"""Credential masking, per-route levels and per-route sampling of the JSON log."""
+import json
+import logging
+import pytest
+import app as crm_app
+import logging_config
+from conftest import create_user
+
+PASSWORD = 'hunter2-not-logged'
+
+class JsonLines(logging.Handler):
+    """The request thread's filter and the listener's JSON formatting, without the queue."""
+
+    def __init__(self, request_filter):
+        super().__init__(logging.DEBUG)
+        self.addFilter(request_filter)
+        self.queue_handler = logging_config.RequestQueueHandler(None)
+        self.formatter = logging_config.JsonFormatter()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.formatter.format(self.queue_handler.prepare(record)))
+
+@pytest.fixture
+def json_lines():
+    handler = JsonLines(logging_config.RequestFilter(logging.DEBUG))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    yield handler.lines
+    root.removeHandler(handler)
+
+def test_login_payload_password_is_masked(app, json_lines):
+    create_user(app, 'ann', password=PASSWORD)
+
+    response = app.test_client().post('/login', json={'username': 'ann', 'password': PASSWORD})
+
+    assert response.status_code == 200
+    entries = [json.loads(line) for line in json_lines]
+    login_entries = [entry for entry in entries if entry.get('endpoint') == 'login']
+    assert any("'password': '***'" in entry['message'] for entry in login_entries)
+    assert PASSWORD not in '\n'.join(json_lines)
+    assert response.get_json()['token'] not in '\n'.join(json_lines)
+
+@pytest.mark.parametrize('message', [
+    "Data: {'username': 'ann', 'password': '%s'}",
+    'Data: {"username": "ann", "password": "%s"}',
+    'body username=ann&password=%s&remember=1',
+    'Authorization: Bearer %s',
+])
+def test_credentials_in_messages_are_masked(app, json_lines, message):
+    with app.test_request_context('/login', method='POST'):
+        logging.getLogger('app').warning(message, PASSWORD)
+
+    entry = json.loads(json_lines[-1])
+    assert PASSWORD not in json_lines[-1]
+    assert logging_config.REDACTED in entry['message']
+    assert (entry['endpoint'], entry['method'], entry['path']) == ('login', 'POST', '/login')
+
+def test_sensitive_mapping_keys_are_masked():
+    redacted = logging_config.redact_credentials({'username': 'ann', 'password': PASSWORD, 'authToken': 't'})
+
+    assert redacted == {'username': 'ann', 'password': '***', 'authToken': '***'}
+
+def record(level):
+    return logging.LogRecord('app', level, __file__, 1, 'message', None, None)
+
+def kept(request_filter, path, method='GET', levels=(logging.DEBUG, logging.INFO, logging.WARNING)):
+    """The levels of records that request_filter keeps in one request to path."""
+    with crm_app.app.test_request_context(path, method=method):
+        return [level for level in levels if request_filter.filter(record(level))]
+
+def test_route_levels_override_the_default():
+    request_filter = logging_config.RequestFilter(logging.INFO, route_levels={
+        'submit_crm': logging.DEBUG, 'login': logging.WARNING})
+
+    assert kept(request_filter, '/submit_crm', 'POST') == [logging.DEBUG, logging.INFO, logging.WARNING]
+    assert kept(request_filter, '/login', 'POST') == [logging.WARNING]
+    assert kept(request_filter, '/get_crm_entries') == [logging.INFO, logging.WARNING]
+
+def test_records_outside_requests_use_the_default_level():
+    request_filter = logging_config.RequestFilter(logging.WARNING, route_levels={'login': logging.DEBUG})
+
+    assert not request_filter.filter(record(logging.INFO))
+    assert request_filter.filter(record(logging.ERROR))
+
+@pytest.mark.parametrize('draw, expected', [
+    (0.05, [logging.INFO, logging.INFO, logging.WARNING]),
+    (0.5, [logging.WARNING]),
+])
+def test_sampling_keeps_or_drops_a_whole_request(monkeypatch, draw, expected):
+    draws = []
+    monkeypatch.setattr(logging_config.random, 'random', lambda: draws.append(draw) or draw)
+    request_filter = logging_config.RequestFilter(logging.INFO, sample_rates={'get_crm_entries': 0.1})
+
+    # Warnings and errors are kept whether or not the request was sampled
+    assert kept(request_filter, '/get_crm_entries', levels=(logging.INFO, logging.INFO, logging.WARNING)) == expected
+    assert len(draws) == 1
+    # Routes without a sample rate are not sampled
+    assert kept(request_filter, '/submit_crm', 'POST', levels=(logging.INFO,)) == [logging.INFO]
+    assert len(draws) == 1
+
+def test_settings_are_parsed_from_the_environment():
+    assert logging_config.parse_mapping('submit_crm=DEBUG, login=warning', logging_config.parse_level) == {
+        'submit_crm': logging.DEBUG, 'login': logging.WARNING}
+    assert logging_config.parse_mapping('get_crm_entries=0.1,broken', float) == {'get_crm_entries': 0.1}
+    with pytest.raises(ValueError):
+        logging_config.parse_level('LOUD')
@@ -0,0 +1,90 @@
+"""Admission control of the bcrypt pool: overloaded callers get their 503 without waiting out the queue."""
+import threading
+import time
+import pytest
+import app as crm_app
+from password_hashing import PasswordHasher, PasswordHashingOverloaded
+
+HASH_SECONDS = 0.5
+QUEUE_TIMEOUT = 0.1
+
+class SlowBcrypt:
+    """Stands in for Flask-Bcrypt with a fixed hashing time."""
+    _log_rounds = 4
+    _handle_long_passwords = False
+
+    def __init__(self):
+        self.hashed = []
+
+    def generate_password_hash(self, password):
+        time.sleep(HASH_SECONDS)
+        self.hashed.append(password)
+        return b'$2b$04$' + password.encode('utf-8')
+
+    def check_password_hash(self, pw_hash, password):
+        return pw_hash == self.generate_password_hash(password).decode('utf-8')
+
+@pytest.fixture
+def bcrypt():
+    return SlowBcrypt()
+
+def saturate(hasher, count):
+    """Start count hashes on background threads and wait until the pool is busy."""
+    threads = [threading.Thread(target=hasher.hash, args=(f'busy-{number}',), daemon=True) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    return threads
+
+def test_queued_caller_is_rejected_after_the_queue_timeout(bcrypt):
+    hasher = PasswordHasher(bcrypt, max_concurrency=1, max_queue=4, queue_timeout=QUEUE_TIMEOUT)
+    busy = saturate(hasher, 1)
+
+    started = time.monotonic()
+    with pytest.raises(PasswordHashingOverloaded):
+        hasher.hash('late')
+    elapsed = time.monotonic() - started
+
+    # Rejected once the queue timeout is up, not after the running hash has finished
+    assert QUEUE_TIMEOUT <= elapsed < QUEUE_TIMEOUT + (HASH_SECONDS - QUEUE_TIMEOUT) / 2
+    for thread in busy:
+        thread.join()
+    # The cancelled task never hashed
+    assert bcrypt.hashed == ['busy-0']
+
+def test_full_queue_is_rejected_at_once(bcrypt):
+    hasher = PasswordHasher(bcrypt, max_concurrency=1, max_queue=1, queue_timeout=5)
+    busy = saturate(hasher, 2)
+
+    started = time.monotonic()
+    with pytest.raises(PasswordHashingOverloaded):
+        hasher.hash('late')
+
+    assert time.monotonic() - started < 0.05
+    for thread in busy:
+        thread.join()
+
+def test_started_hash_is_not_cut_short(bcrypt):
+    hasher = PasswordHasher(bcrypt, max_concurrency=1, max_queue=1, queue_timeout=QUEUE_TIMEOUT)
+
+    assert hasher.hash('slow') == '$2b$04$slow'
+    assert hasher.verify('$2b$04$slow', 'slow') is True
+
+def test_overloaded_login_answers_503_within_the_bound(app, bcrypt, monkeypatch):
+    hasher = PasswordHasher(bcrypt, max_concurrency=1, max_queue=4, queue_timeout=QUEUE_TIMEOUT)
+    monkeypatch.setattr(crm_app, 'password_hasher', hasher)
+    with app.app_context():
+        user = crm_app.User(username='ann', email='ann@example.com', password='$2b$04$secret')
+        crm_app.db.session.add(user)
+        crm_app.db.session.commit()
+    busy = saturate(hasher, 1)
+
+    started = time.monotonic()
+    response = app.test_client().post('/login', json={'username': 'ann', 'password': 'secret'})
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert elapsed < QUEUE_TIMEOUT + (HASH_SECONDS - QUEUE_TIMEOUT) / 2
+    for thread in busy:
+        thread.join()
@@ -0,0 +1,146 @@
+"""Which requests RequestProfiler profiles, and what SlowQueryLog logs."""
+import logging
+import pytest
+from flask import Flask, Response
+from sqlalchemy import create_engine, text
+import profiling
+
+TOKEN = 'profile-me'
+SECRET = 'hunter2-card-4111'
+
+def profiled_app(tmp_path, **options):
+    app = Flask(__name__)
+
+    @app.route('/listed')
+    def listed():
+        return 'listed'
+
+    @app.route('/other')
+    def other():
+        return 'other'
+
+    @app.route('/streamed')
+    def streamed():
+        return Response(iter([b'a', b'b']))
+
+    profiler = profiling.RequestProfiler(str(tmp_path / 'profiles'), **options)
+    profiler.init_app(app)
+    return app
+
+def profiles(tmp_path):
+    directory = tmp_path / 'profiles'
+    return sorted(path.name for path in directory.iterdir()) if directory.exists() else []
+
+def get(app, url, **headers):
+    with app.test_client() as client:
+        response = client.get(url, headers=headers)
+        response.close()
+    return response
+
+def test_only_listed_endpoints_are_profiled(tmp_path):
+    app = profiled_app(tmp_path, endpoints={'listed', 'streamed'})
+
+    get(app, '/other')
+    assert profiles(tmp_path) == []
+
+    get(app, '/listed')
+    get(app, '/streamed')
+    names = profiles(tmp_path)
+    assert len(names) == 2
+    assert all(name.endswith('.prof') for name in names)
+    assert [name for name in names if '-listed-' in name] and [name for name in names if '-streamed-' in name]
+
+def test_star_profiles_every_endpoint(tmp_path):
+    app = profiled_app(tmp_path, endpoints={'*'})
+
+    get(app, '/other')
+
+    assert len(profiles(tmp_path)) == 1
+
+@pytest.mark.parametrize('draw, profiled', [(0.24, True), (0.25, False), (0.9, False)])
+def test_sample_rate_picks_a_fraction_of_requests(tmp_path, monkeypatch, draw, profiled):
+    monkeypatch.setattr(profiling.random, 'random', lambda: draw)
+    app = profiled_app(tmp_path, endpoints={'listed'}, sample_rate=0.25)
+
+    get(app, '/listed')
+
+    assert len(profiles(tmp_path)) == (1 if profiled else 0)
+
+def test_sample_rate_zero_profiles_nothing(tmp_path):
+    app = profiled_app(tmp_path, endpoints={'listed'}, sample_rate=0)
+
+    for _ in range(20):
+        get(app, '/listed')
+
+    assert profiles(tmp_path) == []
+
+def test_token_profiles_any_single_request(tmp_path):
+    app = profiled_app(tmp_path, endpoints={'listed'}, sample_rate=0, token=TOKEN)
+
+    response = get(app, '/other', **{'X-Profile-Token': TOKEN})
+
+    assert profiles(tmp_path) == [response.headers['X-Profile-File']]
+
+@pytest.mark.parametrize('header_token', ['wrong', TOKEN + 'x', ''])
+def test_wrong_token_profiles_nothing(tmp_path, header_token):
+    app = profiled_app(tmp_path, token=TOKEN)
+
+    response = get(app, '/other', **{'X-Profile-Token': header_token})
+
+    assert 'X-Profile-File' not in response.headers
+    assert profiles(tmp_path) == []
+
+def test_unconfigured_profiler_installs_no_hooks(tmp_path):
+    app = profiled_app(tmp_path)
+
+    get(app, '/listed')
+
+    assert not app.before_request_funcs and not app.after_request_funcs
+    assert profiles(tmp_path) == []
+
+def test_sampler_writes_collapsed_stacks(tmp_path):
+    app = profiled_app(tmp_path, token=TOKEN, mode='sample', interval=0.001)
+
+    response = get(app, '/listed', **{'X-Profile-Token': TOKEN})
+
+    assert response.headers['X-Profile-File'].endswith('.folded')
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        profiling.RequestProfiler(str(tmp_path), endpoints={'*'}, mode='perf')
+
+@pytest.fixture
+def slow_query_engine():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE secret (id INTEGER PRIMARY KEY, value TEXT)'))
+    # Every statement counts as slow
+    profiling.SlowQueryLog(0).instrument_engine(engine)
+    yield engine
+    engine.dispose()
+
+def logged(caplog):
+    """Everything the slow query records carry: message, arguments and extra fields."""
+    records = [record for record in caplog.records if record.name == 'slow_query']
+    assert records
+    return ' '.join(repr(vars(record)) + record.getMessage() for record in records)
+
+def test_slow_queries_are_logged_with_their_plan(slow_query_engine, caplog):
+    with caplog.at_level(logging.WARNING, logger='slow_query'):
+        with slow_query_engine.connect() as connection:
+            connection.execute(text('SELECT value FROM secret WHERE id = :id'), {'id': 1})
+
+    record = [record for record in caplog.records if record.name == 'slow_query'][-1]
+    assert 'SELECT value FROM secret WHERE id = ?' in record.getMessage()
+    assert record.query_plan and 'secret' in ' '.join(record.query_plan)
+
+def test_slow_query_parameters_are_never_logged(slow_query_engine, caplog):
+    with caplog.at_level(logging.WARNING, logger='slow_query'):
+        with slow_query_engine.begin() as connection:
+            connection.execute(text('INSERT INTO secret (value) VALUES (:value)'), {'value': SECRET})
+            connection.execute(text('INSERT INTO secret (value) VALUES (:value)'), [{'value': SECRET}, {'value': SECRET}])
+            connection.execute(text('SELECT id FROM secret WHERE value = :value'), {'value': SECRET})
+            connection.execute(text('UPDATE secret SET value = :new WHERE value = :value'),
+                               {'new': SECRET + '-new', 'value': SECRET})
+
+    assert SECRET not in logged(caplog)
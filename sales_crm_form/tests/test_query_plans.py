@@ -0,0 +1,39 @@
+"""Every /get_crm_entries filter combination must be answered from an index, without a sort."""
+import pytest
+import app as crm_app
+
+def listing_plans(app):
+    with app.app_context():
+        return dict(crm_app.listing_query_plans())
+
+def test_listing_queries_use_an_index_and_no_temp_sort(app):
+    plans = listing_plans(app)
+
+    assert len(plans) == 8
+    for label, plan in plans.items():
+        assert not [line for line in plan if line.startswith('SCAN') and 'INDEX' not in line], (label, plan)
+        assert not [line for line in plan if 'USE TEMP B-TREE' in line], (label, plan)
+
+@pytest.mark.parametrize('sale_person', [False, True])
+@pytest.mark.parametrize('status', [False, True])
+@pytest.mark.parametrize('after', [False, True])
+def test_filters_are_searched_in_the_index(app, sale_person, status, after):
+    # A scan of the submission_time index would also pass the test above, reading every entry
+    plan = ' '.join(listing_plans(app)[f'sale_person={sale_person} status={status} after={after}'])
+
+    assert ('sale_person=?' in plan) == sale_person, plan
+    assert ('status=?' in plan) == status, plan
+    assert ('submission_time<?' in plan) == after, plan
+
+@pytest.mark.parametrize('index_name', [
+    'ix_crm_entry_submission_time',
+    'ix_crm_entry_sale_person_submission_time',
+    'ix_crm_entry_status_submission_time',
+    'ix_crm_entry_sale_person_status_submission_time',
+])
+def test_migrations_create_the_listing_indexes(app, index_name):
+    with app.app_context():
+        with crm_app.db.engine.connect() as connection:
+            found = connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).scalar()
+    assert found == index_name
@@ -0,0 +1,93 @@
+"""Chunked retention and archival, and the background /clear_crm_entries."""
+from datetime import datetime
+from sqlalchemy import select
+import app as crm_app
+import retention
+
+def run_job(app, policy, batch_size):
+    with app.app_context():
+        job = retention.RetentionJob(crm_app.db.engine, crm_app.CRMEntry.__table__, policy,
+                                     batch_size=batch_size, pause=0)
+        return job.run()
+
+def archived_rows(app):
+    with app.app_context():
+        with crm_app.db.engine.connect() as connection:
+            data = connection.execute(select(retention.crm_entry_archive.c.data)).scalars().all()
+    return [retention.decode_archived_row(row) for row in data]
+
+def test_rows_are_removed_in_batches(app, client, add_entries):
+    add_entries([{} for _ in range(7)])
+
+    progress = run_job(app, retention.RetentionPolicy(None, None, False), batch_size=3)
+
+    assert progress['state'] == 'done'
+    assert (progress['matched'], progress['processed'], progress['batches']) == (7, 7, 3)
+    assert client.get('/get_crm_entries').get_json() == []
+    assert archived_rows(app) == []
+
+def test_policy_selects_by_age_and_status(app, client, add_entries):
+    entry_ids = add_entries([
+        {'submission_time': datetime(2020, 1, 1), 'status': 'lost'},
+        {'submission_time': datetime(2020, 1, 1), 'status': 'won'},
+        {'submission_time': datetime(2030, 1, 1), 'status': 'lost'},
+    ])
+
+    progress = run_job(app, retention.RetentionPolicy(datetime(2025, 1, 1), ('lost',), True), batch_size=10)
+
+    assert progress['processed'] == 1
+    remaining = {entry['id'] for entry in client.get('/get_crm_entries').get_json()}
+    assert remaining == set(entry_ids[1:])
+
+def test_archived_rows_keep_every_column(app, add_entries):
+    entry_ids = add_entries([{'person_name': 'Ada', 'description': 'Engines'}, {'description': ''}])
+
+    run_job(app, retention.RetentionPolicy(None, None, True), batch_size=1)
+
+    archived = sorted(archived_rows(app), key=lambda row: row['id'])
+    assert [row['id'] for row in archived] == entry_ids
+    assert (archived[0]['person_name'], archived[0]['description']) == ('Ada', 'Engines')
+    assert archived[0]['submission_time'] == '2024-01-01T00:00:00'
+
+def test_clear_runs_in_the_background(client, add_entries, wait_for_retention):
+    add_entries([{} for _ in range(5)])
+
+    response = client.delete('/clear_crm_entries?archive=1')
+
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['progress_url'] == '/crm_retention'
+    assert response.headers['Location'] == '/crm_retention'
+    assert body['job']['policy'] == {'older_than': None, 'statuses': None, 'archive': True}
+    wait_for_retention()
+    job = client.get(body['progress_url']).get_json()['job']
+    assert (job['state'], job['processed']) == ('done', 5)
+    assert client.get('/get_crm_entries').get_json() == []
+
+def test_second_job_is_refused_while_one_runs(client, app, add_entries, wait_for_retention, monkeypatch):
+    monkeypatch.setitem(app.config, 'CRM_RETENTION_BATCH_SIZE', 1)
+    monkeypatch.setitem(app.config, 'CRM_RETENTION_PAUSE', 0.2)
+    add_entries([{}, {}, {}])
+
+    assert client.delete('/clear_crm_entries').status_code == 202
+    response = client.post('/crm_retention', json={'statuses': ['open']})
+
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'Retention job already running'
+    assert client.delete('/clear_crm_entries').status_code == 409
+    assert wait_for_retention()['batches'] == 3
+
+def test_dry_run_only_counts(client, add_entries):
+    add_entries([{'status': 'lost'}, {'status': 'won'}])
+
+    response = client.post('/crm_retention', json={'statuses': ['lost'], 'dry_run': True})
+
+    assert response.status_code == 200
+    assert response.get_json()['matched'] == 1
+    assert len(client.get('/get_crm_entries').get_json()) == 2
+
+def test_policy_without_conditions_is_rejected(client):
+    response = client.post('/crm_retention', json={'archive': True})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid retention policy'
@@ -0,0 +1,122 @@
+"""The crm_entry_fts full-text index (migration 3) and /search_crm."""
+import pytest
+from sqlalchemy import create_engine, text
+import app as crm_app
+import migrations
+
+def fts_ids(app, query):
+    with app.app_context():
+        with crm_app.db.engine.connect() as connection:
+            return sorted(connection.execute(
+                text('SELECT rowid FROM crm_entry_fts WHERE crm_entry_fts MATCH :query'), {'query': query}).scalars())
+
+def execute(app, sql, **params):
+    with app.app_context():
+        with crm_app.db.engine.begin() as connection:
+            connection.execute(text(sql), params)
+
+def search(client, **params):
+    response = client.get('/search_crm', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return [result['id'] for result in response.get_json()['results']]
+
+def test_migration_indexes_entries_written_before_it(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'crm.db'}")
+    all_migrations = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, 'MIGRATIONS', all_migrations[:2])
+    assert migrations.upgrade(engine) == [1, 2]
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO crm_entry (person_name, company_name, sale_person, description) "
+            "VALUES ('Ada', 'Engines', 'rep', 'Quarterly renewal call')"))
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', all_migrations)
+    assert migrations.upgrade(engine)[0] == 3
+    with engine.connect() as connection:
+        found = connection.execute(text("SELECT rowid FROM crm_entry_fts WHERE crm_entry_fts MATCH 'renewal'")).all()
+    engine.dispose()
+
+    assert found == [(1,)]
+
+def test_triggers_follow_inserts_updates_and_deletes(app, add_entries):
+    entry_id, = add_entries([{'description': 'Demo scheduled', 'next_steps': 'Send pricing', 'case': 'Onboarding'}])
+    assert fts_ids(app, 'demo') == fts_ids(app, 'pricing') == fts_ids(app, 'onboarding') == [entry_id]
+
+    execute(app, "UPDATE crm_entry SET description = 'Contract signed' WHERE id = :id", id=entry_id)
+    assert fts_ids(app, 'demo') == []
+    assert fts_ids(app, 'contract') == [entry_id]
+    # Columns the update did not touch are still indexed
+    assert fts_ids(app, 'pricing') == [entry_id]
+
+    execute(app, 'DELETE FROM crm_entry WHERE id = :id', id=entry_id)
+    assert fts_ids(app, 'contract') == fts_ids(app, 'pricing') == []
+
+@pytest.mark.parametrize('search_text, expected', [
+    ('renewal', '"renewal"'),
+    ('renew* call', '"renew"* "call"'),
+    ('say "hi"', '"say" """hi"""'),
+    ('a OR b NOT c', '"a" "OR" "b" "NOT" "c"'),
+    ('description:x NEAR(y z)', '"description:x" "NEAR(y" "z)"'),
+    ('* ** ', ''),
+])
+def test_user_terms_are_quoted(search_text, expected):
+    assert crm_app.build_fts_query(search_text) == expected
+
+@pytest.mark.parametrize('search_text', ['"', 'OR', 'AND NOT', 'NEAR(', 'description:', '^start', '-minus', "o'neil", '(a'])
+def test_fts_syntax_in_the_query_is_taken_literally(client, add_entries, search_text):
+    add_entries([{'description': 'Renewal call'}])
+
+    response = client.get('/search_crm', query_string={'q': search_text})
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['results'] == []
+
+def test_operators_match_as_words_not_as_syntax(client, add_entries):
+    plain, with_word = add_entries([{'description': 'apples and pears'}, {'description': 'apples or pears'}])
+
+    # Unquoted, OR would match both entries
+    assert search(client, q='apples OR pears') == [with_word]
+    assert sorted(search(client, q='"apples"')) == [plain, with_word]
+
+def test_results_are_ranked_by_relevance(client, add_entries):
+    once, twice, never = add_entries([
+        {'description': 'Follow up on the renewal, then lunch with the team and a long walk'},
+        {'description': 'Renewal renewal'},
+        {'description': 'Unrelated'},
+    ])
+
+    response = client.get('/search_crm', query_string={'q': 'renewal'})
+    results = response.get_json()['results']
+
+    assert [result['id'] for result in results] == [twice, once]
+    assert results[0]['rank'] <= results[1]['rank']
+    assert '<mark>' in results[0]['snippet']
+
+def test_prefix_search(client, add_entries):
+    entry_id, _ = add_entries([{'description': 'Renewal call'}, {'description': 'Rent review'}])
+
+    assert search(client, q='renew*') == [entry_id]
+    assert search(client, q='renew') == [entry_id]  # The porter stemmer also matches the stem
+
+def test_filters_and_limit_are_applied(client, add_entries):
+    ann_open, ann_won, bob_open = add_entries([
+        {'description': 'Renewal', 'sale_person': 'ann', 'status': 'open'},
+        {'description': 'Renewal', 'sale_person': 'ann', 'status': 'won'},
+        {'description': 'Renewal', 'sale_person': 'bob', 'status': 'open'},
+    ])
+
+    assert sorted(search(client, q='renewal', sale_person='ann')) == [ann_open, ann_won]
+    assert search(client, q='renewal', status='won') == [ann_won]
+    assert search(client, q='renewal', sale_person='bob', status='won') == []
+    assert len(search(client, q='renewal', limit=2)) == 2
+
+@pytest.mark.parametrize('params, error', [
+    ({}, 'Missing search query'),
+    ({'q': ' * '}, 'Missing search query'),
+    ({'q': 'renewal', 'limit': 0}, 'Invalid limit'),
+])
+def test_invalid_searches_are_rejected(client, params, error):
+    response = client.get('/search_crm', query_string=params)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
@@ -0,0 +1,108 @@
+"""SECRET_KEY loading, key rotation with SECRET_KEY_FALLBACKS, and SHARED_DEPLOYMENT's key check."""
+import os
+import subprocess
+import sys
+import pytest
+import signing_keys
+from conftest import PASSWORD, create_user
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = '/get_crm_entries?limit=1'
+
+def test_key_comes_from_the_environment():
+    assert signing_keys.load_keys({'SECRET_KEY': 'current'}) == ('current', [], False)
+
+def test_key_file_is_read_and_stripped(tmp_path):
+    key_file = tmp_path / 'secret_key'
+    key_file.write_text('from-file\n')
+    fallbacks_file = tmp_path / 'fallbacks'
+    fallbacks_file.write_text('old-1\nold-2\n\n')
+
+    keys = signing_keys.load_keys({'SECRET_KEY_FILE': str(key_file), 'SECRET_KEY_FALLBACKS_FILE': str(fallbacks_file)})
+
+    assert keys == ('from-file', ['old-1', 'old-2'], False)
+
+def test_variable_takes_precedence_over_the_file(tmp_path):
+    key_file = tmp_path / 'secret_key'
+    key_file.write_text('from-file')
+
+    assert signing_keys.load_keys({'SECRET_KEY': 'from-env', 'SECRET_KEY_FILE': str(key_file)})[0] == 'from-env'
+
+def test_fallbacks_are_comma_separated():
+    assert signing_keys.load_keys({'SECRET_KEY': 'k', 'SECRET_KEY_FALLBACKS': 'old-1, old-2,'})[1] == ['old-1', 'old-2']
+
+@pytest.mark.parametrize('environ', [{}, {'SECRET_KEY': ''}])
+def test_missing_key_is_generated_per_process(environ):
+    secret_key, fallbacks, generated = signing_keys.load_keys(environ)
+
+    assert generated and len(secret_key) == 32 and fallbacks == []
+
+def test_empty_key_file_counts_as_missing(tmp_path):
+    key_file = tmp_path / 'secret_key'
+    key_file.write_text('\n')
+
+    assert signing_keys.load_keys({'SECRET_KEY_FILE': str(key_file)})[2] is True
+
+def rotate(app, monkeypatch, secret_key, fallbacks):
+    monkeypatch.setitem(app.config, 'SECRET_KEY', secret_key)
+    monkeypatch.setitem(app.config, 'SECRET_KEY_FALLBACKS', fallbacks)
+
+def login(app):
+    create_user(app, 'rep')
+    client = app.test_client()
+    response = client.post('/login', json={'username': 'rep', 'password': PASSWORD})
+    assert response.status_code == 200
+    return client, response.get_json()['token']
+
+def test_session_signed_with_a_fallback_key_is_accepted(app, monkeypatch):
+    rotate(app, monkeypatch, 'old-key', [])
+    client, _ = login(app)
+
+    rotate(app, monkeypatch, 'new-key', ['old-key'])
+    assert client.get(URL).status_code == 200
+
+    # Once the fallback is dropped the old session is invalid
+    rotate(app, monkeypatch, 'new-key', [])
+    assert client.get(URL).status_code == 401
+
+def test_token_signed_with_a_fallback_key_is_accepted(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_STATELESS_TOKENS', True)
+    rotate(app, monkeypatch, 'old-key', [])
+    _, token = login(app)
+    headers = {'Authorization': f'Bearer {token}'}
+
+    rotate(app, monkeypatch, 'new-key', ['old-key'])
+    assert app.test_client().get(URL, headers=headers).status_code == 200
+
+    rotate(app, monkeypatch, 'new-key', [])
+    assert app.test_client().get(URL, headers=headers).status_code == 401
+
+def test_new_sessions_are_signed_with_the_current_key(app, monkeypatch):
+    rotate(app, monkeypatch, 'new-key', ['old-key'])
+    client, _ = login(app)
+
+    # Still valid after the old key is dropped
+    rotate(app, monkeypatch, 'new-key', [])
+    assert client.get(URL).status_code == 200
+
+def start_app(tmp_path, **environ):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'crm.db'}", LOG_FILE=str(tmp_path / 'app.log'))
+    env.pop('SECRET_KEY', None)
+    env.pop('SECRET_KEY_FILE', None)
+    env.update(environ)
+    return subprocess.run([sys.executable, '-c', 'import app\napp.create_app()\n'], cwd=APP_DIR, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+def test_shared_deployment_refuses_to_start_without_a_key(tmp_path):
+    result = start_app(tmp_path, SHARED_DEPLOYMENT='1')
+
+    assert result.returncode != 0
+    assert 'SHARED_DEPLOYMENT=1 needs SECRET_KEY' in result.stderr
+
+def test_shared_deployment_starts_with_a_key_file(tmp_path):
+    key_file = tmp_path / 'secret_key'
+    key_file.write_text('shared')
+
+    result = start_app(tmp_path, SHARED_DEPLOYMENT='1', SECRET_KEY_FILE=str(key_file))
+
+    assert result.returncode == 0, result.stderr
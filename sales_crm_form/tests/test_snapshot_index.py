@@ -0,0 +1,91 @@
+"""Listings answered from the in-memory snapshot index must match those read from SQLite."""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+import app as crm_app
+import snapshot_index
+
+QUERIES = [
+    '',
+    '&status=won',
+    '&sale_person=rep',
+    '&sale_person=other&status=open',
+    '&status=missing',
+    '&fields=id,status,company_name',
+    '&sale_person=rep&fields=id,person_name',
+]
+
+@pytest.fixture
+def entries(add_entries):
+    start = datetime(2024, 3, 1)
+    return add_entries([{
+        'status': ('open', 'won', 'lost')[number % 3],
+        'sale_person': ('rep', 'other')[number % 2],
+        # Every fourth entry shares its time with the previous one, to test the id tie-break
+        'submission_time': start + timedelta(hours=number - number % 4 // 3),
+    } for number in range(40)])
+
+@pytest.fixture
+def index(app, monkeypatch):
+    """A built snapshot index, used by the listings for the rest of the test."""
+    with app.app_context():
+        snapshot = snapshot_index.SnapshotIndex(crm_app.db.engine, crm_app.CRMEntry.__table__)
+        snapshot.build()
+    monkeypatch.setattr(crm_app, 'crm_index', snapshot)
+    return snapshot
+
+def read_pages(client, query, limit=7):
+    """Every page of a counted listing, bypassing the response cache."""
+    pages, after = [], None
+    while True:
+        crm_app.response_cache.clear()
+        url = f'/get_crm_entries?limit={limit}&count=1{query}' + (f'&after={after}' if after else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        pages.append(response.get_json())
+        after = pages[-1]['next_cursor']
+        if after is None:
+            return pages
+
+def read_listings(client):
+    return {query: read_pages(client, query) for query in QUERIES}
+
+def test_pages_and_counts_match_sqlite(client, app, entries, monkeypatch):
+    from_sqlite = read_listings(client)
+    with app.app_context():
+        snapshot = snapshot_index.SnapshotIndex(crm_app.db.engine, crm_app.CRMEntry.__table__)
+        snapshot.build()
+    monkeypatch.setattr(crm_app, 'crm_index', snapshot)
+
+    assert read_listings(client) == from_sqlite
+    assert from_sqlite['&status=won'][0]['total'] == 13
+    assert snapshot.stats()['entries'] == 40
+
+def test_index_follows_writes_from_every_path(client, app, entries, index, monkeypatch):
+    client.post('/submit_crm', json={'name': 'Ada', 'company': 'Engines', 'status': 'won'})
+    with app.app_context():
+        with crm_app.db.engine.begin() as connection:
+            connection.execute(text("UPDATE crm_entry SET status = 'won' WHERE id = :id"), {'id': entries[0]})
+            connection.execute(text('DELETE FROM crm_entry WHERE id = :id'), {'id': entries[5]})
+            # Sorts before the newest entry, so it goes to the index's overlay
+            connection.execute(text(
+                "INSERT INTO crm_entry (person_name, company_name, sale_person, status, submission_time) "
+                "VALUES ('Grace', 'Compilers', 'rep', 'won', '2024-03-01 10:30:00')"))
+
+    from_index = read_listings(client)
+    assert index.stats()['pending_rows'] == 2
+    monkeypatch.setattr(crm_app, 'crm_index', None)
+
+    assert from_index == read_listings(client)
+    assert from_index['&status=won'][0]['total'] == 16
+
+def test_index_that_is_not_ready_falls_back_to_sqlite(client, app, entries, monkeypatch):
+    from_sqlite = read_pages(client, '&status=won')
+    with app.app_context():
+        snapshot = snapshot_index.SnapshotIndex(crm_app.db.engine, crm_app.CRMEntry.__table__)
+    monkeypatch.setattr(crm_app, 'crm_index', snapshot)
+    # The first read starts a background build and is answered by SQLite
+    monkeypatch.setattr(snapshot, 'start_build', lambda: None)
+
+    assert read_pages(client, '&status=won') == from_sqlite
+    assert snapshot.stats() == {'ready': False, 'building': False}
@@ -0,0 +1,73 @@
+"""The precompressed in-memory frontend store and its hashed URLs."""
+import gzip
+import os
+import threading
+import pytest
+import app as crm_app
+import static_assets
+
+def fetch(client, url, **kwargs):
+    """GET url on another thread, failing instead of hanging if the request never returns."""
+    responses = []
+    thread = threading.Thread(target=lambda: responses.append(client.get(url, **kwargs)), daemon=True)
+    thread.start()
+    thread.join(10)
+    assert responses, f'GET {url} did not return'
+    return responses[0]
+
+@pytest.fixture
+def assets(monkeypatch):
+    """A fresh store, built by the first request of the test."""
+    store = static_assets.AssetStore(crm_app.basedir, crm_app.FRONTEND_ASSETS, pages=crm_app.FRONTEND_PAGES)
+    monkeypatch.setattr(crm_app, 'frontend_assets', store)
+    return store
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_first_asset_request_builds_the_store(app, assets, monkeypatch, debug):
+    monkeypatch.setattr(app, 'debug', debug)
+
+    response = fetch(app.test_client(), '/styles.css')
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == static_assets.REVALIDATE
+    with open(f'{crm_app.basedir}/styles.css', 'rb') as styles:
+        assert response.data == styles.read()
+
+def test_pages_reference_hashed_urls(app, assets):
+    client = app.test_client()
+    page = fetch(client, '/index.html').get_data(as_text=True)
+    with app.test_request_context():
+        url = assets.url('styles.css')
+
+    assert f'href="{url}"' in page
+    response = fetch(client, url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Cache-Control'] == static_assets.IMMUTABLE
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == fetch(client, '/styles.css').data
+    assert fetch(client, '/assets/styles.0000000000000000.css').status_code == 404
+
+def test_matching_etag_is_not_modified(app, assets):
+    client = app.test_client()
+    etag = fetch(client, '/script.js', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+    response = fetch(client, '/script.js', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+def test_changed_files_are_reloaded_in_debug_mode(app, tmp_path, monkeypatch):
+    (tmp_path / 'site.css').write_text('body { color: red; }')
+    (tmp_path / 'page.html').write_text('<link href="site.css">')
+    store = static_assets.AssetStore(str(tmp_path), ['site.css'], pages=['page.html'])
+    monkeypatch.setattr(app, 'debug', True)
+
+    with app.test_request_context():
+        first = store.get('page.html')
+        (tmp_path / 'site.css').write_text('body { color: blue; }')
+        # Force a different mtime on file systems with coarse timestamps
+        stat = (tmp_path / 'site.css').stat()
+        os.utime(tmp_path / 'site.css', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        second = store.get('page.html')
+
+        assert first.hashed_name != second.hashed_name
+        assert store.get_hashed(second.hashed_name) is second
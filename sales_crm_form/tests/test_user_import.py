@@ -0,0 +1,131 @@
+"""Bulk user import: per-row reports, dry runs, the admin endpoint and the import-users command."""
+import json
+import time
+from sqlalchemy import event
+import app as crm_app
+import user_import
+from conftest import create_user
+
+PASSWORD = 'import-password'
+
+def user_row(username, email=None, password=PASSWORD):
+    return {'username': username, 'email': email or f'{username}@example.com', 'password': password}
+
+def wait_for_import(timeout=10):
+    deadline = time.monotonic() + timeout
+    while crm_app.user_import_runner.status()['state'] not in ('done', 'failed'):
+        assert time.monotonic() < deadline, crm_app.user_import_runner.status()
+        time.sleep(0.01)
+    return crm_app.user_import_runner.status()
+
+def run_import(app, rows, dry_run=False):
+    with app.app_context():
+        return crm_app.user_import_job(rows, dry_run=dry_run).run()
+
+def test_every_row_gets_a_result(app, client):
+    rows = [
+        user_row('ann'),
+        user_row('rep', email='new@example.com'),           # username of the logged-in client
+        user_row('bob', email='ann@example.com'),           # email repeats row 0
+        user_row('ann', email='other@example.com'),         # username repeats row 0
+        user_row('cy', email='not-an-email'),
+        user_row('', email='blank@example.com'),
+        user_row('dee', password=''),
+        'not an object',
+        user_row('eve', email='rep@example.com'),           # email of an existing user
+    ]
+
+    progress = run_import(app, rows)
+
+    assert (progress['state'], progress['created'], progress['failed'], progress['valid']) == ('done', 1, 8, 1)
+    results = progress['results']
+    assert [result['index'] for result in results] == list(range(len(rows)))
+    assert results[0]['username'] == 'ann' and isinstance(results[0]['user_id'], int)
+    assert [result.get('error') for result in results[1:]] == [
+        'Username already exists', 'Duplicate in batch', 'Duplicate in batch', 'Invalid email',
+        'Invalid username', 'Invalid password', 'Invalid row', 'Email already exists']
+    assert PASSWORD not in json.dumps(results)
+
+def test_imported_users_can_log_in(app):
+    run_import(app, [user_row('ann', password='correct horse')])
+
+    response = app.test_client().post('/login', json={'username': 'ann', 'password': 'correct horse'})
+
+    assert response.status_code == 200
+
+def test_existing_users_are_looked_up_in_chunks(app, monkeypatch):
+    monkeypatch.setattr(user_import, 'LOOKUP_CHUNK_SIZE', 2)
+    create_user(app, 'taken')
+    rows = [user_row(f'new{number}') for number in range(4)] + [user_row('taken', email='other@example.com'),
+                                                               user_row('eve', email='taken@example.com')]
+    lookups = []
+
+    def record_lookup(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM user' in statement.replace('"', ''):
+            lookups.append(len(parameters))
+
+    with app.app_context():
+        engine = crm_app.db.engine
+    event.listen(engine, 'before_cursor_execute', record_lookup)
+    try:
+        progress = run_import(app, rows, dry_run=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record_lookup)
+
+    # Two bound parameters per row, the taken rows found in the last chunk
+    assert lookups == [4, 4, 4]
+    assert [result.get('error') for result in progress['results'][4:]] == [
+        'Username already exists', 'Email already exists']
+    assert progress['valid'] == 4
+
+def test_dry_run_creates_nobody(app):
+    progress = run_import(app, [user_row('ann'), user_row('bob'), user_row('bob')], dry_run=True)
+
+    assert (progress['valid'], progress['created'], progress['failed']) == (2, 0, 1)
+    assert progress['results'][:2] == [{'index': 0, 'username': 'ann'}, {'index': 1, 'username': 'bob'}]
+    with app.app_context():
+        assert crm_app.User.query.filter_by(username='ann').first() is None
+
+def test_endpoint_imports_csv_in_the_background(admin_client):
+    csv_text = '﻿Username,Email,Password\nann,ann@example.com,secret-1\nbob,bad,secret-2\n'
+
+    response = admin_client.post('/admin/users/import', data=csv_text.encode('utf-8'), content_type='text/csv')
+
+    assert response.status_code == 202
+    assert response.get_json()['job']['rows'] == 2
+    wait_for_import()
+    job = admin_client.get('/admin/users/import').get_json()['job']
+    assert (job['created'], job['failed']) == (1, 1)
+    assert job['results'][1]['error'] == 'Invalid email'
+
+def test_endpoint_dry_run_reports_at_once(admin_client):
+    response = admin_client.post('/admin/users/import?dry_run=1', json={'users': [user_row('ann'), user_row('admin')]})
+
+    assert response.status_code == 200
+    job = response.get_json()['job']
+    assert (job['state'], job['valid']) == ('done', 1)
+    assert job['results'][1]['error'] == 'Username already exists'
+
+def test_endpoint_rejects_invalid_payloads(admin_client):
+    missing_column = admin_client.post('/admin/users/import', data=b'username,email\nann,ann@example.com\n',
+                                       content_type='text/csv')
+    empty = admin_client.post('/admin/users/import', json=[])
+
+    assert missing_column.status_code == empty.status_code == 400
+    assert 'missing password' in missing_column.get_json()['details']
+    assert empty.get_json()['details'] == 'No users to import'
+
+def test_endpoint_is_for_admins_only(client):
+    response = client.post('/admin/users/import', json=[user_row('ann')])
+
+    assert response.status_code == 403
+
+def test_import_users_command(app, tmp_path):
+    path = tmp_path / 'users.json'
+    path.write_text(json.dumps([user_row('ann'), user_row('bob', email='bad')]))
+
+    result = app.test_cli_runner().invoke(args=['import-users', str(path)])
+
+    assert result.exit_code == 0, result.output
+    assert 'row 1 (bob): Invalid email' in result.output
+    assert '1 of 2 users created' in result.output
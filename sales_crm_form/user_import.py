@@ -0,0 +1,237 @@
+"""Bulk user import for the import-users command and POST /admin/users/import.
+
+A batch of username/email/password rows (CSV with a header line, or a JSON
+array) is checked as a whole before any password is hashed: every row is
+validated, usernames and emails repeated within the batch are rejected after
+their first row, and those that already belong to a user are looked up in
+chunks of LOOKUP_CHUNK_SIZE rows.
+The passwords of the remaining rows are hashed in parallel
+(PasswordHasher.hash_many) and the users inserted with one multi-row
+statement in one transaction.
+
+Every input row gets a result, its user_id or an error with details.
+Passwords never appear in results or logs.
+"""
+import csv
+import io
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+USER_FIELDS = ('username', 'email', 'password')
+
+# Column sizes of the user table
+MAX_USERNAME_LENGTH = 80
+MAX_EMAIL_LENGTH = 120
+
+# Rows looked up per query; each binds two parameters, keeping a query under SQLite's 999 variable limit
+LOOKUP_CHUNK_SIZE = 400
+
+# Job states in which another import may not start
+ACTIVE_STATES = ('pending', 'checking', 'hashing', 'inserting')
+
+def read_users_csv(text):
+    """Rows of CSV text whose header names username, email and password; raises ValueError."""
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [field for field in USER_FIELDS if field not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"The CSV header must name {', '.join(USER_FIELDS)}; missing {', '.join(missing)}")
+    return [{field: row[field] for field in USER_FIELDS} for row in reader]
+
+def read_users_json(data):
+    """Rows of a parsed JSON array of user objects, or of {"users": [...]}; raises ValueError."""
+    if isinstance(data, dict):
+        data = data.get('users')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of objects with username, email and password')
+    return data
+
+def clean_row(data, password_hasher, is_valid_email):
+    """Return (row, None) for a valid input row, or (None, (error, details))."""
+    if not isinstance(data, dict):
+        return None, ('Invalid row', 'Each user must be an object with username, email and password')
+
+    username = data.get('username')
+    email = data.get('email')
+    password = data.get('password')
+    username = username.strip() if isinstance(username, str) else ''
+    email = email.strip() if isinstance(email, str) else ''
+    if not username or len(username) > MAX_USERNAME_LENGTH:
+        return None, ('Invalid username', f'username must be 1 to {MAX_USERNAME_LENGTH} characters')
+    if len(email) > MAX_EMAIL_LENGTH or not is_valid_email(email):
+        return None, ('Invalid email', f'email must be a valid address of at most {MAX_EMAIL_LENGTH} characters')
+    password_error = password_hasher.password_error(password)
+    if password_error:
+        return None, ('Invalid password', password_error)
+    return {'username': username, 'email': email, 'password': password}, None
+
+def find_existing(connection, table, rows, chunk_size=None):
+    """The usernames and emails of rows that already belong to a user, one query per chunk_size rows."""
+    chunk_size = chunk_size or LOOKUP_CHUNK_SIZE
+    usernames, emails = set(), set()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        existing = connection.execute(
+            select(table.c.username, table.c.email).where(or_(
+                table.c.username.in_([row['username'] for row in chunk]),
+                table.c.email.in_([row['email'] for row in chunk])
+            ))
+        ).all()
+        usernames.update(username for username, _ in existing)
+        emails.update(email for _, email in existing)
+    return usernames, emails
+
+class UserImportJob:
+    """Check, hash and insert a batch of users, with progress and a result per input row.
+
+    on_created is called with the new user ids once they are committed.
+    With dry_run the rows are only checked.
+    """
+
+    def __init__(self, engine, table, rows, password_hasher, is_valid_email, hash_workers=None,
+                 dry_run=False, on_created=None):
+        self.engine = engine
+        self.table = table
+        self.rows = rows
+        self.password_hasher = password_hasher
+        self.is_valid_email = is_valid_email
+        self.hash_workers = hash_workers
+        self.dry_run = dry_run
+        self.on_created = on_created
+        self.results = [None] * len(rows)
+        self.progress = {
+            'state': 'pending',
+            'dry_run': dry_run,
+            'rows': len(rows),
+            'valid': None,
+            'created': 0,
+            'failed': 0,
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+            # Filled in when the job has finished
+            'results': None,
+        }
+
+    def reject(self, index, error, details):
+        data = self.rows[index]
+        username = data.get('username') if isinstance(data, dict) else None
+        self.results[index] = {
+            'index': index,
+            'username': username if isinstance(username, str) else None,
+            'error': error,
+            'details': details,
+        }
+
+    def reject_existing(self, users, usernames, emails):
+        """Reject the (index, row) users whose username or email is taken; returns the others."""
+        remaining = []
+        for index, row in users:
+            if row['username'] in usernames:
+                self.reject(index, 'Username already exists', f"A user named {row['username']} already exists")
+            elif row['email'] in emails:
+                self.reject(index, 'Email already exists', f"{row['email']} already belongs to a user")
+            else:
+                remaining.append((index, row))
+        return remaining
+
+    def check(self):
+        """Validate every row and check uniqueness; returns the accepted (index, row) pairs."""
+        accepted = []
+        first_rows = {}
+        for index, data in enumerate(self.rows):
+            row, error = clean_row(data, self.password_hasher, self.is_valid_email)
+            if error is not None:
+                self.reject(index, *error)
+                continue
+            # Within the batch the first row with a username or email wins
+            keys = (('username', row['username']), ('email', row['email']))
+            duplicate = next((first_rows[key] for key in keys if key in first_rows), None)
+            if duplicate is not None:
+                self.reject(index, 'Duplicate in batch', f"Same username or email as row {duplicate}")
+                continue
+            for key in keys:
+                first_rows[key] = index
+            accepted.append((index, row))
+
+        with self.engine.connect() as connection:
+            usernames, emails = find_existing(connection, self.table, [row for _, row in accepted])
+        return self.reject_existing(accepted, usernames, emails)
+
+    def insert(self, users):
+        """Insert the (index, row) users in one statement and transaction; returns their new ids."""
+        table = self.table
+        statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        try:
+            with self.engine.begin() as connection:
+                user_ids = connection.execute(statement, [row for _, row in users]).scalars().all()
+        except IntegrityError:
+            # Someone registered one of the names since the check; drop those rows and try once more
+            with self.engine.connect() as connection:
+                usernames, emails = find_existing(connection, table, [row for _, row in users])
+            users = self.reject_existing(users, usernames, emails)
+            if not users:
+                return []
+            with self.engine.begin() as connection:
+                user_ids = connection.execute(statement, [row for _, row in users]).scalars().all()
+
+        for (index, row), user_id in zip(users, user_ids):
+            self.results[index] = {'index': index, 'username': row['username'], 'user_id': user_id}
+        return user_ids
+
+    def run(self):
+        """Import the rows; returns the progress dict, with results."""
+        self.progress.update(state='checking', started_at=datetime.utcnow().isoformat())
+        try:
+            users = self.check()
+            self.progress['valid'] = len(users)
+            if self.dry_run:
+                for index, row in users:
+                    self.results[index] = {'index': index, 'username': row['username']}
+            elif users:
+                self.progress['state'] = 'hashing'
+                hashes = self.password_hasher.hash_many([row['password'] for _, row in users], self.hash_workers)
+                self.progress['state'] = 'inserting'
+                user_ids = self.insert([(index, dict(row, password=pw_hash))
+                                        for (index, row), pw_hash in zip(users, hashes)])
+                if user_ids and self.on_created is not None:
+                    self.on_created(user_ids)
+            self.progress['state'] = 'done'
+        except Exception as e:
+            logging.error(f"User import failed: {str(e)}", exc_info=True)
+            self.progress.update(state='failed', error=str(e))
+
+        for index, result in enumerate(self.results):
+            if result is None:
+                # Accepted, but the job failed before inserting it
+                self.reject(index, 'Not imported', self.progress['error'])
+        self.progress['created'] = sum('user_id' in result for result in self.results)
+        self.progress['failed'] = sum('error' in result for result in self.results)
+        self.progress['results'] = self.results
+        self.progress['finished_at'] = datetime.utcnow().isoformat()
+        logging.info(f"User import {self.progress['state']}: {self.progress['created']} created, "
+                     f"{self.progress['failed']} rejected of {len(self.rows)} rows")
+        return self.progress
+
+class UserImportRunner:
+    """Runs one user import at a time on a background thread."""
+
+    def __init__(self):
+        self.job = None
+        self._lock = threading.Lock()
+
+    def start(self, job):
+        """Start job unless another one is running; returns False if busy."""
+        with self._lock:
+            if self.job is not None and self.job.progress['state'] in ACTIVE_STATES:
+                return False
+            self.job = job
+        threading.Thread(target=job.run, name='user-import', daemon=True).start()
+        return True
+
+    def status(self):
+        return self.job.progress if self.job is not None else None